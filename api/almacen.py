@@ -0,0 +1,211 @@
+import os
+import re
+import json
+import shutil
+import hashlib
+import logging
+import tempfile
+import threading
+from datetime import datetime
+
+from flask import Request
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.utils import secure_filename
+from dotenv import load_dotenv
+
+from api.extraccion_pdf import PDF_MAX_BYTES
+from api.recuperacion import DOCUMENTS_DIR
+
+load_dotenv()
+
+# Tamaño máximo de un archivo en /api/upload (los PDF de /api/chat usan PDF_MAX_BYTES)
+SUBIDA_MAX_BYTES = int(os.getenv("SUBIDA_MAX_BYTES", str(25 * 1024 * 1024)))
+ALMACEN_INDICE_PATH = os.getenv(
+    "ALMACEN_INDICE_PATH",
+    os.path.join(os.path.dirname(__file__), "contextos", "almacen_documentos.json")
+)
+# Temporales dentro de documents/: al guardar, el archivo se mueve con os.replace sin copiarlo
+SUBIDAS_TEMPORALES = ".subidas"
+BLOQUE = 1024 * 1024
+
+
+def _megas(n):
+    return f"{n / (1024 * 1024):g} MB"
+
+
+class ArchivoDemasiadoGrande(RequestEntityTooLarge):
+    pass
+
+
+class FlujoConHash:
+    # Archivo temporal en el que Werkzeug escribe la subida por bloques: calcula el SHA-256 al vuelo
+    # y corta en cuanto se pasa del límite, sin esperar a que termine el cuerpo
+    def __init__(self, directorio, max_bytes, mensaje):
+        os.makedirs(directorio, exist_ok=True)
+        descriptor, self.ruta = tempfile.mkstemp(dir=directorio, suffix=".parcial")
+        self._archivo = os.fdopen(descriptor, "w+b")
+        self._hash = hashlib.sha256()
+        self.max_bytes = max_bytes
+        self.mensaje = mensaje
+        self.tamano = 0
+        self.movido = False
+
+    def write(self, datos):
+        self.tamano += len(datos)
+        if self.tamano > self.max_bytes:
+            # Werkzeug no llega a registrar el archivo en request.files: el temporal se borra aquí
+            self.close()
+            raise ArchivoDemasiadoGrande(self.mensaje)
+        self._hash.update(datos)
+        return self._archivo.write(datos)
+
+    @property
+    def sha256(self):
+        return self._hash.hexdigest()
+
+    def mover_a(self, destino):
+        self._archivo.flush()
+        os.replace(self.ruta, destino)
+        self.movido = True
+
+    def close(self):
+        self._archivo.close()
+        if not self.movido:
+            try:
+                os.remove(self.ruta)
+            except OSError:
+                pass
+
+    def __iter__(self):
+        return iter(self._archivo)
+
+    def __getattr__(self, nombre):
+        # read, readline, seek, tell, flush... del archivo real
+        return getattr(self._archivo, nombre)
+
+
+class PeticionConHash(Request):
+    # Flask cierra la petición al terminar y con ella los temporales que no se guardaron
+    def limite_archivo(self):
+        # (bytes máximos, mensaje para el usuario) según la ruta
+        if self.path.startswith("/api/chat"):
+            return PDF_MAX_BYTES, f"📄 El PDF supera el tamaño máximo permitido ({_megas(PDF_MAX_BYTES)})."
+        return SUBIDA_MAX_BYTES, f"El archivo supera el tamaño máximo permitido ({_megas(SUBIDA_MAX_BYTES)})."
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        limite, mensaje = self.limite_archivo()
+        return FlujoConHash(os.path.join(DOCUMENTS_DIR, SUBIDAS_TEMPORALES), limite, mensaje)
+
+
+def digest_subida(archivo):
+    # SHA-256 ya calculado mientras se recibía el archivo (None si no pasó por PeticionConHash)
+    flujo = getattr(archivo, "stream", archivo)
+    return flujo.sha256 if isinstance(flujo, FlujoConHash) else None
+
+
+def _extension(nombre):
+    extension = os.path.splitext(secure_filename(nombre or ""))[1].lower()
+    return extension if re.fullmatch(r"\.[a-z0-9]{1,8}", extension) else ""
+
+
+class AlmacenDocumentos:
+    # documents/<sha256><ext>: cada contenido se guarda una vez; el índice recuerda los nombres originales
+    def __init__(self, directorio=DOCUMENTS_DIR, ruta_indice=ALMACEN_INDICE_PATH):
+        self.directorio = directorio
+        self.ruta_indice = ruta_indice
+        self._lock = threading.Lock()
+        # sha256 -> {"archivo", "nombres", "tamano", "tipo", "subido", "ultima_subida", "subidas"}
+        self._entradas = {}
+        self._mtime_cargado = None
+        self._stats = {"guardados": 0, "duplicados": 0}
+
+    def _recargar_si_cambio(self):
+        # Otro worker pudo guardar un archivo: se relee el índice si cambió en disco
+        try:
+            mtime = os.stat(self.ruta_indice).st_mtime_ns
+        except OSError:
+            return
+        if mtime == self._mtime_cargado:
+            return
+        try:
+            with open(self.ruta_indice, "r", encoding="utf-8") as f:
+                self._entradas = json.load(f).get("archivos", {})
+            self._mtime_cargado = mtime
+        except Exception as e:
+            logging.error(f"❌ No se pudo cargar el índice del almacén de documentos: {e}")
+
+    def _guardar_indice(self):
+        os.makedirs(os.path.dirname(self.ruta_indice) or ".", exist_ok=True)
+        temporal = f"{self.ruta_indice}.{os.getpid()}.tmp"
+        with open(temporal, "w", encoding="utf-8") as f:
+            json.dump({"archivos": self._entradas}, f, ensure_ascii=False, indent=1)
+        os.replace(temporal, self.ruta_indice)
+        self._mtime_cargado = os.stat(self.ruta_indice).st_mtime_ns
+
+    def _recibir(self, archivo):
+        # Sin PeticionConHash (p. ej. otro servidor) se copia por bloques igual que haría Werkzeug
+        flujo = FlujoConHash(os.path.join(self.directorio, SUBIDAS_TEMPORALES), SUBIDA_MAX_BYTES,
+                             f"El archivo supera el tamaño máximo permitido ({_megas(SUBIDA_MAX_BYTES)}).")
+        try:
+            origen = getattr(archivo, "stream", archivo)
+            shutil.copyfileobj(origen, flujo, BLOQUE)
+        except Exception:
+            flujo.close()
+            raise
+        return flujo
+
+    def guardar(self, archivo):
+        # Devuelve (sha256, entrada, ruta, nuevo)
+        flujo = getattr(archivo, "stream", None)
+        propio = not isinstance(flujo, FlujoConHash)
+        if propio:
+            flujo = self._recibir(archivo)
+        try:
+            sha256 = flujo.sha256
+            nombre = os.path.basename(archivo.filename or "") or sha256
+            ahora = datetime.now().isoformat(timespec="seconds")
+            with self._lock:
+                self._recargar_si_cambio()
+                entrada = self._entradas.get(sha256)
+                ruta = os.path.join(self.directorio, entrada["archivo"]) if entrada else None
+                nuevo = entrada is None or not os.path.exists(ruta)
+                if nuevo:
+                    entrada = {
+                        "archivo": f"{sha256}{_extension(nombre)}",
+                        "nombres": [],
+                        "tamano": flujo.tamano,
+                        "tipo": getattr(archivo, "mimetype", None) or None,
+                        "subido": ahora,
+                        "subidas": 0,
+                    }
+                    ruta = os.path.join(self.directorio, entrada["archivo"])
+                    flujo.mover_a(ruta)
+                    self._stats["guardados"] += 1
+                else:
+                    self._stats["duplicados"] += 1
+                if nombre not in entrada["nombres"]:
+                    entrada["nombres"].append(nombre)
+                entrada["subidas"] += 1
+                entrada["ultima_subida"] = ahora
+                self._entradas[sha256] = entrada
+                self._guardar_indice()
+            return sha256, entrada, ruta, nuevo
+        finally:
+            if propio:
+                flujo.close()
+
+    def buscar(self, sha256):
+        with self._lock:
+            self._recargar_si_cambio()
+            entrada = self._entradas.get(sha256)
+            return dict(entrada) if entrada else None
+
+    def estadisticas(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["archivos"] = len(self._entradas)
+            stats["bytes"] = sum(e.get("tamano", 0) for e in self._entradas.values())
+        return stats
+
+
+almacen_documentos = AlmacenDocumentos()
@@ -0,0 +1,193 @@
+import os
+import time
+import logging
+import threading
+from datetime import date
+from collections import OrderedDict
+
+from dotenv import load_dotenv
+
+from api.db import db_connection
+from api.esquema import asegurar_esquema
+from api.metricas import metricas
+
+load_dotenv()
+
+ANALITICA_CACHE_TTL = float(os.getenv("ANALITICA_CACHE_TTL", "60"))
+ANALITICA_CACHE_MAX = int(os.getenv("ANALITICA_CACHE_MAX", "64"))
+# Usuarios cuyas propuestas no cuentan en el reporte (por defecto el de la evaluación por lotes)
+ANALITICA_EXCLUIR_USUARIOS = tuple(
+    u.strip() for u in os.getenv("ANALITICA_EXCLUIR_USUARIOS", os.getenv("LOTE_USUARIO", "lote_innovug")).split(",")
+    if u.strip()
+)
+SIN_DATO = "Sin especificar"
+APROBADO = "aprobado_chatbot"
+PENDIENTE = "pendiente_aprobacion_chatbot"
+
+
+def leer_fecha(valor):
+    # YYYY-MM-DD o None; ValueError si no es una fecha
+    return date.fromisoformat(valor.strip()).isoformat() if valor and valor.strip() else None
+
+
+def _clave(valor):
+    # Igual que TRIM(COALESCE(...)) en reconstruir()
+    return str(valor or "").strip()
+
+
+def _agregado(propuestas, suma_promedio, aprobadas, pendientes):
+    return {
+        "propuestas": propuestas,
+        "promedio": round(suma_promedio / propuestas, 2) if propuestas else None,
+        "aprobadas": aprobadas,
+        "pendientes": pendientes,
+        "tasa_aprobacion": round(aprobadas / propuestas, 3) if propuestas else None,
+    }
+
+
+class ResumenEvaluaciones:
+    # Contadores por día, facultad y carrera que se actualizan en la misma transacción que guarda
+    # cada evaluación: los reportes leen solo estas filas, no evaluaciones/projects/lider_proyecto
+    def __init__(self, ttl=ANALITICA_CACHE_TTL, max_entradas=ANALITICA_CACHE_MAX, excluir=ANALITICA_EXCLUIR_USUARIOS):
+        self.ttl = ttl
+        self.max_entradas = max_entradas
+        self.excluir = excluir
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()
+        self._stats = {"registradas": 0, "aciertos": 0, "fallos": 0, "reconstrucciones": 0}
+
+    def registrar(self, cur, user_identity, facultad, carrera, promedio, estado):
+        # Con el cursor de upsert_pdf_data, antes de su commit
+        if user_identity in self.excluir or not asegurar_esquema():
+            return
+        cur.execute("""
+            INSERT INTO resumen_evaluaciones (dia, facultad, carrera, propuestas, suma_promedio, aprobadas, pendientes)
+            VALUES (CURRENT_DATE, %s, %s, 1, %s, %s, %s)
+            ON CONFLICT (dia, facultad, carrera) DO UPDATE SET
+                propuestas = resumen_evaluaciones.propuestas + 1,
+                suma_promedio = resumen_evaluaciones.suma_promedio + EXCLUDED.suma_promedio,
+                aprobadas = resumen_evaluaciones.aprobadas + EXCLUDED.aprobadas,
+                pendientes = resumen_evaluaciones.pendientes + EXCLUDED.pendientes
+        """, (_clave(facultad), _clave(carrera), promedio, int(estado == APROBADO), int(estado == PENDIENTE)))
+        with self._lock:
+            self._stats["registradas"] += 1
+
+    def invalidar(self):
+        # Los demás workers ven los cambios al vencer su caché (ANALITICA_CACHE_TTL)
+        with self._lock:
+            self._cache.clear()
+
+    @metricas.cronometrar("chatbot_db_segundos")
+    def _consultar(self, desde, hasta):
+        condiciones, parametros = [], []
+        if desde:
+            condiciones.append("dia >= %s")
+            parametros.append(desde)
+        if hasta:
+            condiciones.append("dia <= %s")
+            parametros.append(hasta)
+        filtro = f"WHERE {' AND '.join(condiciones)}" if condiciones else ""
+        with db_connection() as conn:
+            cur = conn.cursor()
+            cur.execute(f"""
+                SELECT facultad, carrera, SUM(propuestas), SUM(suma_promedio), SUM(aprobadas), SUM(pendientes),
+                       MIN(dia), MAX(dia)
+                FROM resumen_evaluaciones
+                {filtro}
+                GROUP BY facultad, carrera
+            """, parametros)
+            filas = cur.fetchall()
+            cur.close()
+        return filas
+
+    def reporte(self, desde=None, hasta=None):
+        clave = (desde, hasta)
+        with self._lock:
+            entrada = self._cache.get(clave)
+            if entrada and time.monotonic() - entrada[0] < self.ttl:
+                self._cache.move_to_end(clave)
+                self._stats["aciertos"] += 1
+                return entrada[1]
+            self._stats["fallos"] += 1
+
+        if not asegurar_esquema():
+            raise RuntimeError("No se pudo crear la tabla resumen_evaluaciones")
+        filas = self._consultar(desde, hasta)
+
+        totales = [0, 0.0, 0, 0]
+        facultades = {}
+        carreras = []
+        dias = []
+        for facultad, carrera, propuestas, suma, aprobadas, pendientes, primero, ultimo in filas:
+            valores = (int(propuestas or 0), float(suma or 0), int(aprobadas or 0), int(pendientes or 0))
+            for acumulado in (totales, facultades.setdefault(facultad or SIN_DATO, [0, 0.0, 0, 0])):
+                for i, valor in enumerate(valores):
+                    acumulado[i] += valor
+            carreras.append(dict(_agregado(*valores), facultad=facultad or SIN_DATO, carrera=carrera or SIN_DATO))
+            dias += [str(primero)[:10], str(ultimo)[:10]]
+
+        reporte = {
+            "desde": desde,
+            "hasta": hasta,
+            "primer_dia": min(dias) if dias else None,
+            "ultimo_dia": max(dias) if dias else None,
+            "totales": _agregado(*totales),
+            "por_facultad": sorted(
+                (dict(_agregado(*valores), facultad=facultad) for facultad, valores in facultades.items()),
+                key=lambda fila: (-fila["propuestas"], fila["facultad"])
+            ),
+            "por_carrera": sorted(carreras, key=lambda fila: (-fila["propuestas"], fila["facultad"], fila["carrera"])),
+        }
+        with self._lock:
+            self._cache[clave] = (time.monotonic(), reporte)
+            self._cache.move_to_end(clave)
+            while len(self._cache) > self.max_entradas:
+                self._cache.popitem(last=False)
+        return reporte
+
+    def reconstruir(self):
+        # Backfill: recalcula todo desde evaluaciones. El LOCK espera a las evaluaciones que ya tocaron
+        # el resumen y frena las nuevas hasta el commit, así ninguna se cuenta dos veces ni se pierde
+        if not asegurar_esquema():
+            raise RuntimeError("No se pudo crear la tabla resumen_evaluaciones")
+        with db_connection() as conn:
+            cur = conn.cursor()
+            cur.execute("LOCK TABLE resumen_evaluaciones IN SHARE ROW EXCLUSIVE MODE")
+            cur.execute("DELETE FROM resumen_evaluaciones")
+            excluidos = f"WHERE p.user_identity NOT IN ({', '.join(['%s'] * len(self.excluir))})" if self.excluir else ""
+            cur.execute(f"""
+                INSERT INTO resumen_evaluaciones (dia, facultad, carrera, propuestas, suma_promedio, aprobadas, pendientes)
+                SELECT date(e.created_at), TRIM(COALESCE(l.facultad, '')), TRIM(COALESCE(l.carrera, '')), COUNT(*),
+                       SUM(COALESCE(e.promedio_evaluacion, 0)),
+                       SUM(CASE WHEN e.proposal_status = %s THEN 1 ELSE 0 END),
+                       SUM(CASE WHEN e.proposal_status = %s THEN 1 ELSE 0 END)
+                FROM evaluaciones e
+                JOIN projects p ON p.id_version = e.project_id_version
+                LEFT JOIN lider_proyecto l ON l.project_id_version = e.project_id_version
+                {excluidos}
+                GROUP BY date(e.created_at), TRIM(COALESCE(l.facultad, '')), TRIM(COALESCE(l.carrera, ''))
+            """, (APROBADO, PENDIENTE) + self.excluir)
+            cur.execute("SELECT COUNT(*), COALESCE(SUM(propuestas), 0) FROM resumen_evaluaciones")
+            grupos, evaluaciones = cur.fetchone()
+            conn.commit()
+            cur.close()
+        self.invalidar()
+        with self._lock:
+            self._stats["reconstrucciones"] += 1
+        logging.info(f"📊 Resumen de evaluaciones reconstruido: {evaluaciones} evaluaciones en {grupos} grupos")
+        return {"grupos": grupos, "evaluaciones": evaluaciones}
+
+    def estadisticas(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["en_cache"] = len(self._cache)
+        return stats
+
+
+resumen_evaluaciones = ResumenEvaluaciones()
+
+
+if __name__ == "__main__":
+    # Backfill tras desplegar (o si se editó evaluaciones a mano): python -m api.analitica
+    logging.basicConfig(level="INFO")
+    print(f"📊 {resumen_evaluaciones.reconstruir()}")
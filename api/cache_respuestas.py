@@ -0,0 +1,92 @@
+import os
+import re
+import time
+import threading
+from collections import OrderedDict
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Desactivada por defecto: una respuesta cacheada se comparte entre todos los usuarios
+FAQ_CACHE_ACTIVO = os.getenv("FAQ_CACHE_ACTIVO", "0").lower() in ("1", "true", "si", "yes")
+FAQ_CACHE_TTL = float(os.getenv("FAQ_CACHE_TTL", "86400"))
+FAQ_CACHE_MAX = int(os.getenv("FAQ_CACHE_MAX", "500"))
+# Preguntas más largas que esto (ya normalizadas) rara vez se repiten tal cual
+FAQ_CACHE_MAX_CARACTERES = int(os.getenv("FAQ_CACHE_MAX_CARACTERES", "200"))
+# Parte de los términos de la pregunta que deben aparecer en documents/ para cachear la respuesta
+FAQ_CACHE_COBERTURA = float(os.getenv("FAQ_CACHE_COBERTURA", "0.6"))
+
+# Palabras que hacen depender la respuesta de la conversación o del propio usuario
+MARCADORES_CONTEXTO = {
+    "mi", "mis", "me", "yo", "mio", "mia", "mios", "mias", "conmigo",
+    "nosotros", "nosotras", "nuestro", "nuestra", "nuestros", "nuestras",
+    "este", "esta", "esto", "estos", "estas", "ese", "esa", "eso", "esos", "esas",
+    "aquel", "aquella", "aquello", "anterior", "anteriormente", "antes", "arriba",
+    "dijiste", "mencionaste", "respondiste", "otra", "otro", "mas", "tambien", "entonces",
+    # Pronombres de objeto: "¿cómo lo mejoro?" habla de algo dicho antes
+    "lo", "le", "les", "ello", "ella", "ellas", "ellos", "te", "tu", "tus", "usted",
+}
+# Una pregunta que empieza así continúa la anterior ("¿y el presupuesto?")
+INICIOS_SEGUIMIENTO = {"y", "e", "pero", "entonces", "ademas", "o", "u", "ok", "vale", "bueno", "pues"}
+# Verbos con pronombre pegado: mejorarlo, explicarla, haciendolo, explicamelo
+CLITICO = re.compile(r"\w{2,}(ar|er|ir|ando|iendo|yendo)(me|te|se|nos)?(lo|la|los|las|le|les)$|\w+(me|te|se)(lo|la|los|las)$")
+
+
+def es_pregunta_general(texto_normalizado):
+    # Solo preguntas cortas, sin cifras (cédulas, notas) ni referencias al usuario o a turnos previos
+    if not texto_normalizado or len(texto_normalizado) > FAQ_CACHE_MAX_CARACTERES:
+        return False
+    if re.search(r"\d", texto_normalizado):
+        return False
+    palabras = texto_normalizado.split()
+    if len(palabras) < 3 or palabras[0] in INICIOS_SEGUIMIENTO:
+        return False
+    return not any(p in MARCADORES_CONTEXTO or CLITICO.match(p) for p in palabras)
+
+
+class CacheRespuestas:
+    def __init__(self, ttl=FAQ_CACHE_TTL, max_entradas=FAQ_CACHE_MAX):
+        self.ttl = ttl
+        self.max_entradas = max_entradas
+        self._lock = threading.Lock()
+        self._entradas = OrderedDict()
+        self._stats = {"aciertos": 0, "fallos": 0, "guardadas": 0, "expulsadas": 0, "invalidaciones": 0}
+
+    def obtener(self, clave):
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada and time.monotonic() - entrada[0] < self.ttl:
+                self._entradas.move_to_end(clave)
+                self._stats["aciertos"] += 1
+                return entrada[1]
+            if entrada:
+                del self._entradas[clave]
+            self._stats["fallos"] += 1
+            return None
+
+    def guardar(self, clave, respuesta):
+        with self._lock:
+            self._entradas[clave] = (time.monotonic(), respuesta)
+            self._entradas.move_to_end(clave)
+            self._stats["guardadas"] += 1
+            while len(self._entradas) > self.max_entradas:
+                self._entradas.popitem(last=False)
+                self._stats["expulsadas"] += 1
+
+    def invalidar(self):
+        with self._lock:
+            self._entradas.clear()
+            self._stats["invalidaciones"] += 1
+
+    def estadisticas(self):
+        with self._lock:
+            stats = dict(self._stats)
+            consultas = stats["aciertos"] + stats["fallos"]
+            stats.update({
+                "activo": FAQ_CACHE_ACTIVO,
+                "entradas": len(self._entradas),
+                "max_entradas": self.max_entradas,
+                "tasa_aciertos": round(stats["aciertos"] / consultas, 3) if consultas else 0.0,
+            })
+        return stats
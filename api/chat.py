@@ -1,18 +1,42 @@
 import os
 import re
+import time
 import logging
-import pdfplumber
+import threading
 import openai
 import json
-import psycopg2
-import pandas as pd
+import copy
+import base64
+import contextvars
 import hashlib
 import unicodedata
 from datetime import datetime
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from dotenv import load_dotenv
-from difflib import SequenceMatcher
-from flask import Blueprint, request, jsonify
+from functools import lru_cache
+from flask import Blueprint, Response, request, jsonify, stream_with_context
 from openai.error import RateLimitError
+from werkzeug.exceptions import RequestEntityTooLarge
+from psycopg2.extras import Json
+from api.db import db_connection, db_pool
+from api.esquema import asegurar_esquema
+from api.escritura_diferida import EscritorHistorial, CHAT_HISTORY_WRITE_BEHIND
+from api.similitud import HuellaPlantilla
+from api.extraccion_pdf import extractor_pdf, LimitePDFExcedido
+from api.sesiones import crear_almacen_sesiones, recortar_contexto, estimar_tokens, CONTEXT_TOKEN_BUDGET
+from api.trabajos import ColaTrabajos, PDF_JOB_MODE
+from api.cliente_openai import cliente_openai
+from api.recuperacion import indice_documentos
+from api.resumenes import resumidor_historial
+from api.referencia import referencia_plantilla
+from api.almacen import digest_subida, almacen_documentos
+from api.analitica import resumen_evaluaciones, leer_fecha
+from api.metricas import metricas
+from api.cache_respuestas import CacheRespuestas, es_pregunta_general, FAQ_CACHE_ACTIVO, FAQ_CACHE_COBERTURA
+from api.vuelo_unico import VueloUnico, ReservasPDF
+from api.intenciones import EnrutadorIntenciones, registrar_intenciones_base, ENLACE_FORMATO_PROPUESTA
 
 chat_blueprint = Blueprint('chat', __name__)
 
@@ -21,65 +45,79 @@ MODEL = os.getenv("MODEL")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 openai.api_key = OPENAI_API_KEY
 
-user_contexts = {}
+# 🗂️ Contexto de conversación por usuario (memoria o SQLite compartido, con TTL y límites).
+# Una sesión que no está en el almacén se recarga de la BD, tanto al leerla como al agregarle mensajes
+sesiones = crear_almacen_sesiones(cargador=lambda user_identity: cargar_sesion(user_identity))
 MAX_CONTEXT_LENGTH = 25
 
-REFERENCE_PDF_PATH = os.path.join(os.path.dirname(__file__), '../documents/doc_003.pdf')
-REFERENCE_FILE_PATH = os.path.join(os.path.dirname(__file__), '../documents/Criterios de evaluación de STARTUPS.xlsx')
+# Mensajes que se cargan al reconstruir el contexto (p. ej. en "__ping__") y tamaño de página del historial
+HISTORIAL_LIMITE = int(os.getenv("HISTORIAL_LIMITE", "50"))
+HISTORIAL_PAGINA_MAX = int(os.getenv("HISTORIAL_PAGINA_MAX", "200"))
+
+# Caché por usuario del contexto de proyectos/evaluaciones; cada lectura compara la versión de
+# contexto_usuario, que upsert_pdf_data sube en la BD (el TTL solo acota entradas olvidadas)
+CONTEXTO_CACHE_MAX = int(os.getenv("CONTEXTO_CACHE_MAX", "1000"))
+CONTEXTO_CACHE_TTL = float(os.getenv("CONTEXTO_CACHE_TTL", "300"))
+_contexto_cache = OrderedDict()
+_contexto_cache_lock = threading.Lock()
+
 RULE_CHAT_PATH = os.path.join(os.path.dirname(__file__), '../rules/rule_chat.txt')
 SYSTEM_PROMPT = ""
+_rule_chat_mtime = None
 
 try:
     with open(RULE_CHAT_PATH, "r", encoding="utf-8") as f:
         SYSTEM_PROMPT = f.read().strip()
+    _rule_chat_mtime = os.stat(RULE_CHAT_PATH).st_mtime_ns
 except Exception as e:
     logging.error(f"❌ No se pudo cargar rule_chat.txt: {e}")
 
-REFERENCE_TEXT = ""
-REFERENCE_DF = pd.DataFrame()
+# 💬 Respuestas a preguntas generales frecuentes, por pregunta normalizada
+cache_respuestas = CacheRespuestas()
 
-try:
-    with pdfplumber.open(REFERENCE_PDF_PATH) as pdf:
-        REFERENCE_TEXT = "\n".join(page.extract_text() or "" for page in pdf.pages).strip().lower()
-except:
-    pass
+def recargar_reglas_si_cambiaron():
+    # Si rule_chat.txt cambió se recarga el SYSTEM_PROMPT y se descartan las respuestas cacheadas
+    global SYSTEM_PROMPT, _rule_chat_mtime
+    try:
+        mtime = os.stat(RULE_CHAT_PATH).st_mtime_ns
+        if mtime == _rule_chat_mtime:
+            return
+        with open(RULE_CHAT_PATH, "r", encoding="utf-8") as f:
+            SYSTEM_PROMPT = f.read().strip()
+        _rule_chat_mtime = mtime
+        cache_respuestas.invalidar()
+        logging.info("🔄 rule_chat.txt cambió: SYSTEM_PROMPT recargado y caché de respuestas vaciada")
+    except Exception as e:
+        logging.error(f"❌ No se pudo recargar rule_chat.txt: {e}")
 
-try:
-    REFERENCE_DF = pd.read_excel(REFERENCE_FILE_PATH)
-except:
-    pass
-
-def get_db_connection():
-    return psycopg2.connect(
-        dbname=os.getenv("DB_NAME"),
-        user=os.getenv("DB_USER"),
-        password=os.getenv("DB_PASSWORD"),
-        host=os.getenv("DB_HOST"),
-        port=os.getenv("DB_PORT")
-    )
+escritor_historial = EscritorHistorial(db_pool)
 
+@metricas.cronometrar("chatbot_db_segundos")
 def guardar_mensaje(user_identity, role, content):
+    # 📨 Modo diferido: el mensaje se encola y un hilo lo escribe por lotes
+    if CHAT_HISTORY_WRITE_BEHIND:
+        escritor_historial.encolar(user_identity, role, content)
+        return
     try:
-        # ⛑️ Asegurar que el usuario exista antes de insertar en chat_history
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute("SELECT 1 FROM users WHERE identity = %s", (user_identity,))
-        exists = cur.fetchone()
-        if not exists:
-            cur.execute("INSERT INTO users (identity, full_name) VALUES (%s, %s) ON CONFLICT DO NOTHING", (user_identity, None))
+        with db_connection() as conn:
+            cur = conn.cursor()
+            # ⛑️ Asegurar que el usuario exista antes de insertar en chat_history
+            cur.execute("SELECT 1 FROM users WHERE identity = %s", (user_identity,))
+            exists = cur.fetchone()
+            if not exists:
+                cur.execute("INSERT INTO users (identity, full_name) VALUES (%s, %s) ON CONFLICT DO NOTHING", (user_identity, None))
+                conn.commit()
+            # Guardar el mensaje
+            cur.execute("""
+                INSERT INTO chat_history (user_identity, role, content, timestamp)
+                VALUES (%s, %s, %s, %s)
+            """, (user_identity, role, content, datetime.now()))
             conn.commit()
-        # Guardar el mensaje
-        cur.execute("""
-            INSERT INTO chat_history (user_identity, role, content, timestamp)
-            VALUES (%s, %s, %s, %s)
-        """, (user_identity, role, content, datetime.now()))
-        conn.commit()
-        cur.close()
-        conn.close()
+            cur.close()
     except Exception as e:
         logging.error(f"❌ Error guardando mensaje en DB: {e}")
 
-def generar_hash_pdf(texto):
+def normalizar_texto(texto):
     # 1. Quitar acentos y tildes
     texto = unicodedata.normalize("NFKD", texto).encode("ascii", "ignore").decode("utf-8")
 
@@ -93,59 +131,99 @@ def generar_hash_pdf(texto):
     texto = re.sub(r"\s+", " ", texto)
 
     # 5. Strip final
-    texto = texto.strip()
+    return texto.strip()
 
-    # 6. Generar hash
-    return hashlib.md5(texto.encode()).hexdigest()
+def generar_hash_pdf(texto):
+    return hashlib.md5(normalizar_texto(texto).encode()).hexdigest()
 
-def cargar_historial_por_identity(user_identity):
+@metricas.cronometrar("chatbot_db_segundos")
+def cargar_historial_por_identity(user_identity, limite=HISTORIAL_LIMITE):
     historial = []
+    # Los mensajes de este usuario aún en cola se escriben antes de leer
+    if CHAT_HISTORY_WRITE_BEHIND and escritor_historial.pendientes(user_identity):
+        escritor_historial.flush()
+    # 🧾 Resumen de lo antiguo + mensajes recientes; el resumen se actualiza en segundo plano
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute("""
-            SELECT role, content
-            FROM chat_history
-            WHERE user_identity = %s
-            ORDER BY timestamp ASC
-        """, (user_identity,))
-        for row in cur.fetchall():
-            historial.append({"role": row[0], "content": row[1]})
-        cur.close()
-        conn.close()
+        resumido = resumidor_historial.cargar_historial(user_identity, limite)
+        if resumido is not None:
+            return resumido
+    except Exception as e:
+        logging.error(f"❌ Error cargando historial resumido: {e}")
+    try:
+        # Solo la ventana más reciente, en orden cronológico
+        mensajes, _ = cargar_pagina_historial(user_identity, limite)
+        historial = [{"role": m["role"], "content": m["content"]} for m in reversed(mensajes)]
     except Exception as e:
         logging.error(f"❌ Error cargando historial desde DB: {e}")
     return historial
 
-def get_user_name(user_identity):
-    try:
-        conn = get_db_connection()
+def codificar_cursor(timestamp, id_mensaje):
+    return base64.urlsafe_b64encode(f"{timestamp.isoformat()}|{id_mensaje}".encode()).decode().rstrip("=")
+
+def decodificar_cursor(cursor):
+    crudo = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+    timestamp, id_mensaje = crudo.rsplit("|", 1)
+    return datetime.fromisoformat(timestamp), int(id_mensaje)
+
+@metricas.cronometrar("chatbot_db_segundos")
+def cargar_pagina_historial(user_identity, limite, antes=None):
+    # 📜 Página del más reciente al más antiguo; `antes` es el cursor (timestamp, id) de la página previa
+    with db_connection() as conn:
         cur = conn.cursor()
-        cur.execute("SELECT full_name FROM users WHERE identity = %s", (user_identity,))
-        row = cur.fetchone()
+        if antes:
+            cur.execute("""
+                SELECT id, role, content, timestamp
+                FROM chat_history
+                WHERE user_identity = %s AND (timestamp, id) < (%s, %s)
+                ORDER BY timestamp DESC, id DESC
+                LIMIT %s
+            """, (user_identity, antes[0], antes[1], limite + 1))
+        else:
+            cur.execute("""
+                SELECT id, role, content, timestamp
+                FROM chat_history
+                WHERE user_identity = %s
+                ORDER BY timestamp DESC, id DESC
+                LIMIT %s
+            """, (user_identity, limite + 1))
+        filas = cur.fetchall()
         cur.close()
-        conn.close()
+    mensajes = [
+        {"id": f[0], "role": f[1], "content": f[2], "timestamp": f[3].isoformat()}
+        for f in filas[:limite]
+    ]
+    siguiente = codificar_cursor(filas[limite - 1][3], filas[limite - 1][0]) if len(filas) > limite else None
+    return mensajes, siguiente
+
+@metricas.cronometrar("chatbot_db_segundos")
+def get_user_name(user_identity):
+    try:
+        with db_connection() as conn:
+            cur = conn.cursor()
+            cur.execute("SELECT full_name FROM users WHERE identity = %s", (user_identity,))
+            row = cur.fetchone()
+            cur.close()
         return row[0] if row else None
     except Exception as e:
         logging.error(f"❌ Error buscando nombre del usuario: {e}")
         return None
 
+@metricas.cronometrar("chatbot_db_segundos")
 def set_user_name(user_identity, full_name):
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute("""
-            INSERT INTO users (identity, full_name)
-            VALUES (%s, %s)
-            ON CONFLICT (identity) DO UPDATE SET full_name = EXCLUDED.full_name
-        """, (user_identity, full_name))
-        conn.commit()
-        cur.close()
-        conn.close()
+        with db_connection() as conn:
+            cur = conn.cursor()
+            cur.execute("""
+                INSERT INTO users (identity, full_name)
+                VALUES (%s, %s)
+                ON CONFLICT (identity) DO UPDATE SET full_name = EXCLUDED.full_name
+            """, (user_identity, full_name))
+            conn.commit()
+            cur.close()
     except Exception as e:
         logging.error(f"❌ Error guardando nombre del usuario: {e}")
 
-def extraer_datos_structurados_desde_texto(texto):
+def extraer_datos_structurados_desde_texto(texto, user_identity=None):
     import json
 
     prompt = """
@@ -185,9 +263,11 @@ def extraer_datos_structurados_desde_texto(texto):
         {"role": "user", "content": texto}
     ]
 
-    response = openai.ChatCompletion.create(
+    response = cliente_openai.completar(
+        mensajes,
+        user_identity=user_identity,
         model=MODEL,
-        messages=mensajes,
+        operacion="extraccion_datos",
         temperature=0.2,
     )
 
@@ -210,36 +290,74 @@ def extraer_datos_structurados_desde_texto(texto):
         logging.error(f"❌ JSON inválido después de limpiar:\n{raw}")
         raise e
     
+def invalidar_contexto_ampliado(user_identity):
+    with _contexto_cache_lock:
+        _contexto_cache.pop(user_identity, None)
+
+def subir_version_contexto(cur, user_identity):
+    # En la transacción que cambia proyectos/evaluaciones: invalida la caché de todos los workers
+    cur.execute("""
+        INSERT INTO contexto_usuario (user_identity, version) VALUES (%s, 1)
+        ON CONFLICT (user_identity) DO UPDATE SET version = contexto_usuario.version + 1
+    """, (user_identity,))
+
+def version_contexto(user_identity):
+    # None si no se pudo leer: entonces la caché vale solo por CONTEXTO_CACHE_TTL
+    if not asegurar_esquema():
+        return None
+    try:
+        with db_connection() as conn:
+            cur = conn.cursor()
+            cur.execute("SELECT version FROM contexto_usuario WHERE user_identity = %s", (user_identity,))
+            fila = cur.fetchone()
+            cur.close()
+        return fila[0] if fila else 0
+    except Exception as e:
+        logging.error(f"❌ Error leyendo la versión del contexto: {e}")
+        return None
+
+@metricas.cronometrar("chatbot_db_segundos")
 def cargar_contexto_ampliado(user_identity):
+    # ♻️ Reutilizar el contexto cacheado mientras no haya proyectos/evaluaciones nuevos en ningún worker
+    # (la versión se lee antes que los datos: si cambia en medio, la próxima lectura recarga)
+    version = version_contexto(user_identity)
+    with _contexto_cache_lock:
+        cacheado = _contexto_cache.get(user_identity)
+        if cacheado and cacheado[2] == version and time.monotonic() - cacheado[0] < CONTEXTO_CACHE_TTL:
+            _contexto_cache.move_to_end(user_identity)
+            return list(cacheado[1])
+
     contexto = []
 
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-
-        cur.execute("""
-            SELECT id_version, nombre_del_negocio, problema_y_solucion, mercado, competencia,
-                   modelo_de_negocio, escalabilidad, created_at
-            FROM projects
-            WHERE user_identity = %s
-            ORDER BY created_at ASC
-        """, (user_identity,))
-        proyectos = cur.fetchall()
+        with db_connection() as conn:
+            cur = conn.cursor()
 
-        for p in proyectos:
+            # Proyectos, líder y evaluaciones en una sola consulta
+            cur.execute("""
+                SELECT p.id_version, p.nombre_del_negocio, p.problema_y_solucion, p.mercado, p.competencia,
+                       p.modelo_de_negocio, p.escalabilidad, p.created_at,
+                       (SELECT l.nombres FROM lider_proyecto l WHERE l.project_id_version = p.id_version LIMIT 1),
+                       (SELECT l.apellidos FROM lider_proyecto l WHERE l.project_id_version = p.id_version LIMIT 1),
+                       e.detalle, e.promedio_evaluacion, e.proposal_status, e.created_at
+                FROM projects p
+                LEFT JOIN evaluaciones e ON e.project_id_version = p.id_version
+                WHERE p.user_identity = %s
+                ORDER BY p.created_at ASC, p.id_version ASC, e.created_at ASC
+            """, (user_identity,))
+            filas = cur.fetchall()
+            cur.close()
+
+        id_actual = None
+        for p in filas:
             id_version = p[0]
 
-            # 🧑‍💼 Buscar líder del proyecto
-            cur.execute("""
-                SELECT nombres, apellidos
-                FROM lider_proyecto
-                WHERE project_id_version = %s
-                LIMIT 1
-            """, (id_version,))
-            lider = cur.fetchone()
-            lider_nombre = f"{lider[0]} {lider[1]}" if lider else "No especificado"
-
-            descripcion = f"""
+            if id_version != id_actual:
+                id_actual = id_version
+                # 🧑‍💼 Líder del proyecto
+                lider_nombre = f"{p[8]} {p[9]}" if p[8] is not None or p[9] is not None else "No especificado"
+
+                descripcion = f"""
 📦 Proyecto #{id_version}:
 - Nombre: {p[1]}
 - Líder del proyecto: {lider_nombre}
@@ -249,210 +367,910 @@ def cargar_contexto_ampliado(user_identity):
 - Modelo de negocio: {p[5]}
 - Escalabilidad: {p[6]}
 - Fecha de creación: {p[7]}
-            """.strip()
+                """.strip()
 
-            contexto.append({"role": "system", "content": descripcion})
+                contexto.append({"role": "system", "content": descripcion})
 
-            # 📑 Evaluaciones asociadas
-            cur.execute("""
-                SELECT detalle, promedio_evaluacion, proposal_status, created_at
-                FROM evaluaciones
-                WHERE project_id_version = %s
-                ORDER BY created_at ASC
-            """, (id_version,))
-            evaluaciones = cur.fetchall()
-
-            for e in evaluaciones:
-                detalle_eval = f"""
-📑 Evaluación del Proyecto #{id_version}:
-- Promedio: {e[1]}
-- Estado: {e[2]}
-- Fecha: {e[3]}
-- Detalle: {e[0][:500]}...
-                """.strip()
-                contexto.append({"role": "system", "content": detalle_eval})
+            # 📑 Evaluaciones asociadas (el LEFT JOIN deja NULL si el proyecto no tiene)
+            if p[10] is None and p[13] is None:
+                continue
 
-        cur.close()
-        conn.close()
+            detalle_eval = f"""
+📑 Evaluación del Proyecto #{id_version}:
+- Promedio: {p[11]}
+- Estado: {p[12]}
+- Fecha: {p[13]}
+- Detalle: {(p[10] or "")[:500]}...
+            """.strip()
+            contexto.append({"role": "system", "content": detalle_eval})
 
     except Exception as e:
         logging.error(f"❌ Error cargando contexto ampliado: {e}")
+        return contexto
 
-    return contexto
+    with _contexto_cache_lock:
+        _contexto_cache[user_identity] = (time.monotonic(), contexto, version)
+        _contexto_cache.move_to_end(user_identity)
+        while len(_contexto_cache) > CONTEXTO_CACHE_MAX:
+            _contexto_cache.popitem(last=False)
+
+    return list(contexto)
 
-def evaluar_propuesta_con_ia(texto):
+def evaluar_propuesta_con_ia(texto, user_identity=None):
     mensajes = [
         {"role": "system", "content": SYSTEM_PROMPT},
         {"role": "user", "content": f"Texto extraído del PDF:\n{texto}"}
     ]
-    response = openai.ChatCompletion.create(
+    response = cliente_openai.completar(
+        mensajes,
+        user_identity=user_identity,
         model=MODEL,
-        messages=mensajes,
+        operacion="evaluacion",
         temperature=0.3,
     )
     return response.choices[0].message['content']
 
+def calcular_promedio_y_estado(respuesta_ia):
+    match = re.search(r"promedio\s*final.*?=\s*(\d+(?:[.,]\d+)?)", respuesta_ia.lower())
+    promedio = 0.0
+    if match:
+        try:
+            promedio = float(match.group(1).replace(",", "."))
+            promedio = round(promedio, 2)
+            if not (0 <= promedio <= 10):
+                promedio = 0.0
+        except:
+            promedio = 0.0
+
+    estado = "aprobado_chatbot" if promedio >= 8 else "pendiente_aprobacion_chatbot"
+    return promedio, estado
+
+@metricas.cronometrar("chatbot_db_segundos")
 def upsert_pdf_data(user_identity, datos, respuesta_ia, hash_pdf):
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
+        esquema = asegurar_esquema()
+        with db_connection() as conn:
+            cur = conn.cursor()
 
-        print("🟢 Iniciando inserción de datos desde PDF...")
+            print("🟢 Iniciando inserción de datos desde PDF...")
 
-        # Asegurar campos del proyecto
-        campos_proyecto = [
-            "nombre_del_negocio", "problema_y_solucion", "mercado",
-            "competencia", "modelo_de_negocio", "escalabilidad"
-        ]
-        for campo in campos_proyecto:
-            datos[campo] = datos.get(campo, "") or ""
+            # Asegurar campos del proyecto
+            campos_proyecto = [
+                "nombre_del_negocio", "problema_y_solucion", "mercado",
+                "competencia", "modelo_de_negocio", "escalabilidad"
+            ]
+            for campo in campos_proyecto:
+                datos[campo] = datos.get(campo, "") or ""
 
-        # 1. Insertar en projects
-        cur.execute("""
-            INSERT INTO projects (
-                user_identity, nombre_del_negocio, problema_y_solucion,
-                mercado, competencia, modelo_de_negocio, escalabilidad
-            ) VALUES (%s, %s, %s, %s, %s, %s, %s)
-            RETURNING id_version;
-        """, (
-            user_identity,
-            datos["nombre_del_negocio"],
-            datos["problema_y_solucion"],
-            datos["mercado"],
-            datos["competencia"],
-            datos["modelo_de_negocio"],
-            datos["escalabilidad"]
-        ))
-        project_id = cur.fetchone()[0]
-        print("✅ Proyecto insertado. ID:", project_id)
-
-        # 2. Insertar en lider_proyecto
-        campos_lider = [
-            "nombres", "apellidos", "cedula", "facultad",
-            "carrera", "numero_de_telefono", "correo_electronico", "semestre_que_cursa"
-        ]
-        for campo in campos_lider:
-            datos[campo] = datos.get(campo, "") or ""
+            # 1. Insertar en projects
+            cur.execute("""
+                INSERT INTO projects (
+                    user_identity, nombre_del_negocio, problema_y_solucion,
+                    mercado, competencia, modelo_de_negocio, escalabilidad
+                ) VALUES (%s, %s, %s, %s, %s, %s, %s)
+                RETURNING id_version;
+            """, (
+                user_identity,
+                datos["nombre_del_negocio"],
+                datos["problema_y_solucion"],
+                datos["mercado"],
+                datos["competencia"],
+                datos["modelo_de_negocio"],
+                datos["escalabilidad"]
+            ))
+            project_id = cur.fetchone()[0]
+            print("✅ Proyecto insertado. ID:", project_id)
 
-        cur.execute("""
-            INSERT INTO lider_proyecto (
-                project_id_version, nombres, apellidos, cedula,
-                facultad, carrera, numero_telefono, correo_electronico, semestre_que_cursa
-            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s);
-        """, (
-            project_id,
-            datos["nombres"],
-            datos["apellidos"],
-            datos["cedula"],
-            datos["facultad"],
-            datos["carrera"],
-            datos["numero_de_telefono"],
-            datos["correo_electronico"],
-            datos["semestre_que_cursa"]
-        ))
-        print("✅ Líder del proyecto insertado.")
-
-        # 3. Insertar en integrantes_equipo
-        integrantes = datos.get("equipo_integrantes", [])
-        for integrante in integrantes:
-            for campo in ["nombres", "apellidos", "cedula", "rol", "funcion"]:
-                integrante[campo] = integrante.get(campo, "") or ""
+            # Otra petición simultánea del mismo usuario con este contenido ya lo registró: se descarta
+            # (ON CONFLICT espera a que esa transacción termine)
+            if esquema:
+                cur.execute("""
+                    INSERT INTO propiedad_pdf (user_identity, hash_pdf, project_id_version)
+                    VALUES (%s, %s, %s)
+                    ON CONFLICT (user_identity, hash_pdf) DO NOTHING
+                """, (user_identity, hash_pdf, project_id))
+                if cur.rowcount == 0:
+                    conn.rollback()
+                    cur.close()
+                    logging.info("📄 La propuesta ya estaba registrada para este usuario; no se duplica.")
+                    return
+
+            # 2. Insertar en lider_proyecto
+            campos_lider = [
+                "nombres", "apellidos", "cedula", "facultad",
+                "carrera", "numero_de_telefono", "correo_electronico", "semestre_que_cursa"
+            ]
+            for campo in campos_lider:
+                datos[campo] = datos.get(campo, "") or ""
 
             cur.execute("""
-                INSERT INTO integrantes_equipo (
-                    project_id_version, nombres, apellidos, cedula, rol, funcion
-                ) VALUES (%s, %s, %s, %s, %s, %s);
+                INSERT INTO lider_proyecto (
+                    project_id_version, nombres, apellidos, cedula,
+                    facultad, carrera, numero_telefono, correo_electronico, semestre_que_cursa
+                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s);
             """, (
                 project_id,
-                integrante["nombres"],
-                integrante["apellidos"],
-                integrante["cedula"],
-                integrante["rol"],
-                integrante["funcion"]
+                datos["nombres"],
+                datos["apellidos"],
+                datos["cedula"],
+                datos["facultad"],
+                datos["carrera"],
+                datos["numero_de_telefono"],
+                datos["correo_electronico"],
+                datos["semestre_que_cursa"]
             ))
-        print(f"✅ {len(integrantes)} integrantes insertados.")
+            print("✅ Líder del proyecto insertado.")
 
-        # 4. Extraer promedio de evaluación y estado
-        match = re.search(r"promedio\s*final.*?=\s*(\d+(?:[.,]\d+)?)", respuesta_ia.lower())
-        promedio = 0.0
-        if match:
-            try:
-                promedio = float(match.group(1).replace(",", "."))
-                promedio = round(promedio, 2)
-                if not (0 <= promedio <= 10):
-                    promedio = 0.0
-            except:
-                promedio = 0.0
+            # 3. Insertar en integrantes_equipo
+            integrantes = datos.get("equipo_integrantes", [])
+            for integrante in integrantes:
+                for campo in ["nombres", "apellidos", "cedula", "rol", "funcion"]:
+                    integrante[campo] = integrante.get(campo, "") or ""
 
-        estado = "aprobado_chatbot" if promedio >= 8 else "pendiente_aprobacion_chatbot"
+                cur.execute("""
+                    INSERT INTO integrantes_equipo (
+                        project_id_version, nombres, apellidos, cedula, rol, funcion
+                    ) VALUES (%s, %s, %s, %s, %s, %s);
+                """, (
+                    project_id,
+                    integrante["nombres"],
+                    integrante["apellidos"],
+                    integrante["cedula"],
+                    integrante["rol"],
+                    integrante["funcion"]
+                ))
+            print(f"✅ {len(integrantes)} integrantes insertados.")
+
+            # 4. Extraer promedio de evaluación y estado
+            promedio, estado = calcular_promedio_y_estado(respuesta_ia)
+
+            # 5. Insertar en evaluaciones
+            cur.execute("""
+                INSERT INTO evaluaciones (
+                    project_id_version, detalle, promedio_evaluacion, hash_pdf, proposal_status
+                ) VALUES (%s, %s, %s, %s, %s);
+            """, (
+                project_id,
+                respuesta_ia,
+                promedio,
+                hash_pdf,
+                estado
+            ))
+            print("✅ Evaluación insertada con promedio:", promedio, "y estado:", estado)
 
-        # 5. Insertar en evaluaciones
-        cur.execute("""
-            INSERT INTO evaluaciones (
-                project_id_version, detalle, promedio_evaluacion, hash_pdf, proposal_status
-            ) VALUES (%s, %s, %s, %s, %s);
-        """, (
-            project_id,
-            respuesta_ia,
-            promedio,
-            hash_pdf,
-            estado
-        ))
-        print("✅ Evaluación insertada con promedio:", promedio, "y estado:", estado)
-
-        conn.commit()
-        cur.close()
-        conn.close()
+            # 6. Contadores del reporte, en la misma transacción
+            resumen_evaluaciones.registrar(cur, user_identity, datos["facultad"], datos["carrera"], promedio, estado)
+            if esquema:
+                subir_version_contexto(cur, user_identity)
+
+            conn.commit()
+            cur.close()
+        invalidar_contexto_ampliado(user_identity)
+        resumen_evaluaciones.invalidar()
         print("✅ Todos los datos guardados correctamente.")
 
     except Exception as e:
         logging.error(f"❌ Error en upsert_pdf_data: {e}")
 
+@lru_cache(maxsize=4)
+def huella_referencia(reference_text):
+    return HuellaPlantilla(reference_text)
+
+def parser_plantilla():
+    return referencia_plantilla.parser()
+
+# Cuántas propuestas se extrajeron con el parser de la plantilla y cuántas con el LLM
+_vias_extraccion = {"plantilla": 0, "ia": 0}
+_vias_extraccion_lock = threading.Lock()
+
+def extraer_datos_propuesta(datos_pdf, texto, user_identity=None, tablas=None):
+    # 📋 Documentos que siguen la plantilla oficial se leen de sus tablas, sin llamar a OpenAI.
+    # tablas: las leídas junto con el texto; si no vienen (texto guardado en la subida) se extraen aquí
+    try:
+        if tablas is None:
+            tablas = extractor_pdf.extraer_tablas(datos_pdf)
+        datos = parser_plantilla().analizar(tablas)
+    except LimitePDFExcedido:
+        raise
+    except Exception as e:
+        logging.error(f"❌ Error leyendo las tablas de la plantilla: {e}")
+        datos = None
+
+    # Sin los datos del líder no hay certeza de haber leído bien la ficha: decide el LLM
+    if datos and all(datos.get(campo, "").strip() for campo in ("nombres", "apellidos", "cedula")):
+        via = "plantilla"
+    else:
+        datos = extraer_datos_structurados_desde_texto(texto, user_identity)
+        via = "ia"
+    with _vias_extraccion_lock:
+        _vias_extraccion[via] += 1
+    logging.info(f"🧾 Datos de la propuesta extraídos vía {via}")
+    return datos, via
+
 def compare_pdfs(reference_text, uploaded_text):
-    similarity = SequenceMatcher(None, reference_text, uploaded_text).ratio() * 100
+    # 🧬 La huella de la plantilla se calcula una vez; cada PDF se compara en tiempo lineal
+    similarity = huella_referencia(reference_text).similitud(uploaded_text)
     return 5 < similarity < 90
 
 def extract_text_from_pdf(pdf_file):
+    # 🧵 Se extrae en el pool de procesos, con límites de bytes, páginas y tiempo
     try:
-        with pdfplumber.open(pdf_file) as pdf:
-            texto = "\n".join(page.extract_text() or "" for page in pdf.pages).strip().lower()
-            return texto
+        return "\n".join(extractor_pdf.extraer_paginas(pdf_file)).strip().lower()
+    except LimitePDFExcedido:
+        raise
     except Exception as e:
         logging.error(f"❌ Error extrayendo texto del PDF: {e}")
         return ""
 
-def openai_IA(contexto):
+def extraer_texto_y_tablas_pdf(pdf_file):
+    # Como extract_text_from_pdf, pero con las tablas de la misma lectura (None si falló)
     try:
-        response = openai.ChatCompletion.create(
+        textos, tablas = extractor_pdf.extraer_texto_y_tablas(pdf_file)
+        return "\n".join(textos).strip().lower(), tablas
+    except LimitePDFExcedido:
+        raise
+    except Exception as e:
+        logging.error(f"❌ Error extrayendo texto del PDF: {e}")
+        return "", None
+
+def fragmentos_de_referencia(mensajes):
+    # Solo los fragmentos de documents/ relevantes para la última pregunta del usuario
+    pregunta = next((m["content"] for m in reversed(mensajes) if m.get("role") == "user"), "")
+    if not pregunta:
+        return None
+    try:
+        fragmentos = indice_documentos.buscar(pregunta)
+    except Exception as e:
+        logging.error(f"❌ Error buscando en el índice de documentos: {e}")
+        return None
+    if not fragmentos:
+        return None
+    contenido = "\n\n".join(f"[{f['documento']}]\n{f['texto']}" for f in fragmentos)
+    return {"role": "system", "content": f"📚 Información de referencia relevante para la pregunta:\n\n{contenido}"}
+
+@metricas.cronometrar("chatbot_etapa_segundos", etapa="contexto")
+def preparar_contexto_ia(user_identity):
+    # SYSTEM_PROMPT primero, luego la referencia recuperada y los mensajes recientes que caben en el presupuesto
+    mensajes = sesiones.obtener(user_identity) or []
+    referencia = fragmentos_de_referencia(mensajes)
+    contexto = recortar_contexto(
+        mensajes,
+        system_prompt=SYSTEM_PROMPT,
+        presupuesto_tokens=CONTEXT_TOKEN_BUDGET - (estimar_tokens(referencia) if referencia else 0),
+        max_mensajes=MAX_CONTEXT_LENGTH
+    )
+    if referencia:
+        contexto.insert(1 if SYSTEM_PROMPT else 0, referencia)
+    return contexto
+
+MENSAJE_LIMITE_IA = "⚠️ Se alcanzó el límite de velocidad de OpenAI. Intenta nuevamente en unos segundos."
+MENSAJE_ERROR_IA = "❌ Hubo un problema al procesar tu mensaje con la IA."
+
+def clave_pregunta_general(user_message):
+    # Clave de caché solo para preguntas que no dependen del usuario ni de la conversación y que
+    # tratan de lo que cubren los documentos de referencia; lo demás pasa por el contexto completo
+    if not FAQ_CACHE_ACTIVO or not user_message:
+        return None
+    recargar_reglas_si_cambiaron()
+    clave = normalizar_texto(user_message)
+    if not es_pregunta_general(clave):
+        return None
+    try:
+        return clave if indice_documentos.cobertura(clave) >= FAQ_CACHE_COBERTURA else None
+    except Exception as e:
+        logging.error(f"❌ Error consultando el índice de documentos: {e}")
+        return None
+
+@metricas.cronometrar("chatbot_etapa_segundos", etapa="contexto")
+def contexto_pregunta_general(pregunta):
+    # Sin historial del usuario: la respuesta sirve para cualquiera que pregunte lo mismo
+    mensajes = [{"role": "user", "content": pregunta}]
+    referencia = fragmentos_de_referencia(mensajes)
+    cabecera = [{"role": "system", "content": SYSTEM_PROMPT}] if SYSTEM_PROMPT else []
+    return cabecera + ([referencia] if referencia else []) + mensajes
+
+def responder_texto(user_identity, user_message):
+    clave = clave_pregunta_general(user_message)
+    if clave is None:
+        return openai_IA(preparar_contexto_ia(user_identity), user_identity)
+
+    # ⚡ Pregunta frecuente ya respondida: sin llamada a OpenAI
+    respuesta = cache_respuestas.obtener(clave)
+    if respuesta is None:
+        respuesta = openai_IA(contexto_pregunta_general(user_message), user_identity)
+        if respuesta not in (MENSAJE_LIMITE_IA, MENSAJE_ERROR_IA):
+            cache_respuestas.guardar(clave, respuesta)
+    return respuesta
+
+def preparar_turno_texto(user_identity, user_message):
+    # Parte síncrona de un turno de texto (BD, sesión, caché); devuelve (clave, respuesta cacheada, contexto)
+    asegurar_contexto(user_identity)
+    sesiones.agregar(user_identity, {'role': 'user', 'content': user_message})
+    guardar_mensaje(user_identity, 'user', user_message)
+    clave = clave_pregunta_general(user_message)
+    cacheada = cache_respuestas.obtener(clave) if clave else None
+    if cacheada is not None:
+        cerrar_turno_texto(user_identity, cacheada)
+        return clave, cacheada, None
+    contexto = contexto_pregunta_general(user_message) if clave else preparar_contexto_ia(user_identity)
+    return clave, None, contexto
+
+def cerrar_turno_texto(user_identity, respuesta, clave=None):
+    # Persiste la respuesta (aunque esté incompleta) y, si es una pregunta general, la cachea
+    if respuesta:
+        sesiones.agregar(user_identity, {'role': 'assistant', 'content': respuesta})
+        guardar_mensaje(user_identity, 'assistant', respuesta)
+    if clave and respuesta and respuesta not in (MENSAJE_LIMITE_IA, MENSAJE_ERROR_IA):
+        cache_respuestas.guardar(clave, respuesta)
+
+def openai_IA(contexto, user_identity=None):
+    try:
+        response = cliente_openai.completar(
+            contexto,
+            user_identity=user_identity,
             model=MODEL,
-            messages=contexto,
             temperature=0.4
         )
         return response.choices[0].message['content']
     except RateLimitError:
-        return "⚠️ Se alcanzó el límite de velocidad de OpenAI. Intenta nuevamente en unos segundos."
+        return MENSAJE_LIMITE_IA
     except Exception as e:
         logging.error(f"❌ Error en openai_IA: {e}")
-        return "❌ Hubo un problema al procesar tu mensaje con la IA."
+        return MENSAJE_ERROR_IA
+
+def openai_IA_stream(contexto, user_identity=None):
+    # Igual que openai_IA, pero entrega los fragmentos de texto a medida que llegan
+    flujo = None
+    try:
+        flujo = cliente_openai.completar_stream(
+            contexto,
+            user_identity=user_identity,
+            model=MODEL,
+            temperature=0.4
+        )
+        for chunk in flujo:
+            fragmento = chunk["choices"][0].get("delta", {}).get("content")
+            if fragmento:
+                yield fragmento
+    except RateLimitError:
+        yield MENSAJE_LIMITE_IA
+    except Exception as e:
+        logging.error(f"❌ Error en openai_IA_stream: {e}")
+        yield MENSAJE_ERROR_IA
+    finally:
+        # Cerrar la respuesta HTTP de OpenAI si el cliente se fue antes de terminar
+        if flujo is not None and hasattr(flujo, "close"):
+            flujo.close()
+
+def responder_historial(user_identity, user_message):
+    historial_textual = []
+    for item in cargar_contexto_ampliado(user_identity):
+        if item["role"] == "system":
+            historial_textual.append(item["content"])
+    return "\n\n".join(historial_textual[-5:]) or "⚠️ No encontré propuestas anteriores registradas."
+
+# 🧭 Intenciones que se responden sin el modelo (saludos, cómo enviar la propuesta, historial...)
+enrutador_intenciones = EnrutadorIntenciones(obtener_nombre=get_user_name)
+registrar_intenciones_base(enrutador_intenciones)
+# Verbo y objeto como palabras completas y seguidos; se tolera alguna palabra suelta ("quiero", "ahora")
+enrutador_intenciones.registrar("ver_propuestas", [
+    r"\b(puedo |quiero |deseo |me gustaria |puedes |podrias )?(ver|mostrar|mostrarme|muestrame|revisar|consultar)"
+    r"( (todas|todos|mis|mi|las|los|la|el))* (propuestas?|evaluaci(on|ones)|historial|proyectos?)"
+    r"( (enviad[oa]s?|anteriores|previas?|pasad[oa]s?|evaluad[oa]s?))?\b",
+    r"\b(mis|las) (propuestas|evaluaciones) (enviadas|anteriores|previas|pasadas)\b",
+    r"\bhistorial de (mis )?(propuestas|evaluaciones)\b",
+], responder_historial, umbral=0.75)
+
+def es_turno_de_texto(user_message, etapa, pdf_file):
+    # Turnos que pasan por el modelo; ping, registro de nombre, intenciones locales y PDF se resuelven aparte
+    return bool(user_message) and not pdf_file and user_message != "__ping__" and etapa != "nombre" \
+        and enrutador_intenciones.clasificar(user_message) is None
+
+def cargar_sesion(user_identity):
+    return cargar_historial_por_identity(user_identity) + cargar_contexto_ampliado(user_identity)
+
+def asegurar_contexto(user_identity):
+    # Cargar contexto si no existe en el almacén de sesiones
+    if sesiones.obtener(user_identity) is None:
+        sesiones.guardar(user_identity, cargar_sesion(user_identity))
+
+def evento_sse(datos, evento=None):
+    cabecera = f"event: {evento}\n" if evento else ""
+    return f"{cabecera}data: {json.dumps(datos, ensure_ascii=False)}\n\n"
+
+MENSAJE_FORMATO_INVALIDO = (
+    "📄 El archivo enviado no parece una propuesta válida. Por favor, descarga el formato oficial desde: "
+    f"{ENLACE_FORMATO_PROPUESTA}"
+)
+
+MENSAJE_PROPUESTA_INCOMPLETA = (
+    "❌ La propuesta está incompleta.\n\n"
+    "Para poder evaluarla, asegúrate de que el líder del proyecto tenga al menos:\n"
+    "- Nombres\n- Apellidos\n- Cédula\n\n"
+    "Por favor, corrige el documento y vuelve a intentarlo."
+)
+
+# Hilos para llamadas a OpenAI que corren en paralelo dentro de una misma petición
+IA_WORKERS = int(os.getenv("IA_WORKERS", "8"))
+_ejecutor_ia = None
+_ejecutor_ia_pid = None
+_ejecutor_ia_lock = threading.Lock()
+
+def obtener_ejecutor_ia():
+    global _ejecutor_ia, _ejecutor_ia_pid
+    # 🔁 Los hilos no sobreviven a un fork: cada proceso crea su propio ejecutor
+    with _ejecutor_ia_lock:
+        if _ejecutor_ia is None or _ejecutor_ia_pid != os.getpid():
+            _ejecutor_ia = ThreadPoolExecutor(max_workers=IA_WORKERS, thread_name_prefix="ia")
+            _ejecutor_ia_pid = os.getpid()
+        return _ejecutor_ia
+
+def generar_hash_bytes(datos_pdf):
+    return hashlib.sha256(datos_pdf).hexdigest()
+
+def _leer_evaluacion_cacheada(fila):
+    if not fila:
+        return None
+    datos = fila[1] if isinstance(fila[1], dict) else json.loads(fila[1])
+    return {"hash_pdf": fila[0], "datos": datos, "detalle": fila[2]}
+
+@metricas.cronometrar("chatbot_db_segundos")
+def buscar_evaluacion_por_bytes(hash_bytes):
+    if not asegurar_esquema():
+        return None
+    try:
+        with db_connection() as conn:
+            cur = conn.cursor()
+            cur.execute("""
+                SELECT c.hash_pdf, c.datos, c.detalle
+                FROM cache_pdf_bytes b
+                JOIN cache_evaluaciones_pdf c ON c.hash_pdf = b.hash_pdf
+                WHERE b.hash_bytes = %s
+            """, (hash_bytes,))
+            fila = cur.fetchone()
+            cur.close()
+        return _leer_evaluacion_cacheada(fila)
+    except Exception as e:
+        logging.error(f"❌ Error buscando PDF por hash de bytes: {e}")
+        return None
+
+@metricas.cronometrar("chatbot_db_segundos")
+def buscar_evaluacion_por_hash(hash_pdf):
+    if not asegurar_esquema():
+        return None
+    try:
+        with db_connection() as conn:
+            cur = conn.cursor()
+            cur.execute("""
+                SELECT hash_pdf, datos, detalle
+                FROM cache_evaluaciones_pdf
+                WHERE hash_pdf = %s
+            """, (hash_pdf,))
+            fila = cur.fetchone()
+            cur.close()
+        return _leer_evaluacion_cacheada(fila)
+    except Exception as e:
+        logging.error(f"❌ Error buscando evaluación por hash de texto: {e}")
+        return None
+
+@metricas.cronometrar("chatbot_db_segundos")
+def guardar_evaluacion_cacheada(hash_pdf, hash_bytes, datos, detalle):
+    if not asegurar_esquema():
+        return
+    try:
+        with db_connection() as conn:
+            cur = conn.cursor()
+            if datos is not None:
+                cur.execute("""
+                    INSERT INTO cache_evaluaciones_pdf (hash_pdf, datos, detalle)
+                    VALUES (%s, %s, %s)
+                    ON CONFLICT (hash_pdf) DO NOTHING
+                """, (hash_pdf, Json(datos), detalle))
+            cur.execute("""
+                INSERT INTO cache_pdf_bytes (hash_bytes, hash_pdf)
+                VALUES (%s, %s)
+                ON CONFLICT (hash_bytes) DO NOTHING
+            """, (hash_bytes, hash_pdf))
+            conn.commit()
+            cur.close()
+    except Exception as e:
+        logging.error(f"❌ Error guardando evaluación en caché: {e}")
+
+@metricas.cronometrar("chatbot_db_segundos")
+def buscar_texto_pdf(hash_bytes):
+    if not asegurar_esquema():
+        return None
+    try:
+        with db_connection() as conn:
+            cur = conn.cursor()
+            cur.execute("SELECT texto FROM texto_pdf_bytes WHERE hash_bytes = %s", (hash_bytes,))
+            fila = cur.fetchone()
+            cur.close()
+        return fila[0] if fila else None
+    except Exception as e:
+        logging.error(f"❌ Error buscando el texto guardado del PDF: {e}")
+        return None
+
+@metricas.cronometrar("chatbot_db_segundos")
+def guardar_texto_pdf(hash_bytes, texto):
+    if not asegurar_esquema():
+        return
+    try:
+        with db_connection() as conn:
+            cur = conn.cursor()
+            cur.execute("""
+                INSERT INTO texto_pdf_bytes (hash_bytes, texto)
+                VALUES (%s, %s)
+                ON CONFLICT (hash_bytes) DO NOTHING
+            """, (hash_bytes, texto))
+            conn.commit()
+            cur.close()
+    except Exception as e:
+        logging.error(f"❌ Error guardando el texto del PDF: {e}")
+
+def extraer_texto_subida(hash_bytes, ruta):
+    # PDF recibido por /api/upload: se abre una vez y el texto sirve al índice y a una evaluación posterior
+    if not ruta.lower().endswith(".pdf"):
+        return None
+    try:
+        texto = "\n".join(extractor_pdf.extraer_paginas(ruta))
+    except Exception as e:
+        logging.error(f"❌ Error extrayendo texto del PDF subido: {e}")
+        return None
+    guardar_texto_pdf(hash_bytes, texto)
+    return texto
+
+@metricas.cronometrar("chatbot_db_segundos")
+def buscar_evaluacion_de_usuario(user_identity, hash_pdf):
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT e.detalle
+            FROM evaluaciones e
+            JOIN projects p ON p.id_version = e.project_id_version
+            WHERE p.user_identity = %s AND e.hash_pdf = %s
+            ORDER BY e.created_at DESC
+            LIMIT 1
+        """, (user_identity, hash_pdf))
+        row = cur.fetchone()
+        cur.close()
+    return row[0] if row else None
+
+@metricas.cronometrar("chatbot_db_segundos")
+def cargar_evaluacion_de_usuario(user_identity, hash_pdf):
+    # La evaluación previa con los datos de su proyecto, en la forma de cache_evaluaciones_pdf
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT e.detalle, p.id_version, p.nombre_del_negocio, p.problema_y_solucion, p.mercado,
+                   p.competencia, p.modelo_de_negocio, p.escalabilidad,
+                   l.nombres, l.apellidos, l.cedula, l.facultad, l.carrera, l.numero_telefono,
+                   l.correo_electronico, l.semestre_que_cursa
+            FROM evaluaciones e
+            JOIN projects p ON p.id_version = e.project_id_version
+            LEFT JOIN lider_proyecto l ON l.project_id_version = p.id_version
+            WHERE p.user_identity = %s AND e.hash_pdf = %s
+            ORDER BY e.created_at DESC
+            LIMIT 1
+        """, (user_identity, hash_pdf))
+        fila = cur.fetchone()
+        if fila is None:
+            cur.close()
+            return None
+        cur.execute("""
+            SELECT nombres, apellidos, cedula, rol, funcion
+            FROM integrantes_equipo
+            WHERE project_id_version = %s
+        """, (fila[1],))
+        integrantes = cur.fetchall()
+        cur.close()
+    campos = (
+        "nombre_del_negocio", "problema_y_solucion", "mercado", "competencia", "modelo_de_negocio",
+        "escalabilidad", "nombres", "apellidos", "cedula", "facultad", "carrera", "numero_de_telefono",
+        "correo_electronico", "semestre_que_cursa"
+    )
+    datos = {campo: valor or "" for campo, valor in zip(campos, fila[2:])}
+    datos["equipo_integrantes"] = [
+        dict(zip(("nombres", "apellidos", "cedula", "rol", "funcion"), (v or "" for v in integrante)))
+        for integrante in integrantes
+    ]
+    return {"hash_pdf": hash_pdf, "datos": datos, "detalle": fila[0]}
+
+@metricas.cronometrar("chatbot_db_segundos")
+def buscar_proyecto_por_hash(hash_pdf):
+    # Proyecto que registró primero este contenido, sea del usuario que sea
+    with db_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT project_id_version
+            FROM evaluaciones
+            WHERE hash_pdf = %s
+            ORDER BY created_at ASC
+            LIMIT 1
+        """, (hash_pdf,))
+        row = cur.fetchone()
+        cur.close()
+    return row[0] if row else None
+
+def entregar_evaluacion_cacheada(user_identity, cacheada, conversacion=True, reutilizada=True,
+                                 reutilizar_proyecto=False, etapas=None):
+    # El resultado del LLM es compartido, pero la propiedad (projects/evaluaciones) es por usuario
+    previa = buscar_evaluacion_de_usuario(user_identity, cacheada["hash_pdf"])
+    if previa:
+        logging.info("📄 Reutilizando evaluación previa por hash.")
+        if conversacion:
+            guardar_mensaje(user_identity, 'assistant', previa)
+        return previa
+
+    # Evaluación por lotes: si un estudiante ya envió este contenido no se crea otro proyecto a nombre del lote
+    if reutilizar_proyecto:
+        proyecto = buscar_proyecto_por_hash(cacheada["hash_pdf"])
+        if proyecto is not None:
+            logging.info(f"♻️ La propuesta ya está registrada (proyecto #{proyecto}); no se duplica.")
+            if etapas is not None:
+                etapas["proyecto_existente"] = proyecto
+            return cacheada["detalle"]
+
+    if reutilizada:
+        logging.info("♻️ Reutilizando evaluación de la caché global para un nuevo usuario.")
+    upsert_pdf_data(user_identity, copy.deepcopy(cacheada["datos"]), cacheada["detalle"], cacheada["hash_pdf"])
+    if conversacion:
+        sesiones.agregar(user_identity, {'role': 'assistant', 'content': cacheada["detalle"]})
+        guardar_mensaje(user_identity, 'assistant', cacheada["detalle"])
+    return cacheada["detalle"]
+
+# ⏱️ Tiempo por etapa en milisegundos, acumulado en el dict que pase quien llama
+@contextmanager
+def medir_etapa(etapas, nombre):
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        duracion = time.perf_counter() - inicio
+        metricas.observar("chatbot_etapa_segundos", duracion, etapa=nombre)
+        if etapas is not None:
+            etapas[nombre] = round(etapas.get(nombre, 0) + duracion * 1000, 1)
+
+# 🛬 Una evaluación por PDF a la vez: en este proceso (vuelos_pdf) y entre workers (reservas_pdf)
+vuelos_pdf = VueloUnico()
+reservas_pdf = ReservasPDF()
+
+# conversacion=False (evaluación por lotes): no se escribe en la sesión ni en el historial del chat
+# reutilizar_proyecto=True: si otro usuario ya registró el mismo contenido, no se crea un proyecto nuevo
+def procesar_propuesta_pdf(user_identity, pdf_file, etapas=None, conversacion=True, reutilizar_proyecto=False):
+    with medir_etapa(etapas, "lectura"):
+        datos_pdf = extractor_pdf.leer_bytes(pdf_file)
+        # El SHA-256 de una subida ya se calculó mientras llegaba el archivo
+        hash_bytes = digest_subida(pdf_file) or generar_hash_bytes(datos_pdf)
+
+    # ⚡ Mismo archivo ya evaluado (por cualquier usuario): no se abre el PDF
+    with medir_etapa(etapas, "cache"):
+        cacheada = buscar_evaluacion_por_bytes(hash_bytes)
+    if cacheada:
+        with medir_etapa(etapas, "guardado"):
+            return entregar_evaluacion_cacheada(user_identity, cacheada, conversacion,
+                                                reutilizar_proyecto=reutilizar_proyecto, etapas=etapas)
+
+    # 🛬 Envíos idénticos simultáneos (doble clic, reintento): se evalúa una vez y el resto toma el resultado
+    resultado, propio = vuelos_pdf.ejecutar(
+        hash_bytes, lambda: evaluar_contenido_pdf(user_identity, datos_pdf, hash_bytes, etapas)
+    )
+    if "mensaje" in resultado:
+        return resultado["mensaje"]
+    # El dueño de una evaluación previa la recibe tal cual; los demás usuarios, una copia en su proyecto
+    with medir_etapa(etapas, "guardado"):
+        return entregar_evaluacion_cacheada(user_identity, resultado, conversacion, reutilizada=not propio,
+                                            reutilizar_proyecto=reutilizar_proyecto, etapas=etapas)
+
+def evaluar_contenido_pdf(user_identity, datos_pdf, hash_bytes, etapas=None):
+    # {"mensaje"} o la evaluación compartida {"hash_pdf", "datos", "detalle"}
+    # Otro worker puede estar evaluando el mismo archivo: se espera a que lo deje en la caché
+    while not reservas_pdf.reservar(hash_bytes):
+        with medir_etapa(etapas, "espera_vuelo"):
+            cacheada = reservas_pdf.esperar(hash_bytes, lambda: buscar_evaluacion_por_bytes(hash_bytes))
+        if cacheada:
+            return cacheada
+    try:
+        return _evaluar_contenido_pdf(user_identity, datos_pdf, hash_bytes, etapas)
+    finally:
+        reservas_pdf.liberar(hash_bytes)
+
+def _evaluar_contenido_pdf(user_identity, datos_pdf, hash_bytes, etapas):
+    with medir_etapa(etapas, "extraccion_texto"):
+        # Un PDF que ya pasó por /api/upload trae su texto guardado con el mismo SHA-256
+        texto_guardado = buscar_texto_pdf(hash_bytes)
+        if texto_guardado is not None:
+            uploaded_text, tablas = texto_guardado.strip().lower(), None
+            logging.info("📄 Texto del PDF tomado de la subida previa; no se vuelve a extraer.")
+        else:
+            # Texto y tablas en una pasada: el parser de la plantilla no vuelve a abrir el PDF
+            uploaded_text, tablas = extraer_texto_y_tablas_pdf(datos_pdf)
+    logging.debug(f"📄 Texto extraído del PDF:\n{uploaded_text[:1000]}...")
+    with medir_etapa(etapas, "similitud"):
+        formato_valido = compare_pdfs(referencia_plantilla.texto(), uploaded_text)
+    if not formato_valido:
+        return {"mensaje": MENSAJE_FORMATO_INVALIDO}
+
+    hash_pdf = generar_hash_pdf(uploaded_text)
+
+    # Mismo contenido normalizado con otros bytes (p. ej. reexportado)
+    with medir_etapa(etapas, "cache"):
+        cacheada = buscar_evaluacion_por_hash(hash_pdf)
+    if cacheada:
+        with medir_etapa(etapas, "guardado"):
+            guardar_evaluacion_cacheada(hash_pdf, hash_bytes, None, None)
+        return cacheada
+
+    # Ya evaluado por este usuario antes de la caché global: se guarda en ella con los datos de su
+    # proyecto, así los envíos simultáneos de otros usuarios lo reciben sin volver a llamar al LLM
+    with medir_etapa(etapas, "cache"):
+        previa = cargar_evaluacion_de_usuario(user_identity, hash_pdf)
+    if previa:
+        with medir_etapa(etapas, "guardado"):
+            guardar_evaluacion_cacheada(hash_pdf, hash_bytes, previa["datos"], previa["detalle"])
+        return previa
+
+    # 🚀 Extraer datos y evaluar propuesta en paralelo: son dos llamadas independientes
+    inicio_ia = time.perf_counter()
+    # El hilo del ejecutor hereda el contexto (request-id en los logs)
+    futuro_evaluacion = obtener_ejecutor_ia().submit(
+        contextvars.copy_context().run, evaluar_propuesta_con_ia, uploaded_text, user_identity
+    )
+    try:
+        with medir_etapa(etapas, "extraccion_datos"):
+            datos_extraidos, via_extraccion = extraer_datos_propuesta(
+                datos_pdf, uploaded_text, user_identity, tablas
+            )
+        if etapas is not None:
+            etapas["via_extraccion"] = via_extraccion
+    except Exception:
+        futuro_evaluacion.cancel()
+        raise
+    logging.debug(f"🧾 JSON extraído del PDF:\n{json.dumps(datos_extraidos, indent=2, ensure_ascii=False)}")
+
+    if not all([
+        datos_extraidos.get("nombres", "").strip(),
+        datos_extraidos.get("apellidos", "").strip(),
+        datos_extraidos.get("cedula", "").strip()
+    ]):
+        # Si la evaluación ya empezó no se puede interrumpir; su resultado se descarta
+        futuro_evaluacion.cancel()
+        return {"mensaje": MENSAJE_PROPUESTA_INCOMPLETA}
+
+    respuesta_evaluacion = futuro_evaluacion.result()
+    # Ambas llamadas corren a la vez: este es el tiempo total de la fase de IA
+    duracion_ia = time.perf_counter() - inicio_ia
+    metricas.observar("chatbot_etapa_segundos", duracion_ia, etapa="ia_evaluacion")
+    if etapas is not None:
+        etapas["ia_evaluacion"] = round(duracion_ia * 1000, 1)
+    # En la caché antes de liberar la reserva: los otros workers la encuentran al sondear
+    with medir_etapa(etapas, "guardado"):
+        guardar_evaluacion_cacheada(hash_pdf, hash_bytes, datos_extraidos, respuesta_evaluacion)
+    return {"hash_pdf": hash_pdf, "datos": datos_extraidos, "detalle": respuesta_evaluacion}
+
+# 🗂️ Evaluaciones en segundo plano: la subida devuelve un job_id y se consulta después
+cola_trabajos = ColaTrabajos(procesar_propuesta_pdf)
+
+_servicios_pid = None
+_servicios_lock = threading.Lock()
+
+def iniciar_servicios():
+    # Hilos de fondo del servidor, una vez por proceso. Importar api.chat no arranca nada: los procesos
+    # extractores de PDF (forkserver/spawn) reimportan el módulo principal y no deben retomar trabajos
+    global _servicios_pid
+    with _servicios_lock:
+        if _servicios_pid == os.getpid():
+            return
+        _servicios_pid = os.getpid()
+    # 📚 Índice de documents/: se carga del disco y solo se reindexa lo nuevo o modificado
+    indice_documentos.sincronizar_en_segundo_plano()
+    cola_trabajos.reanudar_si_hay_pendientes()
 
 @chat_blueprint.route('/usuarios/<user_identity>', methods=['DELETE'])
 def eliminar_usuario(user_identity):
     try:
         user_identity = request.view_args['user_identity']
-        conn = get_db_connection()
-        cur = conn.cursor()
+        with db_connection() as conn:
+            cur = conn.cursor()
 
-        cur.execute("DELETE FROM users WHERE identity = %s", (user_identity,))
-        conn.commit()
+            resumidor_historial.eliminar(cur, user_identity)
+            cur.execute("DELETE FROM users WHERE identity = %s", (user_identity,))
+            if asegurar_esquema():
+                subir_version_contexto(cur, user_identity)
+            conn.commit()
 
-        cur.close()
-        conn.close()
+            cur.close()
+        invalidar_contexto_ampliado(user_identity)
+        sesiones.eliminar(user_identity)
         logging.info(f"🗑️ Usuario eliminado: {user_identity}")
         return jsonify({"success": True, "message": "Usuario eliminado"}), 200
     except Exception as e:
         logging.error(f"❌ Error eliminando usuario: {e}")
         return jsonify({"success": False, "message": "Error eliminando usuario"}), 500
 
+# 📊 Estadísticas de cada componente: en JSON en /api/db/estado y como gauges en /metrics
+COMPONENTES_ESTADO = {
+    "pool": db_pool.estadisticas,
+    "historial_diferido": escritor_historial.estadisticas,
+    "sesiones": sesiones.estadisticas,
+    "trabajos": cola_trabajos.estadisticas,
+    "openai": cliente_openai.estadisticas,
+    "indice_documentos": indice_documentos.estadisticas,
+    "resumenes": resumidor_historial.estadisticas,
+    "cache_respuestas": cache_respuestas.estadisticas,
+    "extraccion_datos": lambda: dict(_vias_extraccion),
+    "extraccion_pdf": extractor_pdf.estadisticas,
+    "referencia": referencia_plantilla.estadisticas,
+    "almacen_documentos": almacen_documentos.estadisticas,
+    "analitica": resumen_evaluaciones.estadisticas,
+    "intenciones": enrutador_intenciones.estadisticas,
+    "vuelos_pdf": vuelos_pdf.estadisticas,
+    "reservas_pdf": reservas_pdf.estadisticas,
+}
+for _componente, _estadisticas in COMPONENTES_ESTADO.items():
+    metricas.registrar_estado(_componente, _estadisticas)
+
+@chat_blueprint.route('/db/estado', methods=['GET'])
+def estado_db():
+    return jsonify({componente: estadisticas() for componente, estadisticas in COMPONENTES_ESTADO.items()})
+
+@chat_blueprint.route('/trabajos/<job_id>', methods=['GET'])
+def estado_trabajo(job_id):
+    try:
+        trabajo = cola_trabajos.obtener(job_id)
+    except Exception as e:
+        logging.error(f"❌ Error consultando trabajo {job_id}: {e}")
+        return jsonify({"response": "Error interno del servidor"}), 500
+    if trabajo is None:
+        return jsonify({"response": "⚠️ No existe el trabajo solicitado.", "status": "desconocido"}), 404
+    return jsonify(trabajo)
+
+
+# 📊 Reporte de evaluaciones (totales, por facultad y por carrera) con filtro opcional desde/hasta
+@chat_blueprint.route('/analitica/evaluaciones', methods=['GET'])
+def analitica_evaluaciones():
+    try:
+        desde = leer_fecha(request.args.get("desde"))
+        hasta = leer_fecha(request.args.get("hasta"))
+    except ValueError:
+        return jsonify({"response": "⚠️ Las fechas deben tener el formato AAAA-MM-DD."}), 400
+    try:
+        return jsonify(resumen_evaluaciones.reporte(desde, hasta))
+    except Exception as e:
+        logging.error(f"❌ Error generando el reporte de evaluaciones: {e}")
+        return jsonify({"response": "Error interno del servidor"}), 500
+
+# 📜 Historial paginado: JSON por páginas o, con formato=ndjson, todas las páginas en streaming
+@chat_blueprint.route('/historial/<user_identity>', methods=['GET'])
+def historial_usuario(user_identity):
+    try:
+        limite = min(max(int(request.args.get("limite", HISTORIAL_LIMITE)), 1), HISTORIAL_PAGINA_MAX)
+        antes = decodificar_cursor(request.args["antes"]) if request.args.get("antes") else None
+    except (ValueError, TypeError):
+        return jsonify({"response": "⚠️ Parámetros de paginación inválidos."}), 400
+
+    if CHAT_HISTORY_WRITE_BEHIND and escritor_historial.pendientes(user_identity):
+        escritor_historial.flush()
+
+    if request.args.get("formato") == "ndjson":
+        def generar(cursor):
+            # Cada página usa y devuelve su propia conexión: un cliente lento no retiene el pool
+            while True:
+                mensajes, siguiente = cargar_pagina_historial(user_identity, HISTORIAL_PAGINA_MAX, cursor)
+                for mensaje in mensajes:
+                    yield json.dumps(mensaje, ensure_ascii=False) + "\n"
+                if not siguiente:
+                    return
+                cursor = decodificar_cursor(siguiente)
+
+        return Response(stream_with_context(generar(antes)), mimetype="application/x-ndjson")
+
+    try:
+        mensajes, siguiente = cargar_pagina_historial(user_identity, limite, antes)
+    except Exception as e:
+        logging.error(f"❌ Error cargando página de historial: {e}")
+        return jsonify({"response": "Error interno del servidor"}), 500
+    return jsonify({"mensajes": mensajes, "siguiente": siguiente})
 
 @chat_blueprint.route('/chat', methods=['POST'])
 def chat():
@@ -468,7 +1286,6 @@ def chat():
         if user_message == "__ping__":
             historial = cargar_historial_por_identity(user_identity)
             contexto_bd = cargar_contexto_ampliado(user_identity)
-            user_contexts[user_identity] = historial + contexto_bd
 
             saludo = (
                 f"¡Hola de nuevo, {user_name}! 👋\n\n"
@@ -479,7 +1296,7 @@ def chat():
                 "_Estoy listo para ayudarte 😊_"
             ) if user_name else "👋 ¡Hola! Antes de continuar, por favor ingresa tu nombre completo:"
 
-            user_contexts[user_identity].append({"role": "assistant", "content": saludo})
+            sesiones.guardar(user_identity, historial + contexto_bd + [{"role": "assistant", "content": saludo}])
             guardar_mensaje(user_identity, "assistant", saludo)
             return jsonify({"response": saludo, "nombre": user_name} if user_name else {"response": saludo})
 
@@ -494,104 +1311,107 @@ def chat():
                 "➡️  *Subir tu propuesta en PDF para que la analice y la evalúe con criterios técnicos📄*\n\n"
                 "_¿Con qué te gustaría empezar?_"
             )
-            user_contexts.setdefault(user_identity, []).append({"role": "assistant", "content": saludo})
+            sesiones.agregar(user_identity, {"role": "assistant", "content": saludo})
             guardar_mensaje(user_identity, "assistant", saludo)
             return jsonify({"response": saludo})
 
-        # Cargar contexto si no existe en memoria
-        if user_identity not in user_contexts:
-            user_contexts[user_identity] = cargar_historial_por_identity(user_identity)
-            user_contexts[user_identity].extend(cargar_contexto_ampliado(user_identity))
-
-        # Mostrar historial de propuestas/evaluaciones
-        if re.search(r"(ver|mostrar|revisar|consultar).*(propuesta|evaluación|historial|enviad)", user_message.lower()):
-            historial_textual = []
-            for item in cargar_contexto_ampliado(user_identity):
-                if item["role"] == "system":
-                    historial_textual.append(item["content"])
-            respuesta_historial = "\n\n".join(historial_textual[-5:]) or "⚠️ No encontré propuestas anteriores registradas."
-            user_contexts[user_identity].append({"role": "assistant", "content": respuesta_historial})
-            guardar_mensaje(user_identity, 'assistant', respuesta_historial)
-            return jsonify({"response": respuesta_historial})
+        asegurar_contexto(user_identity)
+
+        # 🧭 Intenciones locales (saludo, cómo enviar, historial de propuestas...): sin llamar al modelo
+        respuesta_local = enrutador_intenciones.resolver(user_identity, user_message) if user_message and not pdf_file else None
+        if respuesta_local is not None:
+            sesiones.agregar(user_identity, {'role': 'user', 'content': user_message})
+            guardar_mensaje(user_identity, 'user', user_message)
+            sesiones.agregar(user_identity, {"role": "assistant", "content": respuesta_local})
+            guardar_mensaje(user_identity, 'assistant', respuesta_local)
+            return jsonify({"response": respuesta_local})
 
         # 📄 Procesamiento de PDF
         if pdf_file and pdf_file.filename.endswith(".pdf"):
+            # modo del cliente ("trabajo" / "directo"); sin él decide PDF_JOB_MODE
+            modo = request.form.get("modo", "").strip().lower()
+            if modo == "trabajo" or (PDF_JOB_MODE and modo != "directo"):
+                try:
+                    job_id = cola_trabajos.encolar(user_identity, extractor_pdf.leer_bytes(pdf_file), pdf_file.filename)
+                except LimitePDFExcedido as e:
+                    return jsonify({"response": str(e)})
+                return jsonify({
+                    "response": "⏳ Recibí tu propuesta. La estoy evaluando, te aviso en cuanto esté lista.",
+                    "job_id": job_id,
+                    "status": "pendiente"
+                }), 202
             try:
-                uploaded_text = extract_text_from_pdf(pdf_file)
-                logging.debug(f"📄 Texto extraído del PDF:\n{uploaded_text[:1000]}...")
-                if not compare_pdfs(REFERENCE_TEXT, uploaded_text):
-                    return jsonify({"response": (
-                        "📄 El archivo enviado no parece una propuesta válida. Por favor, descarga el formato oficial desde: "
-                        "<a href='https://www.dropbox.com/scl/fi/zuibj62g5wjsdzcovf4pb/FICHA-DE-EMPRENDORES_NOMBRE-NEGOCIO.docx?rlkey=sec681vbpcthobyjvzqacs084&st=a6actt9m&dl=0' target='_blank'>Formato Propuesta WORD</a>"
-                    )})
-
-                hash_pdf = generar_hash_pdf(uploaded_text)
-
-                # Verificar si ya fue evaluado
-                conn = get_db_connection()
-                cur = conn.cursor()
-                cur.execute("""
-                    SELECT e.detalle
-                    FROM evaluaciones e
-                    JOIN projects p ON p.id_version = e.project_id_version
-                    WHERE p.user_identity = %s AND e.hash_pdf = %s
-                    ORDER BY e.created_at DESC
-                    LIMIT 1
-                """, (user_identity, hash_pdf))
-                row = cur.fetchone()
-                cur.close()
-                conn.close()
-
-                if row:
-                    logging.info("📄 Reutilizando evaluación previa por hash.")
-                    guardar_mensaje(user_identity, 'assistant', row[0])
-                    return jsonify({"response": row[0]})
-
-                # Extraer datos y evaluar propuesta
-                datos_extraidos = extraer_datos_structurados_desde_texto(uploaded_text)
-                logging.debug(f"🧾 JSON extraído del PDF:\n{json.dumps(datos_extraidos, indent=2, ensure_ascii=False)}")
-
-                if not all([
-                    datos_extraidos.get("nombres", "").strip(),
-                    datos_extraidos.get("apellidos", "").strip(),
-                    datos_extraidos.get("cedula", "").strip()
-                ]):
-                    return jsonify({
-                        "response": (
-                            "❌ La propuesta está incompleta.\n\n"
-                            "Para poder evaluarla, asegúrate de que el líder del proyecto tenga al menos:\n"
-                            "- Nombres\n- Apellidos\n- Cédula\n\n"
-                            "Por favor, corrige el documento y vuelve a intentarlo."
-                        )
-                    })
-
-                respuesta_evaluacion = evaluar_propuesta_con_ia(uploaded_text)
-                upsert_pdf_data(user_identity, datos_extraidos, respuesta_evaluacion, hash_pdf)
-                user_contexts[user_identity].append({'role': 'assistant', 'content': respuesta_evaluacion})
-                guardar_mensaje(user_identity, 'assistant', respuesta_evaluacion)
-
-                return jsonify({"response": respuesta_evaluacion})
-
+                return jsonify({"response": procesar_propuesta_pdf(user_identity, pdf_file)})
             except Exception as e:
                 logging.error(f"❌ Error procesando PDF: {e}")
                 return jsonify({"response": f"Error procesando PDF: {str(e)}"})
 
         # 🧠 Procesamiento de texto normal
         if user_message:
-            user_contexts[user_identity].append({'role': 'user', 'content': user_message})
+            sesiones.agregar(user_identity, {'role': 'user', 'content': user_message})
             guardar_mensaje(user_identity, 'user', user_message)
 
-        # Añadir el SYSTEM_PROMPT si aún no está
-        if SYSTEM_PROMPT and not any(m['role'] == 'system' for m in user_contexts[user_identity]):
-            user_contexts[user_identity].insert(0, {'role': 'system', 'content': SYSTEM_PROMPT})
-
-        respuesta = openai_IA(user_contexts[user_identity])
-        user_contexts[user_identity].append({'role': 'assistant', 'content': respuesta})
+        respuesta = responder_texto(user_identity, user_message)
+        sesiones.agregar(user_identity, {'role': 'assistant', 'content': respuesta})
         guardar_mensaje(user_identity, 'assistant', respuesta)
 
         return jsonify({"response": respuesta})
 
+    except RequestEntityTooLarge:
+        return jsonify({"response": request.limite_archivo()[1]}), 413
     except Exception as e:
         logging.error(f"❌ Error general en /chat: {str(e)}")
         return jsonify({"response": "Error interno del servidor"}), 500
 
+
+# 📡 Variante con Server-Sent Events: los turnos de texto se envían token a token
+@chat_blueprint.route('/chat/stream', methods=['POST'])
+def chat_stream():
+    user_identity = request.form.get("user_id") or request.form.get("identity") or "default_user"
+    user_message = request.form.get("message", "").strip()
+    etapa = request.form.get("etapa", "").strip().lower()
+    pdf_file = request.files.get("pdf")
+
+    cabeceras = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+    # Ping, registro de nombre, historial y PDF responden de una vez con la lógica de /chat
+    if not es_turno_de_texto(user_message, etapa, pdf_file):
+        resultado = chat()
+        respuesta, status = resultado if isinstance(resultado, tuple) else (resultado, 200)
+        return Response(
+            evento_sse(respuesta.get_json(), "done"),
+            status=status,
+            mimetype="text/event-stream",
+            headers=cabeceras
+        )
+
+    try:
+        clave, cacheada, contexto = preparar_turno_texto(user_identity, user_message)
+        if cacheada is not None:
+            return Response(evento_sse({"response": cacheada}, "done"), mimetype="text/event-stream", headers=cabeceras)
+    except Exception as e:
+        logging.error(f"❌ Error general en /chat/stream: {str(e)}")
+        return Response(
+            evento_sse({"response": "Error interno del servidor"}, "done"),
+            status=500,
+            mimetype="text/event-stream",
+            headers=cabeceras
+        )
+
+    def generar():
+        partes = []
+        terminado = False
+        try:
+            for fragmento in openai_IA_stream(contexto, user_identity):
+                partes.append(fragmento)
+                yield evento_sse({"delta": fragmento})
+            terminado = True
+        finally:
+            # Se persiste lo generado aunque el cliente se haya desconectado a mitad
+            respuesta = "".join(partes)
+            if not terminado:
+                logging.info(f"🔌 Cliente desconectado durante el streaming ({user_identity})")
+            cerrar_turno_texto(user_identity, respuesta, clave if terminado else None)
+        yield evento_sse({"response": respuesta}, "done")
+
+    return Response(stream_with_context(generar()), mimetype="text/event-stream", headers=cabeceras)
@@ -0,0 +1,274 @@
+import os
+import io
+import json
+import time
+import asyncio
+import logging
+import contextvars
+from contextlib import aclosing
+from concurrent.futures import ThreadPoolExecutor
+
+import openai
+from openai.error import RateLimitError
+from werkzeug.wrappers import Request
+from dotenv import load_dotenv
+
+from api.db import DB_POOL_MAX
+from api.chat import (
+    MODEL, MENSAJE_LIMITE_IA, MENSAJE_ERROR_IA,
+    es_turno_de_texto, preparar_turno_texto, cerrar_turno_texto, evento_sse, iniciar_servicios
+)
+from api.cliente_openai import cliente_openai
+from api.metricas import metricas, nuevo_request_id, request_id_actual
+
+load_dotenv()
+
+# Hilos para la parte síncrona de cada turno (BD, sesiones, búsqueda); no tiene sentido superar el pool
+ASGI_DB_WORKERS = int(os.getenv("ASGI_DB_WORKERS", str(DB_POOL_MAX)))
+# Un turno de texto es un formulario pequeño; cuerpos mayores (PDF) van directo a Flask sin leerse aquí
+ASGI_CUERPO_TEXTO_MAX = int(os.getenv("ASGI_CUERPO_TEXTO_MAX", str(64 * 1024)))
+
+# Rutas de chat_blueprint que se atienden de forma asíncrona -> endpoint de Flask (misma etiqueta en /metrics)
+RUTAS_ASINCRONAS = {"/api/chat": "chat.chat", "/api/chat/stream": "chat.chat_stream"}
+CABECERAS_SSE = [(b"cache-control", b"no-cache"), (b"x-accel-buffering", b"no")]
+
+
+async def aopenai_IA(contexto, user_identity=None):
+    try:
+        response = await cliente_openai.acompletar(
+            contexto,
+            user_identity=user_identity,
+            model=MODEL,
+            temperature=0.4
+        )
+        return response.choices[0].message['content']
+    except RateLimitError:
+        return MENSAJE_LIMITE_IA
+    except Exception as e:
+        logging.error(f"❌ Error en aopenai_IA: {e}")
+        return MENSAJE_ERROR_IA
+
+
+async def aopenai_IA_stream(contexto, user_identity=None):
+    try:
+        flujo = await cliente_openai.acompletar_stream(
+            contexto,
+            user_identity=user_identity,
+            model=MODEL,
+            temperature=0.4
+        )
+        async with aclosing(flujo):
+            async for chunk in flujo:
+                fragmento = chunk["choices"][0].get("delta", {}).get("content")
+                if fragmento:
+                    yield fragmento
+    except RateLimitError:
+        yield MENSAJE_LIMITE_IA
+    except Exception as e:
+        logging.error(f"❌ Error en aopenai_IA_stream: {e}")
+        yield MENSAJE_ERROR_IA
+
+
+def _formulario(scope, cuerpo):
+    # Mismo parser que Flask: request.form y request.files se leen igual que en chat()
+    cabeceras = {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in scope["headers"]}
+    return Request({
+        "REQUEST_METHOD": scope["method"],
+        "PATH_INFO": scope["path"],
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "CONTENT_TYPE": cabeceras.get("content-type", ""),
+        "CONTENT_LENGTH": str(len(cuerpo)),
+        "SERVER_NAME": "asgi",
+        "SERVER_PORT": "0",
+        "wsgi.input": io.BytesIO(cuerpo),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+    })
+
+
+class ChatAsincrono:
+    # App ASGI: los turnos de texto de /api/chat y /api/chat/stream esperan a OpenAI sin ocupar un hilo;
+    # todo lo demás (ping, nombre, historial, PDF y el resto de rutas) sigue en Flask a través de `respaldo`
+    def __init__(self, respaldo, origenes_cors=(), hilos=ASGI_DB_WORKERS, cuerpo_max=ASGI_CUERPO_TEXTO_MAX):
+        self.respaldo = respaldo
+        self.origenes_cors = set(origenes_cors)
+        self.hilos = hilos
+        self.cuerpo_max = cuerpo_max
+        self._ejecutor = None
+        self._pid = None
+        self._sesion_http = None
+
+    def _obtener_ejecutor(self):
+        # 🔁 Cada worker (proceso) crea el suyo
+        if self._ejecutor is None or self._pid != os.getpid():
+            self._ejecutor = ThreadPoolExecutor(max_workers=self.hilos, thread_name_prefix="asgi-bd")
+            self._pid = os.getpid()
+        return self._ejecutor
+
+    async def en_hilo(self, funcion, *args):
+        # El hilo hereda el contexto (request-id en los logs)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._obtener_ejecutor(), contextvars.copy_context().run, funcion, *args)
+
+    async def _sesion(self):
+        # Una sesión aiohttp por worker: conexiones a OpenAI reutilizadas entre turnos
+        import aiohttp
+        if self._sesion_http is None or self._sesion_http.closed:
+            self._sesion_http = aiohttp.ClientSession()
+        return self._sesion_http
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            return await self._lifespan(receive, send)
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"] not in RUTAS_ASINCRONAS:
+            return await self.respaldo(scope, receive, send)
+
+        cuerpo, completo = await self._leer_cuerpo(receive)
+        if cuerpo is None:
+            return
+        if completo:
+            formulario = await self.en_hilo(_formulario, scope, cuerpo)
+            form = formulario.form
+            user_message = form.get("message", "").strip()
+            if es_turno_de_texto(user_message, form.get("etapa", "").strip().lower(), formulario.files.get("pdf")):
+                return await self._atender(scope, receive, send, form, user_message)
+        # No es un turno de texto: Flask recibe el cuerpo tal cual llegó
+        await self.respaldo(scope, self._repetir(cuerpo, completo, receive), send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            mensaje = await receive()
+            if mensaje["type"] == "lifespan.startup":
+                iniciar_servicios()
+                await send({"type": "lifespan.startup.complete"})
+            elif mensaje["type"] == "lifespan.shutdown":
+                if self._sesion_http is not None:
+                    await self._sesion_http.close()
+                if self._ejecutor is not None:
+                    self._ejecutor.shutdown(wait=False)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def _leer_cuerpo(self, receive):
+        # Devuelve (bytes leídos, si están completos); se deja de leer al pasar cuerpo_max
+        partes, total = [], 0
+        while True:
+            mensaje = await receive()
+            if mensaje["type"] == "http.disconnect":
+                return None, False
+            partes.append(mensaje.get("body", b""))
+            total += len(partes[-1])
+            if not mensaje.get("more_body"):
+                return b"".join(partes), True
+            if total > self.cuerpo_max:
+                return b"".join(partes), False
+
+    def _repetir(self, cuerpo, completo, receive):
+        entregado = False
+
+        async def recibir():
+            nonlocal entregado
+            if not entregado:
+                entregado = True
+                return {"type": "http.request", "body": cuerpo, "more_body": not completo}
+            return await receive()
+        return recibir
+
+    def _cabeceras(self, scope, tipo, request_id):
+        cabeceras = [(b"content-type", tipo), (b"x-request-id", request_id.encode())]
+        origen = next((v.decode("latin-1") for k, v in scope["headers"] if k == b"origin"), None)
+        if origen in self.origenes_cors:
+            cabeceras += [(b"access-control-allow-origin", origen.encode("latin-1")), (b"vary", b"Origin")]
+        return cabeceras
+
+    async def _atender(self, scope, receive, send, form, user_message):
+        request_id = next((v.decode("latin-1") for k, v in scope["headers"] if k == b"x-request-id"), None) \
+            or nuevo_request_id()
+        token = request_id_actual.set(request_id)
+        inicio = time.perf_counter()
+        status = 500
+        try:
+            openai.aiosession.set(await self._sesion())
+            user_identity = form.get("user_id") or form.get("identity") or "default_user"
+            if scope["path"] == "/api/chat/stream":
+                status = await self._turno_stream(scope, receive, send, user_identity, user_message, request_id)
+            else:
+                status = await self._turno(scope, send, user_identity, user_message, request_id)
+        finally:
+            metricas.observar(
+                "chatbot_http_segundos",
+                time.perf_counter() - inicio,
+                endpoint=RUTAS_ASINCRONAS[scope["path"]],
+                metodo="POST",
+                status=status
+            )
+            request_id_actual.reset(token)
+
+    async def _enviar(self, send, scope, status, cuerpo, tipo, request_id, extra=()):
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": self._cabeceras(scope, tipo, request_id) + list(extra),
+        })
+        await send({"type": "http.response.body", "body": cuerpo})
+
+    async def _turno(self, scope, send, user_identity, user_message, request_id):
+        try:
+            clave, respuesta, contexto = await self.en_hilo(preparar_turno_texto, user_identity, user_message)
+            if respuesta is None:
+                respuesta = await aopenai_IA(contexto, user_identity)
+                await self.en_hilo(cerrar_turno_texto, user_identity, respuesta, clave)
+            status, datos = 200, {"response": respuesta}
+        except Exception as e:
+            logging.error(f"❌ Error general en /chat (asgi): {str(e)}")
+            status, datos = 500, {"response": "Error interno del servidor"}
+        await self._enviar(send, scope, status, json.dumps(datos).encode(),
+                           b"application/json", request_id)
+        return status
+
+    async def _turno_stream(self, scope, receive, send, user_identity, user_message, request_id):
+        tipo = b"text/event-stream; charset=utf-8"
+        try:
+            clave, cacheada, contexto = await self.en_hilo(preparar_turno_texto, user_identity, user_message)
+        except Exception as e:
+            logging.error(f"❌ Error general en /chat/stream (asgi): {str(e)}")
+            await self._enviar(send, scope, 500, evento_sse({"response": "Error interno del servidor"}, "done").encode(),
+                               tipo, request_id, CABECERAS_SSE)
+            return 500
+        if cacheada is not None:
+            await self._enviar(send, scope, 200, evento_sse({"response": cacheada}, "done").encode(),
+                               tipo, request_id, CABECERAS_SSE)
+            return 200
+
+        await send({"type": "http.response.start", "status": 200,
+                    "headers": self._cabeceras(scope, tipo, request_id) + CABECERAS_SSE})
+        desconectado = asyncio.Event()
+        vigia = asyncio.create_task(self._vigilar_desconexion(receive, desconectado))
+        partes = []
+        terminado = False
+        try:
+            async with aclosing(aopenai_IA_stream(contexto, user_identity)) as fragmentos:
+                async for fragmento in fragmentos:
+                    if desconectado.is_set():
+                        break
+                    partes.append(fragmento)
+                    await send({"type": "http.response.body", "body": evento_sse({"delta": fragmento}).encode(),
+                                "more_body": True})
+                else:
+                    terminado = True
+        finally:
+            vigia.cancel()
+            # Se persiste lo generado aunque el cliente se haya desconectado a mitad
+            respuesta = "".join(partes)
+            if not terminado:
+                logging.info(f"🔌 Cliente desconectado durante el streaming ({user_identity})")
+            await self.en_hilo(cerrar_turno_texto, user_identity, respuesta, clave if terminado else None)
+        if terminado:
+            await send({"type": "http.response.body", "body": evento_sse({"response": respuesta}, "done").encode()})
+        return 200
+
+    async def _vigilar_desconexion(self, receive, desconectado):
+        while True:
+            mensaje = await receive()
+            if mensaje["type"] == "http.disconnect":
+                desconectado.set()
+                return
@@ -0,0 +1,438 @@
+import os
+import time
+import asyncio
+import random
+import logging
+import threading
+from collections import OrderedDict, deque
+
+import openai
+from openai.error import RateLimitError, APIError, APIConnectionError, Timeout, ServiceUnavailableError, TryAgain
+from dotenv import load_dotenv
+
+from api.sesiones import estimar_tokens
+from api.metricas import metricas
+
+load_dotenv()
+
+# Límites de la cuenta de OpenAI (0 = sin límite)
+OPENAI_RPM = int(os.getenv("OPENAI_RPM", "500"))
+OPENAI_TPM = int(os.getenv("OPENAI_TPM", "200000"))
+OPENAI_MAX_CONCURRENT = int(os.getenv("OPENAI_MAX_CONCURRENT", "8"))
+# Llamadas simultáneas por usuario: el resto espera su turno sin bloquear a los demás
+OPENAI_MAX_CONCURRENT_POR_USUARIO = int(os.getenv("OPENAI_MAX_CONCURRENT_POR_USUARIO", "2"))
+OPENAI_QUEUE_TIMEOUT = float(os.getenv("OPENAI_QUEUE_TIMEOUT", "60"))
+OPENAI_REQUEST_TIMEOUT = float(os.getenv("OPENAI_REQUEST_TIMEOUT", "60"))
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "4"))
+OPENAI_BACKOFF_BASE = float(os.getenv("OPENAI_BACKOFF_BASE", "1.0"))
+OPENAI_BACKOFF_MAX = float(os.getenv("OPENAI_BACKOFF_MAX", "30"))
+# Tokens de respuesta que se reservan antes de conocer el uso real
+OPENAI_TOKENS_RESPUESTA = int(os.getenv("OPENAI_TOKENS_RESPUESTA", "800"))
+
+ERRORES_REINTENTABLES = (RateLimitError, APIConnectionError, Timeout, ServiceUnavailableError, TryAgain)
+
+
+class EsperaOpenAIExcedida(RateLimitError):
+    pass
+
+
+class CuboTokens:
+    def __init__(self, por_minuto):
+        self.capacidad = float(por_minuto)
+        self.disponible = self.capacidad
+        self.tasa = self.capacidad / 60.0
+        self._ultimo = time.monotonic()
+
+    def _rellenar(self):
+        ahora = time.monotonic()
+        self.disponible = min(self.capacidad, self.disponible + (ahora - self._ultimo) * self.tasa)
+        self._ultimo = ahora
+
+    def espera_para(self, cantidad):
+        # Segundos hasta que haya `cantidad` disponible (una petición enorme espera al cubo lleno)
+        if not self.capacidad:
+            return 0.0
+        self._rellenar()
+        cantidad = min(cantidad, self.capacidad)
+        if self.disponible >= cantidad:
+            return 0.0
+        return (cantidad - self.disponible) / self.tasa
+
+    def consumir(self, cantidad):
+        if self.capacidad:
+            self._rellenar()
+            self.disponible -= min(cantidad, self.capacidad)
+
+    def ajustar(self, diferencia):
+        # Corrige la reserva estimada con el uso real; puede quedar en negativo
+        if self.capacidad:
+            self._rellenar()
+            self.disponible = min(self.capacidad, self.disponible - diferencia)
+
+
+def _es_reintentable(error):
+    if isinstance(error, ERRORES_REINTENTABLES):
+        return True
+    return isinstance(error, APIError) and (error.http_status or 0) >= 500
+
+
+def _retry_after(error):
+    cabeceras = getattr(error, "headers", None) or {}
+    try:
+        valor = cabeceras.get("retry-after") or cabeceras.get("Retry-After")
+        return float(valor) if valor is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+class ClienteOpenAI:
+    def __init__(self, rpm=OPENAI_RPM, tpm=OPENAI_TPM, max_concurrentes=OPENAI_MAX_CONCURRENT,
+                 max_por_usuario=OPENAI_MAX_CONCURRENT_POR_USUARIO, timeout_cola=OPENAI_QUEUE_TIMEOUT,
+                 timeout=OPENAI_REQUEST_TIMEOUT, reintentos=OPENAI_MAX_RETRIES,
+                 backoff_base=OPENAI_BACKOFF_BASE, backoff_max=OPENAI_BACKOFF_MAX):
+        self.peticiones = CuboTokens(rpm)
+        self.tokens = CuboTokens(tpm)
+        self.max_concurrentes = max_concurrentes
+        self.max_por_usuario = max_por_usuario
+        self.timeout_cola = timeout_cola
+        self.timeout = timeout
+        self.reintentos = reintentos
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._cond = threading.Condition()
+        # Una cola FIFO por usuario; el orden del dict es el turno (round-robin)
+        self._colas = OrderedDict()
+        self._en_vuelo = 0
+        self._en_vuelo_por_usuario = {}
+        # (loop, asyncio.Event) de las corrutinas que esperan turno
+        self._despertadores = set()
+        self._stats = {
+            "solicitudes": 0,
+            "reintentos": 0,
+            "errores": 0,
+            "limite_velocidad": 0,
+            "esperas_excedidas": 0,
+            "turnos_concedidos": 0,
+            "tokens_reales": 0,
+            "espera_total_ms": 0.0,
+            "espera_max_ms": 0.0,
+        }
+
+    # ---- Cola justa ----
+
+    def _turno(self):
+        # Primer usuario con cola y sin agotar su cupo de llamadas simultáneas
+        for usuario, cola in self._colas.items():
+            if self._en_vuelo_por_usuario.get(usuario, 0) < self.max_por_usuario:
+                return usuario, cola[0]
+        return None, None
+
+    def _notificar(self):
+        # Con self._cond tomado: despierta a los hilos y a las corrutinas (modo ASGI) que esperan turno
+        self._cond.notify_all()
+        for loop, evento in list(self._despertadores):
+            try:
+                loop.call_soon_threadsafe(evento.set)
+            except RuntimeError:
+                self._despertadores.discard((loop, evento))
+
+    def _intentar(self, user_identity, ticket, tokens, limite):
+        # Con self._cond tomado: concede el turno (True, 0) o devuelve (False, segundos máximos a esperar)
+        espera = None
+        usuario, siguiente = self._turno()
+        if siguiente is ticket and self._en_vuelo < self.max_concurrentes:
+            espera = max(self.peticiones.espera_para(1), self.tokens.espera_para(tokens))
+            if espera == 0:
+                self.peticiones.consumir(1)
+                self.tokens.consumir(tokens)
+                self._en_vuelo += 1
+                self._en_vuelo_por_usuario[user_identity] = self._en_vuelo_por_usuario.get(user_identity, 0) + 1
+                return True, 0
+        restante = limite - time.monotonic()
+        if restante <= 0:
+            self._stats["esperas_excedidas"] += 1
+            raise EsperaOpenAIExcedida(
+                f"Se esperó más de {self.timeout_cola:g} s por un turno para llamar a OpenAI"
+            )
+        return False, min(restante, espera) if espera else restante
+
+    def _salir_de_cola(self, user_identity, ticket, inicio, concedido):
+        cola = self._colas.get(user_identity)
+        if cola is not None:
+            cola.remove(ticket)
+            if cola:
+                # Atendido: el usuario pasa al final del turno
+                self._colas.move_to_end(user_identity)
+            else:
+                del self._colas[user_identity]
+        espera_ms = (time.monotonic() - inicio) * 1000
+        if concedido:
+            self._stats["turnos_concedidos"] += 1
+            self._stats["espera_total_ms"] += espera_ms
+            self._stats["espera_max_ms"] = max(self._stats["espera_max_ms"], espera_ms)
+        self._notificar()
+
+    def _adquirir(self, user_identity, tokens):
+        ticket = object()
+        inicio = time.monotonic()
+        limite = inicio + self.timeout_cola
+        with self._cond:
+            self._colas.setdefault(user_identity, deque()).append(ticket)
+            concedido = False
+            try:
+                while True:
+                    concedido, espera = self._intentar(user_identity, ticket, tokens, limite)
+                    if concedido:
+                        break
+                    self._cond.wait(espera)
+            finally:
+                self._salir_de_cola(user_identity, ticket, inicio, concedido)
+
+    async def _adquirir_async(self, user_identity, tokens):
+        # Misma cola justa que _adquirir, pero esperando sin ocupar un hilo
+        ticket = object()
+        inicio = time.monotonic()
+        limite = inicio + self.timeout_cola
+        despertador = (asyncio.get_running_loop(), asyncio.Event())
+        with self._cond:
+            self._colas.setdefault(user_identity, deque()).append(ticket)
+            self._despertadores.add(despertador)
+        concedido = False
+        try:
+            while True:
+                with self._cond:
+                    despertador[1].clear()
+                    concedido, espera = self._intentar(user_identity, ticket, tokens, limite)
+                if concedido:
+                    break
+                try:
+                    await asyncio.wait_for(despertador[1].wait(), espera)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            with self._cond:
+                self._despertadores.discard(despertador)
+                self._salir_de_cola(user_identity, ticket, inicio, concedido)
+
+    def _liberar(self, user_identity, tokens_estimados, tokens_reales=None):
+        with self._cond:
+            self._en_vuelo -= 1
+            restantes = self._en_vuelo_por_usuario.get(user_identity, 1) - 1
+            if restantes > 0:
+                self._en_vuelo_por_usuario[user_identity] = restantes
+            else:
+                self._en_vuelo_por_usuario.pop(user_identity, None)
+            if tokens_reales is not None:
+                self.tokens.ajustar(tokens_reales - tokens_estimados)
+                self._stats["tokens_reales"] += tokens_reales
+            self._notificar()
+
+    # ---- Reintentos ----
+
+    def _espera_reintento(self, intento, error):
+        espera = min(self.backoff_max, self.backoff_base * 2 ** intento)
+        espera = random.uniform(espera / 2, espera)
+        sugerida = _retry_after(error)
+        if sugerida is not None:
+            espera = max(espera, min(sugerida, self.backoff_max))
+        logging.warning(f"⚠️ Reintentando llamada a OpenAI en {espera:.1f} s ({type(error).__name__}: {error})")
+        return espera
+
+    def _esperar_reintento(self, intento, error):
+        time.sleep(self._espera_reintento(intento, error))
+
+    def _registrar_error(self, error):
+        with self._cond:
+            self._stats["errores"] += 1
+            if isinstance(error, RateLimitError):
+                self._stats["limite_velocidad"] += 1
+
+    def completar(self, messages, user_identity=None, model=None, operacion="chat", **parametros):
+        inicio = time.perf_counter()
+        resultado = "error"
+        try:
+            respuesta = self._completar(messages, user_identity, model, **parametros)
+            resultado = "ok"
+            self._registrar_uso(respuesta, operacion)
+            return respuesta
+        finally:
+            metricas.observar("chatbot_openai_segundos", time.perf_counter() - inicio, operacion=operacion)
+            metricas.incrementar("chatbot_openai_llamadas_total", operacion=operacion, resultado=resultado)
+
+    def _registrar_uso(self, respuesta, operacion):
+        uso = respuesta.get("usage") if hasattr(respuesta, "get") else None
+        if uso:
+            metricas.incrementar("chatbot_openai_tokens_total", uso.get("prompt_tokens", 0), operacion=operacion, tipo="prompt")
+            metricas.incrementar("chatbot_openai_tokens_total", uso.get("completion_tokens", 0), operacion=operacion, tipo="completion")
+
+    def _completar(self, messages, user_identity=None, model=None, **parametros):
+        user_identity = user_identity or "anonimo"
+        estimados = sum(estimar_tokens(m) for m in messages) + OPENAI_TOKENS_RESPUESTA
+        parametros.setdefault("request_timeout", self.timeout)
+        with self._cond:
+            self._stats["solicitudes"] += 1
+
+        for intento in range(self.reintentos + 1):
+            self._adquirir(user_identity, estimados)
+            reales = None
+            try:
+                respuesta = openai.ChatCompletion.create(model=model, messages=messages, **parametros)
+                uso = respuesta.get("usage") if hasattr(respuesta, "get") else None
+                reales = uso.get("total_tokens") if uso else None
+                return respuesta
+            except Exception as e:
+                self._registrar_error(e)
+                if intento >= self.reintentos or not _es_reintentable(e):
+                    raise
+                with self._cond:
+                    self._stats["reintentos"] += 1
+                error = e
+            finally:
+                self._liberar(user_identity, estimados, reales)
+            # La espera se hace sin ocupar el turno
+            self._esperar_reintento(intento, error)
+
+    def completar_stream(self, messages, user_identity=None, model=None, operacion="chat_stream", **parametros):
+        # Solo se reintenta al abrir el stream; el turno se libera al cerrarlo
+        user_identity = user_identity or "anonimo"
+        inicio = time.perf_counter()
+        estimados = sum(estimar_tokens(m) for m in messages) + OPENAI_TOKENS_RESPUESTA
+        parametros.setdefault("request_timeout", self.timeout)
+        with self._cond:
+            self._stats["solicitudes"] += 1
+
+        for intento in range(self.reintentos + 1):
+            self._adquirir(user_identity, estimados)
+            try:
+                flujo = openai.ChatCompletion.create(model=model, messages=messages, stream=True, **parametros)
+                break
+            except Exception as e:
+                self._liberar(user_identity, estimados)
+                self._registrar_error(e)
+                if intento >= self.reintentos or not _es_reintentable(e):
+                    metricas.incrementar("chatbot_openai_llamadas_total", operacion=operacion, resultado="error")
+                    raise
+                with self._cond:
+                    self._stats["reintentos"] += 1
+                self._esperar_reintento(intento, e)
+
+        def iterar():
+            # El streaming no reporta usage: se cuentan los fragmentos recibidos (~1 token cada uno)
+            fragmentos = 0
+            resultado = "error"
+            try:
+                for chunk in flujo:
+                    fragmentos += 1
+                    yield chunk
+                resultado = "ok"
+            finally:
+                if hasattr(flujo, "close"):
+                    flujo.close()
+                self._liberar(user_identity, estimados)
+                metricas.observar("chatbot_openai_segundos", time.perf_counter() - inicio, operacion=operacion)
+                metricas.incrementar("chatbot_openai_llamadas_total", operacion=operacion, resultado=resultado)
+                metricas.incrementar("chatbot_openai_tokens_total", fragmentos, operacion=operacion, tipo="completion")
+
+        return iterar()
+
+    # ---- Variantes asíncronas (modo ASGI): misma cola, reintentos y métricas, sin ocupar un hilo ----
+
+    async def acompletar(self, messages, user_identity=None, model=None, operacion="chat", **parametros):
+        inicio = time.perf_counter()
+        resultado = "error"
+        try:
+            respuesta = await self._acompletar(messages, user_identity, model, **parametros)
+            resultado = "ok"
+            self._registrar_uso(respuesta, operacion)
+            return respuesta
+        finally:
+            metricas.observar("chatbot_openai_segundos", time.perf_counter() - inicio, operacion=operacion)
+            metricas.incrementar("chatbot_openai_llamadas_total", operacion=operacion, resultado=resultado)
+
+    async def _acompletar(self, messages, user_identity=None, model=None, **parametros):
+        user_identity = user_identity or "anonimo"
+        estimados = sum(estimar_tokens(m) for m in messages) + OPENAI_TOKENS_RESPUESTA
+        parametros.setdefault("request_timeout", self.timeout)
+        with self._cond:
+            self._stats["solicitudes"] += 1
+
+        for intento in range(self.reintentos + 1):
+            await self._adquirir_async(user_identity, estimados)
+            reales = None
+            try:
+                respuesta = await openai.ChatCompletion.acreate(model=model, messages=messages, **parametros)
+                uso = respuesta.get("usage") if hasattr(respuesta, "get") else None
+                reales = uso.get("total_tokens") if uso else None
+                return respuesta
+            except Exception as e:
+                self._registrar_error(e)
+                if intento >= self.reintentos or not _es_reintentable(e):
+                    raise
+                with self._cond:
+                    self._stats["reintentos"] += 1
+                error = e
+            finally:
+                self._liberar(user_identity, estimados, reales)
+            await asyncio.sleep(self._espera_reintento(intento, error))
+
+    async def acompletar_stream(self, messages, user_identity=None, model=None, operacion="chat_stream", **parametros):
+        # Devuelve un generador asíncrono; el turno se libera al agotarlo o cerrarlo (aclose)
+        user_identity = user_identity or "anonimo"
+        inicio = time.perf_counter()
+        estimados = sum(estimar_tokens(m) for m in messages) + OPENAI_TOKENS_RESPUESTA
+        parametros.setdefault("request_timeout", self.timeout)
+        with self._cond:
+            self._stats["solicitudes"] += 1
+
+        for intento in range(self.reintentos + 1):
+            await self._adquirir_async(user_identity, estimados)
+            try:
+                flujo = await openai.ChatCompletion.acreate(model=model, messages=messages, stream=True, **parametros)
+                break
+            except Exception as e:
+                self._liberar(user_identity, estimados)
+                self._registrar_error(e)
+                if intento >= self.reintentos or not _es_reintentable(e):
+                    metricas.incrementar("chatbot_openai_llamadas_total", operacion=operacion, resultado="error")
+                    raise
+                with self._cond:
+                    self._stats["reintentos"] += 1
+                await asyncio.sleep(self._espera_reintento(intento, e))
+
+        async def iterar():
+            fragmentos = 0
+            resultado = "error"
+            try:
+                async for chunk in flujo:
+                    fragmentos += 1
+                    yield chunk
+                resultado = "ok"
+            finally:
+                if hasattr(flujo, "aclose"):
+                    await flujo.aclose()
+                self._liberar(user_identity, estimados)
+                metricas.observar("chatbot_openai_segundos", time.perf_counter() - inicio, operacion=operacion)
+                metricas.incrementar("chatbot_openai_llamadas_total", operacion=operacion, resultado=resultado)
+                metricas.incrementar("chatbot_openai_tokens_total", fragmentos, operacion=operacion, tipo="completion")
+
+        return iterar()
+
+    def estadisticas(self):
+        with self._cond:
+            stats = dict(self._stats)
+            concedidas = stats["turnos_concedidos"]
+            stats.update({
+                "en_cola": sum(len(c) for c in self._colas.values()),
+                "usuarios_en_cola": len(self._colas),
+                "en_vuelo": self._en_vuelo,
+                "max_concurrentes": self.max_concurrentes,
+                "espera_promedio_ms": round(stats["espera_total_ms"] / concedidas, 1) if concedidas > 0 else 0.0,
+                "peticiones_disponibles": round(self.peticiones.disponible, 1) if self.peticiones.capacidad else None,
+                "tokens_disponibles": round(self.tokens.disponible) if self.tokens.capacidad else None,
+            })
+            stats["espera_total_ms"] = round(stats["espera_total_ms"], 1)
+            stats["espera_max_ms"] = round(stats["espera_max_ms"], 1)
+        return stats
+
+
+cliente_openai = ClienteOpenAI()
@@ -0,0 +1,193 @@
+import os
+import time
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import pool
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "10"))
+# Segundos máximos esperando una conexión libre antes de fallar
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+# Conexiones ociosas por más de estos segundos se validan con SELECT 1 al prestarse
+DB_POOL_HEALTHCHECK_SECONDS = float(os.getenv("DB_POOL_HEALTHCHECK_SECONDS", "30"))
+# Por encima de DB_POOL_MIN, las conexiones libres ociosas más de estos segundos se cierran
+DB_POOL_IDLE_SECONDS = float(os.getenv("DB_POOL_IDLE_SECONDS", "300"))
+
+
+def _parametros_conexion():
+    return dict(
+        dbname=os.getenv("DB_NAME"),
+        user=os.getenv("DB_USER"),
+        password=os.getenv("DB_PASSWORD"),
+        host=os.getenv("DB_HOST"),
+        port=os.getenv("DB_PORT")
+    )
+
+
+class PoolConexiones:
+    def __init__(self, minconn=DB_POOL_MIN, maxconn=DB_POOL_MAX, timeout=DB_POOL_TIMEOUT,
+                 healthcheck_seconds=DB_POOL_HEALTHCHECK_SECONDS, idle_seconds=DB_POOL_IDLE_SECONDS,
+                 factory=None):
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.healthcheck_seconds = healthcheck_seconds
+        self.idle_seconds = idle_seconds
+        self._factory = factory or (lambda: psycopg2.connect(**_parametros_conexion()))
+        self._lock = threading.Lock()
+        self._reiniciar()
+        self._stats = {
+            "prestadas": 0,
+            "en_uso": 0,
+            "creadas": 0,
+            "descartadas": 0,
+            "healthchecks_fallidos": 0,
+            "timeouts": 0,
+            "espera_total_ms": 0.0,
+        }
+
+    def _reiniciar(self):
+        # (conexión, último uso) de las conexiones libres, la más reciente al final
+        self._libres = deque()
+        # El semáforo limita las conexiones prestadas a maxconn y hace esperar al resto
+        self._cupos = threading.BoundedSemaphore(self.maxconn)
+        self._pid = os.getpid()
+
+    def _verificar_proceso(self):
+        # 🔁 Tras un fork (gunicorn --preload) las conexiones heredadas no se comparten
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._reiniciar()
+
+    def _conexion_sana(self, conn, ultimo_uso):
+        if conn.closed:
+            return False
+        if time.monotonic() - ultimo_uso < self.healthcheck_seconds:
+            return True
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT 1")
+            cur.fetchone()
+            cur.close()
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    def _cerrar_silencioso(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def getconn(self):
+        self._verificar_proceso()
+        inicio = time.monotonic()
+        if not self._cupos.acquire(timeout=self.timeout):
+            with self._lock:
+                self._stats["timeouts"] += 1
+            raise pool.PoolError(f"⏳ No hay conexiones libres tras {self.timeout}s (máx {self.maxconn})")
+        try:
+            conn = None
+            while conn is None:
+                with self._lock:
+                    libre = self._libres.pop() if self._libres else None
+                if libre is None:
+                    conn = self._factory()
+                    with self._lock:
+                        self._stats["creadas"] += 1
+                elif self._conexion_sana(*libre):
+                    conn = libre[0]
+                else:
+                    logging.warning("⚠️ Conexión del pool inválida, se descarta y se abre otra")
+                    self._cerrar_silencioso(libre[0])
+                    with self._lock:
+                        self._stats["healthchecks_fallidos"] += 1
+                        self._stats["descartadas"] += 1
+        except Exception:
+            self._cupos.release()
+            raise
+        with self._lock:
+            self._stats["prestadas"] += 1
+            self._stats["en_uso"] += 1
+            self._stats["espera_total_ms"] += (time.monotonic() - inicio) * 1000
+        return conn
+
+    def putconn(self, conn, close=False):
+        try:
+            if not close and not conn.closed:
+                # No devolver conexiones con transacciones a medias
+                try:
+                    conn.rollback()
+                except Exception:
+                    close = True
+            close = close or bool(conn.closed)
+            ahora = time.monotonic()
+            ociosas = []
+            with self._lock:
+                if not close and len(self._libres) < self.maxconn:
+                    self._libres.append((conn, ahora))
+                else:
+                    self._stats["descartadas"] += 1
+                    close = True
+                # 🧹 Cerrar las conexiones ociosas que sobran por encima del mínimo
+                while len(self._libres) > self.minconn and ahora - self._libres[0][1] > self.idle_seconds:
+                    ociosas.append(self._libres.popleft()[0])
+                    self._stats["descartadas"] += 1
+            if close:
+                self._cerrar_silencioso(conn)
+            for ociosa in ociosas:
+                self._cerrar_silencioso(ociosa)
+        finally:
+            with self._lock:
+                self._stats["en_uso"] -= 1
+            self._cupos.release()
+
+    @contextmanager
+    def conexion(self):
+        conn = self.getconn()
+        descartar = False
+        try:
+            yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            descartar = True
+            raise
+        finally:
+            self.putconn(conn, close=descartar)
+
+    def estadisticas(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["libres"] = len(self._libres)
+        stats.update({
+            "min": self.minconn,
+            "max": self.maxconn,
+            "espera_promedio_ms": round(stats["espera_total_ms"] / stats["prestadas"], 3) if stats["prestadas"] else 0.0,
+        })
+        return stats
+
+    def cerrar(self):
+        with self._lock:
+            libres, self._libres = self._libres, deque()
+        for conn, _ in libres:
+            self._cerrar_silencioso(conn)
+
+
+db_pool = PoolConexiones()
+
+
+def db_connection():
+    return db_pool.conexion()
+
+
+def get_db_connection():
+    # Conexión suelta fuera del pool (scripts y mantenimiento)
+    return psycopg2.connect(**_parametros_conexion())
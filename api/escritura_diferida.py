@@ -0,0 +1,176 @@
+import os
+import time
+import queue
+import atexit
+import logging
+import threading
+from collections import Counter
+from datetime import datetime
+
+from psycopg2.extras import execute_values
+from dotenv import load_dotenv
+
+from api.metricas import metricas
+
+load_dotenv()
+
+CHAT_HISTORY_WRITE_BEHIND = os.getenv("CHAT_HISTORY_WRITE_BEHIND", "0").lower() in ("1", "true", "si", "yes")
+CHAT_HISTORY_QUEUE_MAX = int(os.getenv("CHAT_HISTORY_QUEUE_MAX", "10000"))
+CHAT_HISTORY_FLUSH_INTERVAL = float(os.getenv("CHAT_HISTORY_FLUSH_INTERVAL", "1.0"))
+CHAT_HISTORY_BATCH_MAX = int(os.getenv("CHAT_HISTORY_BATCH_MAX", "500"))
+CHAT_HISTORY_RETRIES = int(os.getenv("CHAT_HISTORY_RETRIES", "3"))
+
+
+class EscritorHistorial:
+    def __init__(self, pool, max_cola=CHAT_HISTORY_QUEUE_MAX, intervalo=CHAT_HISTORY_FLUSH_INTERVAL,
+                 lote_max=CHAT_HISTORY_BATCH_MAX, reintentos=CHAT_HISTORY_RETRIES):
+        self._pool = pool
+        self._max_cola = max_cola
+        self.intervalo = intervalo
+        self.lote_max = lote_max
+        self.reintentos = reintentos
+        self._lock = threading.Lock()
+        # Serializa los vaciados: quien llama a flush() espera a que lo ya extraído se confirme
+        self._flush_lock = threading.Lock()
+        self._pid = None
+        self._hilo = None
+        self._registrado_atexit = False
+        self._cola = queue.Queue(maxsize=max_cola)
+        self._pendientes = Counter()
+        self._detener = threading.Event()
+        # Despierta al hilo antes del intervalo cuando ya hay un lote completo
+        self._despertar = threading.Event()
+        self._stats = {
+            "encolados": 0,
+            "escritos": 0,
+            "lotes_escritos": 0,
+            "lotes_reintentados": 0,
+            "lotes_descartados": 0,
+            "mensajes_descartados": 0,
+            "cola_llena": 0,
+        }
+
+    def _asegurar_hilo(self):
+        # 🔁 Tras un fork el hilo escritor no existe en el hijo: se arranca uno nuevo
+        if self._pid == os.getpid() and self._hilo is not None and self._hilo.is_alive():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._cola = queue.Queue(maxsize=self._max_cola)
+                self._pendientes = Counter()
+                self._flush_lock = threading.Lock()
+                self._detener = threading.Event()
+                self._despertar = threading.Event()
+                self._pid = os.getpid()
+                self._hilo = None
+            if self._hilo is None or not self._hilo.is_alive():
+                self._hilo = threading.Thread(target=self._bucle, name="escritor-historial", daemon=True)
+                self._hilo.start()
+                if not self._registrado_atexit:
+                    atexit.register(self.detener)
+                    self._registrado_atexit = True
+
+    def encolar(self, user_identity, role, content):
+        self._asegurar_hilo()
+        with self._lock:
+            self._pendientes[user_identity] += 1
+        try:
+            self._cola.put_nowait((user_identity, role, content, datetime.now()))
+        except queue.Full:
+            with self._lock:
+                self._pendientes[user_identity] -= 1
+                self._stats["cola_llena"] += 1
+                self._stats["mensajes_descartados"] += 1
+            logging.error(f"❌ Cola de historial llena ({self._max_cola}), mensaje descartado para {user_identity}")
+            return False
+        with self._lock:
+            self._stats["encolados"] += 1
+        if self._cola.qsize() >= self.lote_max:
+            self._despertar.set()
+        return True
+
+    def pendientes(self, user_identity=None):
+        with self._lock:
+            if user_identity is None:
+                return sum(self._pendientes.values())
+            return self._pendientes.get(user_identity, 0)
+
+    def flush(self):
+        with self._flush_lock:
+            while True:
+                lote = []
+                while len(lote) < self.lote_max:
+                    try:
+                        lote.append(self._cola.get_nowait())
+                    except queue.Empty:
+                        break
+                if not lote:
+                    return
+                self._escribir_lote(lote)
+
+    @metricas.cronometrar("chatbot_db_segundos")
+    def _escribir_lote(self, lote):
+        for intento in range(self.reintentos + 1):
+            try:
+                with self._pool.conexion() as conn:
+                    cur = conn.cursor()
+                    # ⛑️ Usuarios y mensajes en la misma transacción
+                    identidades = sorted({m[0] for m in lote})
+                    execute_values(cur, """
+                        INSERT INTO users (identity, full_name) VALUES %s
+                        ON CONFLICT DO NOTHING
+                    """, [(identity, None) for identity in identidades])
+                    execute_values(cur, """
+                        INSERT INTO chat_history (user_identity, role, content, timestamp) VALUES %s
+                    """, lote, page_size=self.lote_max)
+                    conn.commit()
+                    cur.close()
+                with self._lock:
+                    self._stats["escritos"] += len(lote)
+                    self._stats["lotes_escritos"] += 1
+                break
+            except Exception as e:
+                if intento < self.reintentos:
+                    with self._lock:
+                        self._stats["lotes_reintentados"] += 1
+                    logging.warning(f"⚠️ Reintentando lote de historial ({len(lote)} mensajes): {e}")
+                    time.sleep(min(0.2 * 2 ** intento, 5))
+                else:
+                    with self._lock:
+                        self._stats["lotes_descartados"] += 1
+                        self._stats["mensajes_descartados"] += len(lote)
+                    logging.error(f"❌ Lote de historial descartado ({len(lote)} mensajes): {e}")
+        with self._lock:
+            for m in lote:
+                self._pendientes[m[0]] -= 1
+                if self._pendientes[m[0]] <= 0:
+                    del self._pendientes[m[0]]
+
+    def _bucle(self):
+        while not self._detener.is_set():
+            self._despertar.wait(self.intervalo)
+            self._despertar.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logging.error(f"❌ Error en el escritor de historial: {e}")
+
+    def detener(self):
+        self._detener.set()
+        self._despertar.set()
+        if self._hilo is not None and self._hilo.is_alive() and self._hilo is not threading.current_thread():
+            self._hilo.join(timeout=self.intervalo + 1)
+        try:
+            self.flush()
+        except Exception as e:
+            logging.error(f"❌ Error vaciando historial al apagar: {e}")
+
+    def estadisticas(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats.update({
+            "activo": CHAT_HISTORY_WRITE_BEHIND,
+            "en_cola": self._cola.qsize(),
+            "max_cola": self._max_cola,
+        })
+        return stats
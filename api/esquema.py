@@ -0,0 +1,109 @@
+import logging
+import threading
+
+from api.db import db_connection
+
+# Tablas e índices propios del backend; se crean al primer uso si no existen
+ESQUEMA = [
+    # ♻️ Caché global de evaluaciones por contenido (compartida entre usuarios)
+    """
+    CREATE TABLE IF NOT EXISTS cache_evaluaciones_pdf (
+        hash_pdf TEXT PRIMARY KEY,
+        datos JSONB NOT NULL,
+        detalle TEXT NOT NULL,
+        created_at TIMESTAMP NOT NULL DEFAULT NOW()
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS cache_pdf_bytes (
+        hash_bytes TEXT PRIMARY KEY,
+        hash_pdf TEXT NOT NULL REFERENCES cache_evaluaciones_pdf (hash_pdf) ON DELETE CASCADE,
+        created_at TIMESTAMP NOT NULL DEFAULT NOW()
+    )
+    """,
+    # 📄 Texto de los PDF subidos por /api/upload, por SHA-256 de los bytes: si luego se evalúan no se
+    # vuelven a abrir (cache_pdf_bytes solo admite contenido con evaluación)
+    """
+    CREATE TABLE IF NOT EXISTS texto_pdf_bytes (
+        hash_bytes TEXT PRIMARY KEY,
+        texto TEXT NOT NULL,
+        created_at TIMESTAMP NOT NULL DEFAULT NOW()
+    )
+    """,
+    # 🧾 Resumen incremental del historial antiguo; la marca de agua es el último mensaje resumido
+    """
+    CREATE TABLE IF NOT EXISTS resumenes_historial (
+        user_identity TEXT PRIMARY KEY,
+        resumen TEXT NOT NULL,
+        hasta_timestamp TIMESTAMP NOT NULL,
+        hasta_id INTEGER NOT NULL,
+        mensajes_resumidos INTEGER NOT NULL DEFAULT 0,
+        updated_at TIMESTAMP NOT NULL DEFAULT NOW()
+    )
+    """,
+    # 🔖 Versión del contexto de proyectos/evaluaciones de cada usuario: la caché de cualquier worker
+    # la compara al leer, así ve las evaluaciones que terminaron en otro proceso
+    """
+    CREATE TABLE IF NOT EXISTS contexto_usuario (
+        user_identity TEXT PRIMARY KEY,
+        version BIGINT NOT NULL DEFAULT 0
+    )
+    """,
+    # 📊 Contadores de evaluaciones por día, facultad y carrera (se actualizan en upsert_pdf_data)
+    """
+    CREATE TABLE IF NOT EXISTS resumen_evaluaciones (
+        dia DATE NOT NULL,
+        facultad TEXT NOT NULL DEFAULT '',
+        carrera TEXT NOT NULL DEFAULT '',
+        propuestas INTEGER NOT NULL DEFAULT 0,
+        suma_promedio DOUBLE PRECISION NOT NULL DEFAULT 0,
+        aprobadas INTEGER NOT NULL DEFAULT 0,
+        pendientes INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (dia, facultad, carrera)
+    )
+    """,
+    # 🛬 PDF que algún worker está evaluando: los envíos idénticos esperan su resultado en la caché
+    """
+    CREATE TABLE IF NOT EXISTS pdf_en_evaluacion (
+        hash_bytes TEXT PRIMARY KEY,
+        expira TIMESTAMP NOT NULL
+    )
+    """,
+    # 🔑 Un proyecto por usuario y contenido: dos envíos simultáneos no duplican projects/evaluaciones
+    """
+    CREATE TABLE IF NOT EXISTS propiedad_pdf (
+        user_identity TEXT NOT NULL,
+        hash_pdf TEXT NOT NULL,
+        project_id_version INTEGER NOT NULL REFERENCES projects (id_version) ON DELETE CASCADE,
+        PRIMARY KEY (user_identity, hash_pdf)
+    )
+    """,
+    # 📜 Historial por usuario, del más reciente al más antiguo (paginación por (timestamp, id))
+    """
+    CREATE INDEX IF NOT EXISTS idx_chat_history_usuario_fecha
+    ON chat_history (user_identity, timestamp DESC, id DESC)
+    """,
+]
+
+_lock = threading.Lock()
+_listo = False
+
+
+def asegurar_esquema():
+    global _listo
+    if _listo:
+        return True
+    with _lock:
+        if _listo:
+            return True
+        try:
+            with db_connection() as conn:
+                cur = conn.cursor()
+                for sentencia in ESQUEMA:
+                    cur.execute(sentencia)
+                conn.commit()
+                cur.close()
+            _listo = True
+        except Exception as e:
+            logging.error(f"❌ Error creando tablas auxiliares: {e}")
+    return _listo
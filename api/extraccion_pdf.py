@@ -0,0 +1,224 @@
+import io
+import os
+import time
+import logging
+import threading
+import multiprocessing
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+PDF_MAX_BYTES = int(os.getenv("PDF_MAX_BYTES", str(15 * 1024 * 1024)))
+PDF_MAX_PAGES = int(os.getenv("PDF_MAX_PAGES", "60"))
+PDF_TIMEOUT_SECONDS = float(os.getenv("PDF_TIMEOUT_SECONDS", "30"))
+# 0 = extraer en el mismo hilo, sin pool de procesos
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Documentos con más páginas que esto se reparten en rangos entre los procesos
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "8"))
+PDF_MAX_TASKS_PER_CHILD = int(os.getenv("PDF_MAX_TASKS_PER_CHILD", "50"))
+# Límite de memoria virtual por proceso extractor (0 = sin límite, solo POSIX)
+PDF_WORKER_MAX_MEMORY_MB = int(os.getenv("PDF_WORKER_MAX_MEMORY_MB", "0"))
+# fork desde un proceso con hilos (Flask, ejecutores) puede heredar locks tomados y colgarse:
+# forkserver crea los procesos desde un servidor de un solo hilo que ya cargó pdfplumber
+PDF_POOL_START_METHOD = os.getenv(
+    "PDF_POOL_START_METHOD",
+    "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+)
+# Cada cuánto revisa una tarea en espera si el pool se reinició por culpa de otro PDF
+SONDEO_POOL = 0.25
+
+
+class LimitePDFExcedido(ValueError):
+    pass
+
+
+def _inicializar_proceso(max_memoria_mb):
+    # pdfplumber pesa ~100 ms al importarse: lo pagan los procesos extractores, no el arranque de la app
+    import pdfplumber  # noqa: F401
+    if max_memoria_mb:
+        try:
+            import resource
+            limite = max_memoria_mb * 1024 * 1024
+            resource.setrlimit(resource.RLIMIT_AS, (limite, limite))
+        except Exception as e:
+            logging.warning(f"⚠️ No se pudo limitar la memoria del extractor de PDF: {e}")
+
+
+def _leer_pagina(pagina, con_tablas):
+    texto = pagina.extract_text() or ""
+    return (texto, pagina.extract_tables()) if con_tablas else texto
+
+
+def _extraer_paginas(datos, inicio, fin, con_tablas=False):
+    import pdfplumber
+    with pdfplumber.open(io.BytesIO(datos)) as pdf:
+        return [_leer_pagina(pdf.pages[i], con_tablas) for i in range(inicio, min(fin, len(pdf.pages)))]
+
+
+def _extraer_tablas(datos, max_paginas):
+    # Tablas de todas las páginas, en orden de aparición
+    import pdfplumber
+    with pdfplumber.open(io.BytesIO(datos)) as pdf:
+        if len(pdf.pages) > max_paginas:
+            return len(pdf.pages), None
+        return len(pdf.pages), [tabla for page in pdf.pages for tabla in page.extract_tables()]
+
+
+def _extraer_inicial(datos, max_paginas, paginas_por_tarea, con_tablas=False):
+    # Devuelve (número de páginas, páginas leídas); las páginas solo si el documento es corto
+    import pdfplumber
+    with pdfplumber.open(io.BytesIO(datos)) as pdf:
+        total = len(pdf.pages)
+        if total > max_paginas or total > paginas_por_tarea:
+            return total, None
+        return total, [_leer_pagina(page, con_tablas) for page in pdf.pages]
+
+
+class ExtractorPDF:
+    def __init__(self, workers=PDF_WORKERS, max_bytes=PDF_MAX_BYTES, max_paginas=PDF_MAX_PAGES,
+                 timeout=PDF_TIMEOUT_SECONDS, paginas_por_tarea=PDF_PAGES_PER_TASK):
+        self.workers = workers
+        self.max_bytes = max_bytes
+        self.max_paginas = max_paginas
+        self.timeout = timeout
+        self.paginas_por_tarea = max(1, paginas_por_tarea)
+        self._lock = threading.Lock()
+        self._pool = None
+        self._pid = None
+        # Cambia con cada pool nuevo: las tareas de un pool terminado se reenvían al siguiente
+        self._generacion = 0
+        self._stats = {"reinicios": 0, "reenviadas": 0}
+
+    def _obtener_pool(self):
+        # 🔁 Un pool heredado por fork (gunicorn --preload) no sirve en el hijo
+        with self._lock:
+            if self._pool is None or self._pid != os.getpid():
+                contexto = multiprocessing.get_context(PDF_POOL_START_METHOD)
+                if PDF_POOL_START_METHOD == "forkserver":
+                    # Sin "__main__" el servidor no importa la app, pero cada proceso hijo sí reimporta
+                    # el módulo principal: por eso importar app/api.chat no arranca hilos (ver iniciar_servicios)
+                    contexto.set_forkserver_preload(["pdfplumber"])
+                self._pool = contexto.Pool(
+                    self.workers,
+                    initializer=_inicializar_proceso,
+                    initargs=(PDF_WORKER_MAX_MEMORY_MB,),
+                    maxtasksperchild=PDF_MAX_TASKS_PER_CHILD
+                )
+                self._pid = os.getpid()
+                self._generacion += 1
+            return self._pool, self._generacion
+
+    def _reiniciar_pool(self, generacion):
+        # Un PDF colgado solo se corta matando los procesos del pool; las demás tareas que
+        # esperaban en él se reenvían al pool nuevo (ver _esperar)
+        with self._lock:
+            if self._pool is None or generacion != self._generacion:
+                return
+            pool, self._pool = self._pool, None
+            self._generacion += 1
+            self._stats["reinicios"] += 1
+        pool.terminate()
+
+    def _enviar(self, funcion, args):
+        pool, generacion = self._obtener_pool()
+        return [generacion, pool.apply_async(funcion, args), funcion, args]
+
+    def _esperar(self, tarea, limite):
+        while True:
+            generacion, resultado, funcion, args = tarea
+            resto = limite - time.monotonic()
+            if resto <= 0:
+                self._reiniciar_pool(generacion)
+                raise LimitePDFExcedido(f"📄 El PDF tardó más de {self.timeout:g} s en procesarse.")
+            resultado.wait(min(resto, SONDEO_POOL))
+            if resultado.ready():
+                return resultado.get()
+            if generacion != self._generacion:
+                # Otro PDF obligó a terminar el pool: esta tarea se repite en el nuevo con su mismo límite
+                with self._lock:
+                    self._stats["reenviadas"] += 1
+                tarea[:] = self._enviar(funcion, args)
+
+    def leer_bytes(self, origen):
+        if isinstance(origen, (bytes, bytearray)):
+            datos = bytes(origen)
+        elif isinstance(origen, (str, os.PathLike)):
+            if os.path.getsize(origen) > self.max_bytes:
+                raise LimitePDFExcedido(f"📄 El PDF supera el tamaño máximo permitido ({self.max_bytes / (1024 * 1024):g} MB).")
+            with open(origen, "rb") as f:
+                datos = f.read()
+        else:
+            # FileStorage de Flask u otro objeto tipo archivo
+            flujo = getattr(origen, "stream", origen)
+            if hasattr(flujo, "seek"):
+                flujo.seek(0)
+            datos = flujo.read(self.max_bytes + 1)
+        if len(datos) > self.max_bytes:
+            raise LimitePDFExcedido(f"📄 El PDF supera el tamaño máximo permitido ({self.max_bytes / (1024 * 1024):g} MB).")
+        return datos
+
+    def _validar_paginas(self, total):
+        if total > self.max_paginas:
+            raise LimitePDFExcedido(f"📄 El PDF tiene {total} páginas; el máximo permitido es {self.max_paginas}.")
+
+    def _leer_paginas(self, origen, con_tablas):
+        datos = self.leer_bytes(origen)
+
+        if self.workers <= 0:
+            total, paginas = _extraer_inicial(datos, self.max_paginas, float("inf"), con_tablas)
+            self._validar_paginas(total)
+            return paginas
+
+        limite = time.monotonic() + self.timeout
+        total, paginas = self._esperar(
+            self._enviar(_extraer_inicial, (datos, self.max_paginas, self.paginas_por_tarea, con_tablas)), limite
+        )
+        self._validar_paginas(total)
+        if paginas is not None:
+            return paginas
+
+        # 📚 Documento largo: rangos de páginas en paralelo, se reensamblan en orden
+        tareas = [
+            self._enviar(_extraer_paginas, (datos, inicio, inicio + self.paginas_por_tarea, con_tablas))
+            for inicio in range(0, total, self.paginas_por_tarea)
+        ]
+        paginas = []
+        for tarea in tareas:
+            paginas.extend(self._esperar(tarea, limite))
+        return paginas
+
+    def extraer_paginas(self, origen):
+        return self._leer_paginas(origen, False)
+
+    def extraer_texto_y_tablas(self, origen):
+        # Una sola lectura del PDF: (texto de cada página, tablas de todas las páginas en orden)
+        paginas = self._leer_paginas(origen, True)
+        return [texto for texto, _ in paginas], [tabla for _, tablas in paginas for tabla in tablas]
+
+    def extraer_tablas(self, origen):
+        datos = self.leer_bytes(origen)
+
+        if self.workers <= 0:
+            total, tablas = _extraer_tablas(datos, self.max_paginas)
+            self._validar_paginas(total)
+            return tablas
+
+        total, tablas = self._esperar(
+            self._enviar(_extraer_tablas, (datos, self.max_paginas)), time.monotonic() + self.timeout
+        )
+        self._validar_paginas(total)
+        return tablas
+
+    def estadisticas(self):
+        with self._lock:
+            return dict(self._stats)
+
+    def cerrar(self):
+        with self._lock:
+            if self._pool is not None and self._pid == os.getpid():
+                self._pool.close()
+            self._pool = None
+
+
+extractor_pdf = ExtractorPDF()
@@ -0,0 +1,154 @@
+import os
+import re
+import logging
+import threading
+import unicodedata
+
+from dotenv import load_dotenv
+
+from api.metricas import metricas
+
+load_dotenv()
+
+INTENCIONES_ACTIVAS = os.getenv("INTENCIONES_ACTIVAS", "1").lower() in ("1", "true", "si", "yes")
+# Una respuesta fija solo si los patrones explican todas las palabras del mensaje (sin relleno):
+# cualquier pregunta que sobre va al modelo
+UMBRAL_COMPLETO = 1.0
+
+ENLACE_FORMATO_PROPUESTA = (
+    "<a href='https://www.dropbox.com/scl/fi/zuibj62g5wjsdzcovf4pb/FICHA-DE-EMPRENDORES_NOMBRE-NEGOCIO.docx?rlkey=sec681vbpcthobyjvzqacs084&st=a6actt9m&dl=0' target='_blank'>Formato Propuesta WORD</a>"
+)
+
+# Artículos, conjunciones y cortesías: no cuentan a favor ni en contra de la confianza
+RELLENO = {
+    "a", "al", "de", "del", "el", "la", "las", "los", "un", "una", "y", "e", "o",
+    "por", "favor", "porfa", "porfavor", "pls", "ok", "okay", "oki", "vale", "bueno", "pues", "oye",
+}
+
+
+def normalizar(texto):
+    texto = unicodedata.normalize("NFKD", texto.lower())
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    return " ".join(re.findall(r"\w+", texto))
+
+
+class Intencion:
+    # respuesta: texto fijo (admite {nombre}) o función (user_identity, mensaje) -> texto
+    def __init__(self, nombre, patrones, respuesta, umbral=None):
+        self.nombre = nombre
+        self.patrones = [re.compile(p) for p in patrones]
+        self.respuesta = respuesta
+        self.umbral = umbral
+
+    def confianza(self, normalizado, palabras):
+        # Fracción de las palabras con contenido que caen dentro de algún patrón (0 si ninguno coincide)
+        tramos = [m.span() for patron in self.patrones for m in patron.finditer(normalizado) if m.end() > m.start()]
+        if not tramos:
+            return 0.0
+        contenido = [(inicio, fin) for palabra, inicio, fin in palabras if palabra not in RELLENO]
+        if not contenido:
+            return 1.0
+        cubiertas = sum(1 for inicio, fin in contenido if any(a <= inicio and fin <= b for a, b in tramos))
+        return cubiertas / len(contenido)
+
+
+class EnrutadorIntenciones:
+    # Se consulta antes de llamar al modelo: si una intención explica el mensaje se responde al instante
+    def __init__(self, umbral=UMBRAL_COMPLETO, activo=INTENCIONES_ACTIVAS, obtener_nombre=None):
+        self.umbral = umbral
+        self.activo = activo
+        self.obtener_nombre = obtener_nombre
+        self._intenciones = []
+        self._lock = threading.Lock()
+        self._stats = {"al_modelo": 0}
+
+    def registrar(self, nombre, patrones, respuesta, umbral=None):
+        # Las intenciones registradas antes ganan los empates. Un umbral menor que el completo
+        # solo tiene sentido para acciones con BD cuyos patrones ya exigen las palabras clave
+        with self._lock:
+            self._intenciones.append(Intencion(nombre, patrones, respuesta, umbral))
+            self._stats.setdefault(nombre, 0)
+
+    def clasificar(self, mensaje):
+        # (intención, confianza) o None si ninguna supera su umbral y el turno debe ir al modelo
+        if not self.activo or not mensaje:
+            return None
+        normalizado = normalizar(mensaje)
+        palabras = [(m.group(), m.start(), m.end()) for m in re.finditer(r"\w+", normalizado)]
+        mejor, mejor_confianza = None, 0.0
+        for intencion in self._intenciones:
+            confianza = intencion.confianza(normalizado, palabras)
+            umbral = self.umbral if intencion.umbral is None else intencion.umbral
+            if confianza > mejor_confianza and confianza >= umbral and confianza > 0:
+                mejor, mejor_confianza = intencion, confianza
+        return (mejor, mejor_confianza) if mejor else None
+
+    def resolver(self, user_identity, mensaje):
+        # Texto de la respuesta, o None para seguir con el modelo
+        clasificado = self.clasificar(mensaje)
+        if clasificado is None:
+            with self._lock:
+                self._stats["al_modelo"] += 1
+            return None
+        intencion, confianza = clasificado
+        if callable(intencion.respuesta):
+            respuesta = intencion.respuesta(user_identity, mensaje)
+        elif "{nombre}" in intencion.respuesta:
+            nombre = self.obtener_nombre(user_identity) if self.obtener_nombre else None
+            respuesta = intencion.respuesta.format(nombre=f", {nombre}" if nombre else "")
+        else:
+            respuesta = intencion.respuesta
+        with self._lock:
+            self._stats[intencion.nombre] += 1
+        metricas.incrementar("chatbot_intenciones_total", intencion=intencion.nombre)
+        logging.info(f"🧭 Intención {intencion.nombre} ({confianza:.2f}) resuelta sin el modelo")
+        return respuesta
+
+    def estadisticas(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats["activo"] = self.activo
+        return stats
+
+
+def registrar_intenciones_base(enrutador):
+    enrutador.registrar("saludo", [
+        r"\b(hola+|holi|hey|saludos|buen(os|as)? (dias|tardes|noches)|buenas)( (innovug|chatbot|bot|asistente))?\b",
+        r"\b(que tal|como (estas|esta|te va|le va))\b",
+    ], (
+        "¡Hola{nombre}! 👋\n\n"
+        "**¿En qué te puedo ayudar?**\n\n"
+        "➡️  *Hacer preguntas sobre INNOVUG*❓\n\n"
+        "➡️  *Subir tu propuesta en PDF para que la analice y la evalúe con criterios técnicos📄*"
+    ))
+    enrutador.registrar("agradecimiento", [
+        r"\b((muchas|mil|muchisimas) )?gracias( (por (la|tu|su) (ayuda|respuesta|informacion)|por todo))?"
+        r"( (innovug|chatbot|bot|asistente))?\b",
+        r"\b(te|le) agradezco\b",
+        r"\b(genial|excelente|perfecto|listo|entendido|super)\b(?=.*\bgracias\b)",
+    ], "¡Con gusto! 😊 Si tienes otra pregunta sobre INNOVUG o quieres que evalúe tu propuesta, aquí estoy.")
+    enrutador.registrar("despedida", [
+        r"\b(adios|chao|chau|bye|hasta (luego|pronto|manana)|nos vemos)\b",
+    ], "¡Hasta pronto! 👋 Mucho éxito con tu emprendimiento. 🚀")
+    enrutador.registrar("como_enviar", [
+        r"\b(como|donde|cuando) (puedo |debo |se |hago para |tengo que )?"
+        r"(envi|mand|sub|present|entreg|postul|carg)\w* (mi |la |el |una |un )?"
+        r"(propuesta|proyecto|idea|ficha|emprendimiento|pdf|documento)\b",
+        r"\b(quiero|deseo|me gustaria|necesito) (enviar|mandar|subir|presentar|entregar|postular|cargar)"
+        r"( (mi |la |el |una |un )?(propuesta|proyecto|idea|ficha|emprendimiento|pdf|documento))?\b",
+        r"\b(como|donde) (puedo )?(particip|postul|inscrib)\w*\b",
+        r"\b(pasos|proceso|requisitos) (para|de) (enviar|presentar|postular|participar)\b",
+    ], (
+        "📄 Para presentar tu propuesta:\n\n"
+        f"1. Descarga el formato oficial: {ENLACE_FORMATO_PROPUESTA}\n"
+        "2. Complétalo (del líder del proyecto son obligatorios nombres, apellidos y cédula) y guárdalo en PDF.\n"
+        "3. Súbelo aquí en el chat: lo evalúo con los 5 criterios (problema y solución, mercado, competencia, "
+        "modelo de negocio y escalabilidad).\n\n"
+        "Con un promedio de 8 o más queda aprobada por el chatbot ✅; si no, queda pendiente de revisión."
+    ))
+    enrutador.registrar("plantilla", [
+        r"\b((donde|como) (puedo |se )?(descarg|obten|consig|encuentr|bajo|baj)\w* |"
+        r"(pasa|envia|manda|comparte|da)(me|nos) |(necesito|quiero|tienes|tienen) |(link|enlace|url) (de |del )?)?"
+        r"(el |la )?(formato|plantilla|ficha)( oficial)?( de (la )?(propuesta|proyecto|emprendedores|postulacion))?"
+        r"( (en )?word)?\b",
+    ], f"📄 Aquí tienes el formato oficial de la propuesta: {ENLACE_FORMATO_PROPUESTA}\n\nComplétalo y súbelo en PDF para que lo evalúe.")
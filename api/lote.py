@@ -0,0 +1,215 @@
+import os
+import csv
+import json
+import time
+import logging
+import argparse
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+LOTE_USUARIO = os.getenv("LOTE_USUARIO", "lote_innovug")
+LOTE_PARALELO = int(os.getenv("LOTE_PARALELO", "4"))
+# Parte de OPENAI_RPM/OPENAI_TPM que puede usar el lote; el resto queda para el chat en vivo
+LOTE_FRACCION_CUOTA = float(os.getenv("LOTE_FRACCION_CUOTA", "0.5"))
+PROGRESO_NOMBRE = ".lote_progreso.jsonl"
+# Resultados que no se repiten al reanudar; los errores sí se reintentan
+RESULTADOS_FINALES = ("evaluada", "formato_invalido", "incompleta")
+COLUMNAS = ("archivo", "resultado", "promedio", "proposal_status", "proyecto_existente", "via_extraccion",
+            "duracion_ms", "hash_bytes", "error", "fecha")
+
+
+def listar_pdfs(directorio, recursivo=False):
+    if not recursivo:
+        return sorted(
+            os.path.join(directorio, nombre) for nombre in os.listdir(directorio)
+            if nombre.lower().endswith(".pdf") and os.path.isfile(os.path.join(directorio, nombre))
+        )
+    return sorted(
+        os.path.join(raiz, nombre)
+        for raiz, _, nombres in os.walk(directorio)
+        for nombre in nombres if nombre.lower().endswith(".pdf")
+    )
+
+
+def leer_progreso(ruta):
+    # Última línea por hash de bytes: un archivo renombrado o copiado no se evalúa de nuevo
+    progreso = {}
+    try:
+        with open(ruta, "r", encoding="utf-8") as f:
+            for linea in f:
+                try:
+                    fila = json.loads(linea)
+                except ValueError:
+                    continue  # línea a medias de una ejecución interrumpida
+                progreso[fila["hash_bytes"]] = fila
+    except OSError:
+        pass
+    return progreso
+
+
+class EvaluacionLote:
+    def __init__(self, directorio, usuario=LOTE_USUARIO, paralelo=LOTE_PARALELO, ruta_progreso=None,
+                 recursivo=False):
+        self.directorio = directorio
+        self.usuario = usuario
+        self.paralelo = paralelo
+        self.ruta_progreso = ruta_progreso or os.path.join(directorio, PROGRESO_NOMBRE)
+        self.recursivo = recursivo
+        self._lock = threading.Lock()
+        self._hechos = 0
+
+    def _registrar(self, fila):
+        with self._lock:
+            with open(self.ruta_progreso, "a", encoding="utf-8") as f:
+                f.write(json.dumps(fila, ensure_ascii=False) + "\n")
+
+    def evaluar_archivo(self, ruta, hash_bytes, datos_pdf):
+        from api.chat import (
+            procesar_propuesta_pdf, calcular_promedio_y_estado,
+            MENSAJE_FORMATO_INVALIDO, MENSAJE_PROPUESTA_INCOMPLETA
+        )
+        etapas = {}
+        inicio = time.perf_counter()
+        fila = {"archivo": os.path.relpath(ruta, self.directorio), "hash_bytes": hash_bytes,
+                "promedio": None, "proposal_status": None, "proyecto_existente": None, "via_extraccion": None,
+                "error": None}
+        try:
+            # Un PDF que ya envió un estudiante conserva su proyecto: el lote no lo duplica
+            respuesta = procesar_propuesta_pdf(self.usuario, datos_pdf, etapas, conversacion=False,
+                                               reutilizar_proyecto=True)
+            if respuesta == MENSAJE_FORMATO_INVALIDO:
+                fila["resultado"] = "formato_invalido"
+            elif respuesta == MENSAJE_PROPUESTA_INCOMPLETA:
+                fila["resultado"] = "incompleta"
+            else:
+                fila["resultado"] = "evaluada"
+                fila["promedio"], fila["proposal_status"] = calcular_promedio_y_estado(respuesta)
+        except Exception as e:
+            fila["resultado"] = "error"
+            fila["error"] = str(e) or e.__class__.__name__
+        fila["via_extraccion"] = etapas.get("via_extraccion")
+        fila["proyecto_existente"] = etapas.get("proyecto_existente")
+        fila["duracion_ms"] = round((time.perf_counter() - inicio) * 1000, 1)
+        fila["fecha"] = datetime.now().isoformat(timespec="seconds")
+        self._registrar(fila)
+        return fila
+
+    def ejecutar(self):
+        from api.chat import generar_hash_bytes, set_user_name
+        from api.extraccion_pdf import extractor_pdf
+
+        rutas = listar_pdfs(self.directorio, self.recursivo)
+        progreso = leer_progreso(self.ruta_progreso)
+        filas, pendientes, copias = [], [], {}
+        for ruta in rutas:
+            with open(ruta, "rb") as f:
+                datos_pdf = f.read()
+            hash_bytes = generar_hash_bytes(datos_pdf)
+            previa = progreso.get(hash_bytes)
+            if previa and previa["resultado"] in RESULTADOS_FINALES:
+                filas.append(dict(previa, archivo=os.path.relpath(ruta, self.directorio)))
+            elif hash_bytes in copias:
+                # Mismo archivo dos veces en el lote: se evalúa una sola y la copia toma su resultado
+                copias[hash_bytes].append(ruta)
+            else:
+                copias[hash_bytes] = []
+                pendientes.append((ruta, hash_bytes))
+        logging.info(f"📦 {len(rutas)} PDF en {self.directorio}: {len(filas)} ya evaluados, {len(pendientes)} pendientes")
+        if not pendientes:
+            return filas
+
+        # Las propuestas del lote quedan a nombre de este usuario (projects.user_identity)
+        set_user_name(self.usuario, "Evaluación por lotes")
+        total = len(pendientes)
+
+        def una(ruta, hash_bytes):
+            # Se relee en el hilo: no se mantienen cientos de PDF en memoria
+            with open(ruta, "rb") as f:
+                return self.evaluar_archivo(ruta, hash_bytes, f.read())
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.paralelo, thread_name_prefix="lote") as ejecutor:
+                futuros = [ejecutor.submit(una, ruta, hash_bytes) for ruta, hash_bytes in pendientes]
+                for futuro in as_completed(futuros):
+                    fila = futuro.result()
+                    filas.append(fila)
+                    filas.extend(dict(fila, archivo=os.path.relpath(copia, self.directorio))
+                                 for copia in copias[fila["hash_bytes"]])
+                    with self._lock:
+                        self._hechos += 1
+                        hechos = self._hechos
+                    detalle = f"{fila['promedio']} {fila['proposal_status']}" if fila["resultado"] == "evaluada" \
+                        else (fila["error"] or "")
+                    logging.info(f"📄 [{hechos}/{total}] {fila['archivo']} → {fila['resultado']} {detalle} "
+                                 f"({fila['duracion_ms']:.0f} ms)")
+        finally:
+            extractor_pdf.cerrar()
+        return filas
+
+
+def guardar_resumen(filas, ruta_csv=None, ruta_json=None):
+    filas = sorted(filas, key=lambda fila: fila["archivo"])
+    if ruta_csv:
+        with open(ruta_csv, "w", encoding="utf-8", newline="") as f:
+            escritor = csv.DictWriter(f, fieldnames=COLUMNAS, extrasaction="ignore")
+            escritor.writeheader()
+            escritor.writerows(filas)
+    if ruta_json:
+        with open(ruta_json, "w", encoding="utf-8") as f:
+            json.dump(filas, f, indent=2, ensure_ascii=False)
+
+
+def ajustar_cliente_openai(paralelo, fraccion):
+    # El proceso del lote tiene su propio limitador: se le da solo una parte de la cuota de la cuenta
+    # y, como todas las llamadas van a nombre de un mismo usuario, cupo para sus hilos (2 llamadas por PDF)
+    from api.cliente_openai import cliente_openai, CuboTokens, OPENAI_RPM, OPENAI_TPM
+    cliente_openai.peticiones = CuboTokens(OPENAI_RPM * fraccion)
+    cliente_openai.tokens = CuboTokens(OPENAI_TPM * fraccion)
+    cliente_openai.max_por_usuario = max(cliente_openai.max_por_usuario, paralelo * 2)
+    cliente_openai.max_concurrentes = max(cliente_openai.max_concurrentes, paralelo * 2)
+    # En un lote se espera el turno lo que haga falta en lugar de fallar a los 60 s
+    cliente_openai.timeout_cola = max(cliente_openai.timeout_cola, 3600)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="python -m api.lote",
+        description="Evalúa todas las propuestas PDF de un directorio con el mismo flujo del chat"
+    )
+    parser.add_argument("directorio")
+    parser.add_argument("--paralelo", type=int, default=LOTE_PARALELO, help="PDF evaluados a la vez")
+    parser.add_argument("--usuario", default=LOTE_USUARIO, help="identity a cuyo nombre quedan las propuestas")
+    parser.add_argument("--fraccion-cuota", type=float, default=LOTE_FRACCION_CUOTA,
+                        help="parte de OPENAI_RPM/OPENAI_TPM que usa el lote (0-1)")
+    parser.add_argument("--csv", help="resumen en CSV (por defecto resumen_lote.csv en el directorio)")
+    parser.add_argument("--json", help="resumen en JSON")
+    parser.add_argument("--progreso", help=f"archivo de progreso para reanudar (por defecto {PROGRESO_NOMBRE})")
+    parser.add_argument("--recursivo", action="store_true", help="incluir subdirectorios")
+    args = parser.parse_args()
+
+    from api.metricas import configurar_logging
+    configurar_logging()
+    if not os.path.isdir(args.directorio):
+        parser.error(f"no existe el directorio {args.directorio}")
+
+    ajustar_cliente_openai(args.paralelo, min(max(args.fraccion_cuota, 0.01), 1.0))
+    lote = EvaluacionLote(args.directorio, args.usuario, args.paralelo, args.progreso, args.recursivo)
+    filas = lote.ejecutar()
+    ruta_csv = args.csv or os.path.join(args.directorio, "resumen_lote.csv")
+    guardar_resumen(filas, ruta_csv, args.json)
+
+    conteo = {}
+    for fila in filas:
+        conteo[fila["resultado"]] = conteo.get(fila["resultado"], 0) + 1
+    print(f"✅ {len(filas)} PDF: {', '.join(f'{n} {r}' for r, n in sorted(conteo.items()))}. Resumen en {ruta_csv}")
+    # Con errores se sale con 1: basta con volver a ejecutar para reintentarlos
+    raise SystemExit(1 if conteo.get("error") else 0)
+
+
+if __name__ == "__main__":
+    main()
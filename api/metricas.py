@@ -0,0 +1,174 @@
+import os
+import time
+import uuid
+import logging
+import threading
+import functools
+import contextvars
+from contextlib import contextmanager, nullcontext
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Desactivadas, los decoradores devuelven la función original y las mediciones no hacen nada
+METRICAS_ACTIVAS = os.getenv("METRICAS_ACTIVAS", "0").lower() in ("1", "true", "si", "yes")
+BUCKETS_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# 🏷️ Id de la petición en curso; se propaga a los logs y a los hilos que copian el contexto
+request_id_actual = contextvars.ContextVar("request_id", default="-")
+
+
+def nuevo_request_id():
+    return uuid.uuid4().hex[:12]
+
+
+class FiltroRequestId(logging.Filter):
+    def filter(self, record):
+        record.request_id = request_id_actual.get()
+        return True
+
+
+def configurar_logging():
+    nivel = os.getenv("LOG_LEVEL", "WARNING").upper()
+    logging.basicConfig(level=nivel, format="%(asctime)s %(levelname)s [%(request_id)s] %(message)s")
+    for handler in logging.getLogger().handlers:
+        if not any(isinstance(f, FiltroRequestId) for f in handler.filters):
+            handler.addFilter(FiltroRequestId())
+
+
+def _etiquetas(etiquetas):
+    return tuple(sorted((k, str(v)) for k, v in etiquetas.items()))
+
+
+def _escapar(valor):
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _formatear_etiquetas(etiquetas, extra=()):
+    pares = list(etiquetas) + list(extra)
+    if not pares:
+        return ""
+    return "{" + ",".join(f'{k}="{_escapar(v)}"' for k, v in pares) + "}"
+
+
+class Metricas:
+    def __init__(self, activas=METRICAS_ACTIVAS, buckets=BUCKETS_SEGUNDOS):
+        self.activas = activas
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._ayuda = {}
+        # nombre -> etiquetas -> [conteos por bucket, suma, total]
+        self._histogramas = {}
+        # nombre -> etiquetas -> valor
+        self._contadores = {}
+        # componente -> función que devuelve su dict de estadísticas
+        self._estados = {}
+
+    def describir(self, nombre, ayuda):
+        self._ayuda[nombre] = ayuda
+
+    def observar(self, nombre, valor, **etiquetas):
+        if not self.activas:
+            return
+        clave = _etiquetas(etiquetas)
+        with self._lock:
+            serie = self._histogramas.setdefault(nombre, {}).get(clave)
+            if serie is None:
+                serie = [[0] * len(self.buckets), 0.0, 0]
+                self._histogramas[nombre][clave] = serie
+            for i, limite in enumerate(self.buckets):
+                if valor <= limite:
+                    serie[0][i] += 1
+            serie[1] += valor
+            serie[2] += 1
+
+    def incrementar(self, nombre, valor=1, **etiquetas):
+        if not self.activas:
+            return
+        clave = _etiquetas(etiquetas)
+        with self._lock:
+            serie = self._contadores.setdefault(nombre, {})
+            serie[clave] = serie.get(clave, 0) + valor
+
+    @contextmanager
+    def _medir(self, nombre, etiquetas):
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observar(nombre, time.perf_counter() - inicio, **etiquetas)
+
+    def medir(self, nombre, **etiquetas):
+        return self._medir(nombre, etiquetas) if self.activas else nullcontext()
+
+    def cronometrar(self, nombre, **etiquetas):
+        # Decorador: histograma de duración de cada llamada, etiquetado con el nombre de la función
+        def decorador(funcion):
+            if not self.activas:
+                return funcion
+            etiquetas_funcion = dict(etiquetas, funcion=funcion.__name__)
+
+            @functools.wraps(funcion)
+            def envoltura(*args, **kwargs):
+                with self._medir(nombre, etiquetas_funcion):
+                    return funcion(*args, **kwargs)
+            return envoltura
+        return decorador
+
+    def registrar_estado(self, componente, funcion):
+        # Las estadísticas existentes (pool, colas, cachés…) se exportan como gauges al hacer scrape
+        self._estados[componente] = funcion
+
+    def _gauges_estado(self):
+        lineas = ["# HELP chatbot_estado Estadísticas internas de cada componente", "# TYPE chatbot_estado gauge"]
+        for componente, funcion in sorted(self._estados.items()):
+            try:
+                estado = funcion()
+            except Exception as e:
+                logging.error(f"❌ Error leyendo estadísticas de {componente}: {e}")
+                continue
+            pendientes = [("", estado)]
+            while pendientes:
+                prefijo, valor = pendientes.pop()
+                if isinstance(valor, dict):
+                    pendientes.extend((f"{prefijo}_{k}" if prefijo else str(k), v) for k, v in valor.items())
+                elif isinstance(valor, (bool, int, float)):
+                    etiquetas = _formatear_etiquetas((("componente", componente), ("clave", prefijo)))
+                    lineas.append(f"chatbot_estado{etiquetas} {float(valor)}")
+        return lineas
+
+    def exportar(self):
+        lineas = []
+        with self._lock:
+            histogramas = {n: {e: [list(s[0]), s[1], s[2]] for e, s in series.items()} for n, series in self._histogramas.items()}
+            contadores = {n: dict(series) for n, series in self._contadores.items()}
+
+        for nombre, series in sorted(histogramas.items()):
+            lineas.append(f"# HELP {nombre} {self._ayuda.get(nombre, nombre)}")
+            lineas.append(f"# TYPE {nombre} histogram")
+            for etiquetas, (conteos, suma, total) in sorted(series.items()):
+                for limite, conteo in zip(self.buckets, conteos):
+                    lineas.append(f"{nombre}_bucket{_formatear_etiquetas(etiquetas, (('le', f'{limite:g}'),))} {conteo}")
+                lineas.append(f"{nombre}_bucket{_formatear_etiquetas(etiquetas, (('le', '+Inf'),))} {total}")
+                lineas.append(f"{nombre}_sum{_formatear_etiquetas(etiquetas)} {suma}")
+                lineas.append(f"{nombre}_count{_formatear_etiquetas(etiquetas)} {total}")
+
+        for nombre, series in sorted(contadores.items()):
+            lineas.append(f"# HELP {nombre} {self._ayuda.get(nombre, nombre)}")
+            lineas.append(f"# TYPE {nombre} counter")
+            for etiquetas, valor in sorted(series.items()):
+                lineas.append(f"{nombre}{_formatear_etiquetas(etiquetas)} {valor}")
+
+        lineas.extend(self._gauges_estado())
+        return "\n".join(lineas) + "\n"
+
+
+metricas = Metricas()
+metricas.describir("chatbot_http_segundos", "Duración de las peticiones HTTP por endpoint")
+metricas.describir("chatbot_etapa_segundos", "Duración de cada etapa del procesamiento de una propuesta o turno")
+metricas.describir("chatbot_openai_segundos", "Duración de cada llamada a OpenAI, reintentos incluidos")
+metricas.describir("chatbot_openai_tokens_total", "Tokens de prompt y de respuesta reportados por OpenAI")
+metricas.describir("chatbot_openai_llamadas_total", "Llamadas a OpenAI por operación y resultado")
+metricas.describir("chatbot_db_segundos", "Duración de cada función de acceso a la base de datos")
+metricas.describir("chatbot_intenciones_total", "Turnos respondidos por el enrutador de intenciones sin llamar al modelo")
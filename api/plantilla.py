@@ -0,0 +1,142 @@
+import re
+import unicodedata
+
+# Etiquetas de la ficha oficial (doc_003.pdf), ya normalizadas, y su campo en el JSON de la propuesta
+CAMPOS_LIDER = {
+    "nombres": "nombres",
+    "apellidos": "apellidos",
+    "cedula": "cedula",
+    "facultad": "facultad",
+    "carrera": "carrera",
+    "numero de telefono": "numero_de_telefono",
+    "correo electronico": "correo_electronico",
+    "semestre que cursa": "semestre_que_cursa",
+}
+CAMPOS_EQUIPO = {
+    "nombres": "nombres",
+    "apellidos": "apellidos",
+    "cedula": "cedula",
+    "rol": "rol",
+    "funcion": "funcion",
+}
+SECCIONES_NEGOCIO = {
+    "nombre del negocio": "nombre_del_negocio",
+    "problema y solucion": "problema_y_solucion",
+    "mercado": "mercado",
+    "competencia": "competencia",
+    "modelo de negocio": "modelo_de_negocio",
+    "escalabilidad": "escalabilidad",
+}
+LIDER_OBLIGATORIOS = ("nombres", "apellidos", "cedula")
+# Ejemplos de la tabla de equipo ("Nombres del Líder", "Rol de Integrante 2"), también cuando un salto de página los parte
+EJEMPLO_EQUIPO = re.compile(r"^(nombres|apellidos|cedula|rol|funciones) (del lider|de integrante( \w+)?)$")
+
+
+def normalizar_celda(celda):
+    texto = unicodedata.normalize("NFKD", celda or "").encode("ascii", "ignore").decode("utf-8")
+    return re.sub(r"\s+", " ", texto.lower()).strip().rstrip(":").strip()
+
+
+def limpiar_valor(celda):
+    # Los saltos de línea dentro de una celda son del ajuste de texto, no del contenido
+    return re.sub(r"\s+", " ", celda or "").strip()
+
+
+class ParserPlantilla:
+    def __init__(self, tablas_referencia):
+        # Todo el texto fijo de la plantilla (instrucciones, ejemplos, "Elija un elemento.") se ignora como respuesta
+        celdas = [normalizar_celda(c) for tabla in tablas_referencia for fila in tabla for c in fila if c]
+        self._celdas_plantilla = set(celdas)
+        self._texto_plantilla = " ".join(celdas)
+
+    def es_texto_plantilla(self, celda):
+        texto = normalizar_celda(celda)
+        if not texto or texto in self._celdas_plantilla or texto.startswith("[reemplaza") or EJEMPLO_EQUIPO.match(texto):
+            return True
+        # Instrucciones que un salto de página partió distinto que en la plantilla
+        return len(texto) >= 12 and texto in self._texto_plantilla
+
+    def _valor(self, celda):
+        return "" if self.es_texto_plantilla(celda) else limpiar_valor(celda)
+
+    def _encabezado_equipo(self, fila):
+        columnas = {}
+        for i, celda in enumerate(fila):
+            campo = CAMPOS_EQUIPO.get(normalizar_celda(celda))
+            if campo:
+                columnas[campo] = i
+        return columnas if len(columnas) == len(CAMPOS_EQUIPO) else None
+
+    def _seccion(self, fila):
+        for i, celda in enumerate(fila):
+            seccion = SECCIONES_NEGOCIO.get(normalizar_celda(celda))
+            if seccion:
+                return i, seccion
+        return None, None
+
+    def analizar(self, tablas):
+        # Devuelve el JSON de la propuesta o None si el documento no sigue la plantilla
+        datos = {campo: "" for campo in list(SECCIONES_NEGOCIO.values()) + list(CAMPOS_LIDER.values())}
+        lider_encontrados = set()
+        columnas_equipo = None
+        filas_equipo = []
+        respuestas = {seccion: [] for seccion in SECCIONES_NEGOCIO.values()}
+        secciones_encontradas = set()
+        seccion_actual = None
+
+        for tabla in tablas:
+            if seccion_actual is None and not any(self._seccion(fila)[1] for fila in tabla):
+                for indice_fila, fila in enumerate(tabla):
+                    # Ficha del líder: "Etiqueta:" | valor
+                    etiqueta = fila[0] or ""
+                    campo = CAMPOS_LIDER.get(normalizar_celda(etiqueta))
+                    if columnas_equipo is None and campo and etiqueta.strip().endswith(":"):
+                        lider_encontrados.add(campo)
+                        datos[campo] = next((self._valor(c) for c in fila[1:] if c and self._valor(c)), "")
+                        continue
+
+                    encabezado = self._encabezado_equipo(fila)
+                    if encabezado:
+                        columnas_equipo = encabezado
+                        continue
+                    if columnas_equipo is None or len(fila) <= max(columnas_equipo.values()):
+                        continue
+
+                    integrante = {campo: limpiar_valor(fila[i]) for campo, i in columnas_equipo.items()}
+                    previo = filas_equipo[-1] if filas_equipo else None
+                    # Fila partida por un salto de página: continúa la última fila de la tabla anterior
+                    if (indice_fila == 0 and previo and not fila[0] and not integrante["rol"]
+                            and not integrante["funcion"] and (previo["rol"] or previo["funcion"])):
+                        for campo, valor in integrante.items():
+                            previo[campo] = limpiar_valor(f"{previo[campo]} {valor}")
+                        continue
+                    filas_equipo.append(integrante)
+                continue
+
+            for fila in tabla:
+                indice, seccion = self._seccion(fila)
+                if seccion:
+                    seccion_actual = seccion
+                    secciones_encontradas.add(seccion)
+                if seccion_actual is None:
+                    continue
+                for i, celda in enumerate(fila):
+                    if i == indice or celda is None:
+                        continue
+                    valor = self._valor(celda)
+                    if valor:
+                        respuestas[seccion_actual].append(valor)
+
+        if (columnas_equipo is None
+                or not all(c in lider_encontrados for c in LIDER_OBLIGATORIOS)
+                or len(secciones_encontradas) != len(SECCIONES_NEGOCIO)):
+            return None
+
+        for seccion, partes in respuestas.items():
+            datos[seccion] = "\n".join(partes)
+        datos["equipo_integrantes"] = [
+            {campo: self._valor(valor) for campo, valor in integrante.items()}
+            for integrante in filas_equipo
+            if any(self._valor(valor) for valor in integrante.values())
+        ]
+        return datos
@@ -0,0 +1,254 @@
+import os
+import re
+import io
+import json
+import math
+import logging
+import threading
+import unicodedata
+from collections import Counter, defaultdict
+
+from dotenv import load_dotenv
+
+from api.extraccion_pdf import extractor_pdf
+
+load_dotenv()
+
+DOCUMENTS_DIR = os.getenv("DOCUMENTS_DIR", os.path.join(os.path.dirname(__file__), "..", "documents"))
+INDICE_DOCUMENTOS_PATH = os.getenv(
+    "INDICE_DOCUMENTOS_PATH",
+    os.path.join(os.path.dirname(__file__), "contextos", "indice_documentos.json")
+)
+INDICE_PALABRAS_POR_FRAGMENTO = int(os.getenv("INDICE_PALABRAS_POR_FRAGMENTO", "180"))
+INDICE_SOLAPAMIENTO = int(os.getenv("INDICE_SOLAPAMIENTO", "40"))
+# Fragmentos que se inyectan por turno (0 = desactivado)
+INDICE_TOP_K = int(os.getenv("INDICE_TOP_K", "4"))
+
+EXTENSIONES_INDEXABLES = (".pdf", ".xlsx", ".xls", ".csv", ".txt", ".md", ".docx")
+
+STOPWORDS = {
+    "a", "al", "ante", "como", "con", "cual", "de", "del", "desde", "donde", "el", "ella", "en", "entre",
+    "es", "esta", "este", "esto", "ha", "hay", "la", "las", "le", "les", "lo", "los", "mas", "me", "mi",
+    "muy", "no", "o", "para", "pero", "por", "que", "se", "si", "sin", "sobre", "son", "su", "sus", "te",
+    "tu", "un", "una", "uno", "y", "ya", "yo",
+}
+
+
+def tokenizar(texto):
+    texto = unicodedata.normalize("NFKD", texto.lower())
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    return [t for t in re.findall(r"\w+", texto) if len(t) > 1 and t not in STOPWORDS]
+
+
+def fragmentar(texto, palabras=INDICE_PALABRAS_POR_FRAGMENTO, solapamiento=INDICE_SOLAPAMIENTO):
+    # Ventanas de palabras con solapamiento para no cortar una idea entre dos fragmentos
+    tokens = texto.split()
+    if not tokens:
+        return []
+    paso = max(1, palabras - solapamiento)
+    return [" ".join(tokens[i:i + palabras]) for i in range(0, max(1, len(tokens) - solapamiento), paso)]
+
+
+def leer_texto_documento(ruta):
+    extension = os.path.splitext(ruta)[1].lower()
+    if extension == ".pdf":
+        return "\n".join(extractor_pdf.extraer_paginas(ruta))
+    if extension in (".xlsx", ".xls", ".csv"):
+        import pandas as pd
+        if extension == ".csv":
+            hojas = {"": pd.read_csv(ruta)}
+        else:
+            hojas = pd.read_excel(ruta, sheet_name=None)
+        lineas = []
+        for nombre, df in hojas.items():
+            for _, fila in df.dropna(how="all").iterrows():
+                valores = [f"{col}: {val}" for col, val in fila.items() if str(val).strip() and str(val) != "nan"]
+                if valores:
+                    lineas.append(f"{nombre} | " + "; ".join(valores) if nombre else "; ".join(valores))
+        return "\n".join(lineas)
+    if extension == ".docx":
+        import docx
+        with open(ruta, "rb") as f:
+            documento = docx.Document(io.BytesIO(f.read()))
+        return "\n".join(p.text for p in documento.paragraphs)
+    with open(ruta, "r", encoding="utf-8", errors="ignore") as f:
+        return f.read()
+
+
+class IndiceDocumentos:
+    def __init__(self, directorio=DOCUMENTS_DIR, ruta=INDICE_DOCUMENTOS_PATH, k1=1.5, b=0.75):
+        self.directorio = directorio
+        self.ruta = ruta
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.RLock()
+        # nombre -> {"mtime", "tamano", "fragmentos": [texto], "terminos": [{termino: frecuencia}]}
+        self._documentos = {}
+        self._mtime_cargado = None
+        self._postings = {}
+        self._fragmentos = []
+        self._longitudes = []
+        self._longitud_media = 0.0
+        self._cargar()
+
+    # ---- Persistencia ----
+
+    def _cargar(self):
+        try:
+            mtime = os.stat(self.ruta).st_mtime_ns
+        except OSError:
+            return
+        try:
+            with open(self.ruta, "r", encoding="utf-8") as f:
+                datos = json.load(f)
+            with self._lock:
+                self._documentos = datos.get("documentos", {})
+                self._mtime_cargado = mtime
+                self._reconstruir()
+        except Exception as e:
+            logging.error(f"❌ No se pudo cargar el índice de documentos: {e}")
+
+    def _guardar(self):
+        os.makedirs(os.path.dirname(self.ruta) or ".", exist_ok=True)
+        temporal = f"{self.ruta}.{os.getpid()}.tmp"
+        with open(temporal, "w", encoding="utf-8") as f:
+            json.dump({"documentos": self._documentos}, f, ensure_ascii=False)
+        os.replace(temporal, self.ruta)
+        self._mtime_cargado = os.stat(self.ruta).st_mtime_ns
+
+    def _recargar_si_cambio(self):
+        # Otro worker pudo indexar un archivo subido: se relee el índice si cambió en disco
+        try:
+            mtime = os.stat(self.ruta).st_mtime_ns
+        except OSError:
+            return
+        if mtime != self._mtime_cargado:
+            self._cargar()
+
+    def _reconstruir(self):
+        postings = defaultdict(list)
+        fragmentos = []
+        longitudes = []
+        for nombre in sorted(self._documentos):
+            documento = self._documentos[nombre]
+            for texto, terminos in zip(documento["fragmentos"], documento["terminos"]):
+                indice = len(fragmentos)
+                fragmentos.append((nombre, texto))
+                longitudes.append(sum(terminos.values()))
+                for termino, frecuencia in terminos.items():
+                    postings[termino].append((indice, frecuencia))
+        self._postings = dict(postings)
+        self._fragmentos = fragmentos
+        self._longitudes = longitudes
+        self._longitud_media = (sum(longitudes) / len(longitudes)) if longitudes else 0.0
+
+    # ---- Actualización ----
+
+    def _indexar(self, ruta, texto=None):
+        fragmentos = fragmentar(leer_texto_documento(ruta) if texto is None else texto)
+        estado = os.stat(ruta)
+        return {
+            "mtime": estado.st_mtime,
+            "tamano": estado.st_size,
+            "fragmentos": fragmentos,
+            "terminos": [dict(Counter(tokenizar(f))) for f in fragmentos],
+        }
+
+    def agregar_documento(self, ruta, texto=None):
+        # texto: el ya extraído por quien guardó el archivo, para no leerlo dos veces
+        nombre = os.path.basename(ruta)
+        if not nombre.lower().endswith(EXTENSIONES_INDEXABLES):
+            return False
+        try:
+            documento = self._indexar(ruta, texto)
+        except Exception as e:
+            logging.error(f"❌ No se pudo indexar {nombre}: {e}")
+            return False
+        with self._lock:
+            self._recargar_si_cambio()
+            self._documentos[nombre] = documento
+            self._reconstruir()
+            self._guardar()
+        logging.info(f"📚 Documento indexado: {nombre} ({len(documento['fragmentos'])} fragmentos)")
+        return True
+
+    def sincronizar(self):
+        # Solo se reindexa lo nuevo o modificado; lo demás sale del índice en disco
+        try:
+            nombres = [n for n in os.listdir(self.directorio) if n.lower().endswith(EXTENSIONES_INDEXABLES)]
+        except OSError:
+            nombres = []
+        cambios = False
+        with self._lock:
+            self._recargar_si_cambio()
+            for nombre in list(self._documentos):
+                if nombre not in nombres:
+                    del self._documentos[nombre]
+                    cambios = True
+            for nombre in nombres:
+                ruta = os.path.join(self.directorio, nombre)
+                try:
+                    estado = os.stat(ruta)
+                except OSError:
+                    continue
+                previo = self._documentos.get(nombre)
+                if previo and previo["mtime"] == estado.st_mtime and previo["tamano"] == estado.st_size:
+                    continue
+                try:
+                    self._documentos[nombre] = self._indexar(ruta)
+                    cambios = True
+                    logging.info(f"📚 Documento indexado: {nombre}")
+                except Exception as e:
+                    logging.error(f"❌ No se pudo indexar {nombre}: {e}")
+            if cambios:
+                self._reconstruir()
+                self._guardar()
+        return cambios
+
+    def sincronizar_en_segundo_plano(self):
+        threading.Thread(target=self.sincronizar, name="indice-documentos", daemon=True).start()
+
+    # ---- Búsqueda ----
+
+    def buscar(self, consulta, k=INDICE_TOP_K):
+        if k <= 0:
+            return []
+        with self._lock:
+            self._recargar_si_cambio()
+            total = len(self._fragmentos)
+            if not total:
+                return []
+            puntajes = defaultdict(float)
+            for termino in set(tokenizar(consulta)):
+                postings = self._postings.get(termino)
+                if not postings:
+                    continue
+                idf = math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+                for indice, frecuencia in postings:
+                    normalizacion = 1 - self.b + self.b * self._longitudes[indice] / (self._longitud_media or 1)
+                    puntajes[indice] += idf * frecuencia * (self.k1 + 1) / (frecuencia + self.k1 * normalizacion)
+            mejores = sorted(puntajes.items(), key=lambda x: x[1], reverse=True)[:k]
+            return [
+                {"documento": self._fragmentos[i][0], "texto": self._fragmentos[i][1], "puntaje": round(p, 3)}
+                for i, p in mejores
+            ]
+
+    def cobertura(self, consulta):
+        # Parte de los términos de la consulta que aparecen en algún documento (0 si no tiene términos)
+        terminos = set(tokenizar(consulta))
+        if not terminos:
+            return 0.0
+        with self._lock:
+            self._recargar_si_cambio()
+            return sum(1 for termino in terminos if termino in self._postings) / len(terminos)
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                "documentos": len(self._documentos),
+                "fragmentos": len(self._fragmentos),
+                "terminos": len(self._postings),
+            }
+
+
+indice_documentos = IndiceDocumentos()
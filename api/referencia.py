@@ -0,0 +1,140 @@
+import os
+import json
+import hashlib
+import logging
+import threading
+
+from dotenv import load_dotenv
+
+from api.extraccion_pdf import extractor_pdf
+from api.plantilla import ParserPlantilla
+
+load_dotenv()
+
+REFERENCE_PDF_PATH = os.getenv(
+    "REFERENCE_PDF_PATH",
+    os.path.join(os.path.dirname(__file__), "..", "documents", "doc_003.pdf")
+)
+REFERENCIA_CACHE_PATH = os.getenv(
+    "REFERENCIA_CACHE_PATH",
+    os.path.join(os.path.dirname(__file__), "contextos", "referencia_cache.json")
+)
+# Cambiar si cambia la forma de extraer el texto o las tablas: invalida las cachés existentes
+VERSION_ARTEFACTOS = 1
+
+
+class ReferenciaPlantilla:
+    # Texto y tablas de la plantilla oficial, calculados una vez y guardados en disco.
+    # Nada se lee al importar: el primer PDF evaluado en cada worker los carga.
+    def __init__(self, ruta=REFERENCE_PDF_PATH, ruta_cache=REFERENCIA_CACHE_PATH):
+        self.ruta = ruta
+        self.ruta_cache = ruta_cache
+        self._lock = threading.Lock()
+        self._firma = None
+        self._artefactos = None
+        self._parser = None
+        self._stats = {"desde_disco": 0, "recalculadas": 0, "errores": 0}
+
+    def _firma_fuente(self):
+        info = os.stat(self.ruta)
+        return [info.st_size, info.st_mtime_ns]
+
+    def _leer_cache(self):
+        try:
+            with open(self.ruta_cache, "r", encoding="utf-8") as f:
+                cache = json.load(f)
+            return cache if cache.get("version") == VERSION_ARTEFACTOS else None
+        except (OSError, ValueError):
+            return None
+
+    def _guardar_cache(self, cache):
+        try:
+            os.makedirs(os.path.dirname(self.ruta_cache) or ".", exist_ok=True)
+            temporal = f"{self.ruta_cache}.{os.getpid()}.tmp"
+            with open(temporal, "w", encoding="utf-8") as f:
+                json.dump(cache, f, ensure_ascii=False)
+            os.replace(temporal, self.ruta_cache)
+        except OSError as e:
+            logging.warning(f"⚠️ No se pudo guardar la caché de la plantilla de referencia: {e}")
+
+    def _calcular(self, firma):
+        # La mtime cambia con un checkout o una copia; si el contenido es el mismo se reutiliza la caché
+        with open(self.ruta, "rb") as f:
+            datos = f.read()
+        sha256 = hashlib.sha256(datos).hexdigest()
+        cache = self._leer_cache()
+        if cache and cache.get("sha256") == sha256:
+            cache["firma"] = firma
+            self._guardar_cache(cache)
+            self._stats["desde_disco"] += 1
+            return cache
+
+        cache = {
+            "version": VERSION_ARTEFACTOS,
+            "firma": firma,
+            "sha256": sha256,
+            "texto": "\n".join(extractor_pdf.extraer_paginas(datos)).strip().lower(),
+            "tablas": extractor_pdf.extraer_tablas(datos) or [],
+        }
+        self._guardar_cache(cache)
+        self._stats["recalculadas"] += 1
+        logging.info(f"📐 Plantilla de referencia procesada y guardada en {self.ruta_cache}")
+        return cache
+
+    def _cargar(self):
+        try:
+            firma = self._firma_fuente()
+        except OSError as e:
+            with self._lock:
+                self._stats["errores"] += 1
+            logging.error(f"❌ No se encontró la plantilla de referencia: {e}")
+            return {"texto": "", "tablas": []}
+
+        with self._lock:
+            if self._artefactos is not None and self._firma == firma:
+                return self._artefactos
+            try:
+                cache = self._leer_cache()
+                if cache and cache.get("firma") == firma:
+                    self._stats["desde_disco"] += 1
+                else:
+                    cache = self._calcular(firma)
+            except Exception as e:
+                self._stats["errores"] += 1
+                logging.error(f"❌ No se pudo procesar la plantilla de referencia: {e}")
+                return {"texto": "", "tablas": []}
+            self._artefactos = {"texto": cache["texto"], "tablas": cache["tablas"]}
+            self._firma = firma
+            self._parser = None
+            return self._artefactos
+
+    def texto(self):
+        return self._cargar()["texto"]
+
+    def tablas(self):
+        return self._cargar()["tablas"]
+
+    def parser(self):
+        artefactos = self._cargar()
+        with self._lock:
+            if self._parser is None or self._artefactos is not artefactos:
+                self._parser = ParserPlantilla(artefactos["tablas"])
+            return self._parser
+
+    def estadisticas(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["cargada"] = self._artefactos is not None
+        return stats
+
+
+referencia_plantilla = ReferenciaPlantilla()
+
+
+if __name__ == "__main__":
+    # Precalcular la caché en el build para que ningún worker procese el PDF en frío
+    logging.basicConfig(level="INFO")
+    texto = referencia_plantilla.texto()
+    print(f"📐 Plantilla de referencia: {len(texto)} caracteres, {len(referencia_plantilla.tablas())} tablas "
+          f"({referencia_plantilla.estadisticas()})")
+    extractor_pdf.cerrar()
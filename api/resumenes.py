@@ -0,0 +1,197 @@
+import os
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from dotenv import load_dotenv
+
+from api.db import db_connection
+from api.esquema import asegurar_esquema
+from api.cliente_openai import cliente_openai
+
+load_dotenv()
+
+MODEL = os.getenv("MODEL")
+RESUMEN_ACTIVO = os.getenv("RESUMEN_ACTIVO", "1").lower() in ("1", "true", "si", "yes")
+# Mensajes sin resumir a partir de los cuales se comprime lo más antiguo
+RESUMEN_UMBRAL_MENSAJES = int(os.getenv("RESUMEN_UMBRAL_MENSAJES", "40"))
+# Mensajes recientes que siempre se conservan textuales
+RESUMEN_VENTANA_RECIENTE = int(os.getenv("RESUMEN_VENTANA_RECIENTE", "20"))
+# Mensajes máximos que se pasan al modelo en una actualización del resumen
+RESUMEN_LOTE_MAX = int(os.getenv("RESUMEN_LOTE_MAX", "200"))
+RESUMEN_WORKERS = int(os.getenv("RESUMEN_WORKERS", "1"))
+
+PREFIJO_RESUMEN = "🧾 Resumen de la conversación anterior con este usuario:\n"
+
+PROMPT_RESUMEN = """
+Eres un asistente que mantiene un resumen de una conversación entre un estudiante y el asistente de INNOVUG.
+Recibirás el resumen actual (puede estar vacío) y los mensajes nuevos que aún no están resumidos.
+Devuelve un único resumen actualizado, en español y en viñetas, que conserve:
+- datos personales y del proyecto que haya mencionado el usuario,
+- preguntas hechas y respuestas o decisiones importantes,
+- propuestas enviadas y resultados de sus evaluaciones.
+No inventes información y no superes las 300 palabras.
+""".strip()
+
+
+class ResumidorHistorial:
+    def __init__(self, umbral=RESUMEN_UMBRAL_MENSAJES, ventana=RESUMEN_VENTANA_RECIENTE,
+                 lote_max=RESUMEN_LOTE_MAX, workers=RESUMEN_WORKERS):
+        self.umbral = umbral
+        self.ventana = ventana
+        self.lote_max = lote_max
+        self.workers = workers
+        self._lock = threading.Lock()
+        self._ejecutor = None
+        self._pid = None
+        self._en_curso = set()
+        self._stats = {"resumenes": 0, "mensajes_resumidos": 0, "errores": 0}
+
+    def _obtener_ejecutor(self):
+        # 🔁 Los hilos no sobreviven a un fork: cada proceso crea su propio ejecutor
+        if self._ejecutor is None or self._pid != os.getpid():
+            self._ejecutor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="resumen")
+            self._pid = os.getpid()
+            self._en_curso = set()
+        return self._ejecutor
+
+    def cargar_historial(self, user_identity, limite=None):
+        # Resumen (si existe) + los últimos `limite` mensajes posteriores a su marca de agua (timestamp, id)
+        if not asegurar_esquema():
+            return None
+        # Se leen los suficientes para saber si hace falta resumir, del más reciente hacia atrás
+        lectura = max(limite, self.umbral + self.ventana + 1) if limite else None
+        with db_connection() as conn:
+            cur = conn.cursor()
+            cur.execute("""
+                SELECT resumen, hasta_timestamp, hasta_id
+                FROM resumenes_historial
+                WHERE user_identity = %s
+            """, (user_identity,))
+            fila = cur.fetchone()
+            if fila:
+                cur.execute("""
+                    SELECT role, content
+                    FROM chat_history
+                    WHERE user_identity = %s AND (timestamp, id) > (%s, %s)
+                    ORDER BY timestamp DESC, id DESC
+                    LIMIT %s
+                """, (user_identity, fila[1], fila[2], lectura))
+            else:
+                cur.execute("""
+                    SELECT role, content
+                    FROM chat_history
+                    WHERE user_identity = %s
+                    ORDER BY timestamp DESC, id DESC
+                    LIMIT %s
+                """, (user_identity, lectura))
+            filas = cur.fetchall()
+            cur.close()
+
+        if RESUMEN_ACTIVO and len(filas) > self.umbral + self.ventana:
+            self.programar(user_identity)
+        historial = [{"role": row[0], "content": row[1]} for row in reversed(filas[:limite] if limite else filas)]
+        if fila:
+            historial.insert(0, {"role": "system", "content": PREFIJO_RESUMEN + fila[0]})
+        return historial
+
+    def programar(self, user_identity):
+        with self._lock:
+            ejecutor = self._obtener_ejecutor()
+            if user_identity in self._en_curso:
+                return
+            self._en_curso.add(user_identity)
+        ejecutor.submit(self._resumir_en_segundo_plano, user_identity)
+
+    def _resumir_en_segundo_plano(self, user_identity):
+        try:
+            while self.resumir(user_identity):
+                pass
+        except Exception as e:
+            with self._lock:
+                self._stats["errores"] += 1
+            logging.error(f"❌ Error resumiendo historial de {user_identity}: {e}")
+        finally:
+            with self._lock:
+                self._en_curso.discard(user_identity)
+
+    def resumir(self, user_identity):
+        # Devuelve True si avanzó la marca de agua y podría quedar más por resumir
+        with db_connection() as conn:
+            cur = conn.cursor()
+            cur.execute("""
+                SELECT resumen, hasta_timestamp, hasta_id
+                FROM resumenes_historial
+                WHERE user_identity = %s
+            """, (user_identity,))
+            fila = cur.fetchone()
+            resumen_actual, desde_ts, desde_id = fila if fila else ("", None, None)
+            # Todo lo posterior a la marca excepto la ventana reciente, hasta lote_max mensajes
+            cur.execute("""
+                SELECT id, role, content, timestamp
+                FROM chat_history
+                WHERE user_identity = %s AND (%s::timestamp IS NULL OR (timestamp, id) > (%s, %s))
+                ORDER BY timestamp ASC, id ASC
+                LIMIT %s
+            """, (user_identity, desde_ts, desde_ts, desde_id, self.lote_max + self.ventana))
+            nuevos = cur.fetchall()
+            cur.close()
+
+        if len(nuevos) <= self.umbral + self.ventana:
+            return False
+        a_resumir = nuevos[:len(nuevos) - self.ventana]
+
+        transcripcion = "\n".join(
+            f"{'Usuario' if role == 'user' else 'Asistente'}: {content}"
+            for _, role, content, _ in a_resumir
+            if role in ("user", "assistant")
+        )
+        respuesta = cliente_openai.completar(
+            [
+                {"role": "system", "content": PROMPT_RESUMEN},
+                {"role": "user", "content": f"Resumen actual:\n{resumen_actual or '(vacío)'}\n\nMensajes nuevos:\n{transcripcion}"}
+            ],
+            user_identity=user_identity,
+            model=MODEL,
+            operacion="resumen",
+            temperature=0.2,
+        )
+        resumen = respuesta.choices[0].message['content'].strip()
+        ultimo_id, _, _, ultimo_ts = a_resumir[-1]
+
+        with db_connection() as conn:
+            cur = conn.cursor()
+            # Si otro worker ya avanzó más la marca, su resumen se conserva
+            cur.execute("""
+                INSERT INTO resumenes_historial (user_identity, resumen, hasta_timestamp, hasta_id, mensajes_resumidos)
+                VALUES (%s, %s, %s, %s, %s)
+                ON CONFLICT (user_identity) DO UPDATE
+                SET resumen = EXCLUDED.resumen,
+                    hasta_timestamp = EXCLUDED.hasta_timestamp,
+                    hasta_id = EXCLUDED.hasta_id,
+                    mensajes_resumidos = resumenes_historial.mensajes_resumidos + EXCLUDED.mensajes_resumidos,
+                    updated_at = NOW()
+                WHERE (resumenes_historial.hasta_timestamp, resumenes_historial.hasta_id)
+                    < (EXCLUDED.hasta_timestamp, EXCLUDED.hasta_id)
+            """, (user_identity, resumen, ultimo_ts, ultimo_id, len(a_resumir)))
+            conn.commit()
+            cur.close()
+
+        with self._lock:
+            self._stats["resumenes"] += 1
+            self._stats["mensajes_resumidos"] += len(a_resumir)
+        logging.info(f"🧾 Historial de {user_identity} resumido hasta el mensaje {ultimo_id} ({len(a_resumir)} mensajes)")
+        return len(nuevos) >= self.lote_max + self.ventana
+
+    def eliminar(self, cur, user_identity):
+        if asegurar_esquema():
+            cur.execute("DELETE FROM resumenes_historial WHERE user_identity = %s", (user_identity,))
+
+    def estadisticas(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update({"activo": RESUMEN_ACTIVO, "en_curso": len(self._en_curso)})
+        return stats
+
+
+resumidor_historial = ResumidorHistorial()
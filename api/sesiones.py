@@ -0,0 +1,306 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "memoria").lower()
+SESSION_TTL_SECONDS = float(os.getenv("SESSION_TTL_SECONDS", "3600"))
+SESSION_MAX_USERS = int(os.getenv("SESSION_MAX_USERS", "1000"))
+SESSION_MAX_BYTES = int(os.getenv("SESSION_MAX_BYTES", str(64 * 1024 * 1024)))
+# Mensajes guardados por usuario; lo que se envía al modelo se recorta aparte por tokens
+SESSION_MAX_MESSAGES = int(os.getenv("SESSION_MAX_MESSAGES", "200"))
+SESSION_SQLITE_PATH = os.getenv(
+    "SESSION_SQLITE_PATH",
+    os.path.join(os.path.dirname(__file__), "contextos", "sesiones.sqlite3")
+)
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "6000"))
+
+
+def _bytes_mensaje(mensaje):
+    return len(mensaje.get("content") or "") + 64
+
+
+def estimar_tokens(mensaje):
+    # ~4 caracteres por token en español, más el sobrecosto de cada mensaje
+    return len(mensaje.get("content") or "") // 4 + 4
+
+
+def recortar_contexto(mensajes, system_prompt="", presupuesto_tokens=CONTEXT_TOKEN_BUDGET, max_mensajes=None):
+    # ✂️ Ventana de los mensajes más recientes que caben en el presupuesto, siempre con el SYSTEM_PROMPT
+    cabecera = [{"role": "system", "content": system_prompt}] if system_prompt else []
+    restante = presupuesto_tokens - sum(estimar_tokens(m) for m in cabecera)
+    ventana = []
+    for mensaje in reversed(mensajes):
+        if system_prompt and mensaje.get("role") == "system" and mensaje.get("content") == system_prompt:
+            continue
+        if max_mensajes is not None and len(ventana) >= max_mensajes:
+            break
+        costo = estimar_tokens(mensaje)
+        # El último mensaje se envía aunque exceda el presupuesto por sí solo
+        if ventana and costo > restante:
+            break
+        ventana.append(mensaje)
+        restante -= costo
+    ventana.reverse()
+    return cabecera + ventana
+
+
+class AlmacenMemoria:
+    # cargador(user_identity) -> mensajes: reconstruye una sesión expulsada o vencida antes de agregarle nada
+    def __init__(self, ttl=SESSION_TTL_SECONDS, max_usuarios=SESSION_MAX_USERS,
+                 max_bytes=SESSION_MAX_BYTES, max_mensajes=SESSION_MAX_MESSAGES, cargador=None):
+        self.ttl = ttl
+        self.max_usuarios = max_usuarios
+        self.max_bytes = max_bytes
+        self.max_mensajes = max_mensajes
+        self.cargador = cargador
+        self._lock = threading.Lock()
+        # user_identity -> [último acceso, bytes, mensajes], el menos usado primero
+        self._datos = OrderedDict()
+        self._bytes = 0
+        self._stats = {"aciertos": 0, "fallos": 0, "expulsados_ttl": 0, "expulsados_capacidad": 0}
+
+    def _quitar(self, user_identity):
+        entrada = self._datos.pop(user_identity, None)
+        if entrada:
+            self._bytes -= entrada[1]
+
+    def _expulsar(self, ahora, conservar=None):
+        # conservar: la sesión recién escrita, la más reciente; aunque sola pase de max_bytes no se descarta
+        while self._datos:
+            user_identity, entrada = next(iter(self._datos.items()))
+            if user_identity == conservar:
+                break
+            if ahora - entrada[0] > self.ttl:
+                self._stats["expulsados_ttl"] += 1
+            elif len(self._datos) > self.max_usuarios or self._bytes > self.max_bytes:
+                self._stats["expulsados_capacidad"] += 1
+            else:
+                break
+            self._quitar(user_identity)
+
+    def _recortar(self, mensajes):
+        if len(mensajes) > self.max_mensajes:
+            del mensajes[:len(mensajes) - self.max_mensajes]
+        return mensajes
+
+    def obtener(self, user_identity):
+        ahora = time.monotonic()
+        with self._lock:
+            entrada = self._datos.get(user_identity)
+            if entrada is None or ahora - entrada[0] > self.ttl:
+                if entrada is not None:
+                    self._quitar(user_identity)
+                    self._stats["expulsados_ttl"] += 1
+                self._stats["fallos"] += 1
+                return None
+            entrada[0] = ahora
+            self._datos.move_to_end(user_identity)
+            self._stats["aciertos"] += 1
+            return list(entrada[2])
+
+    def guardar(self, user_identity, mensajes):
+        mensajes = self._recortar(list(mensajes))
+        tamano = sum(_bytes_mensaje(m) for m in mensajes)
+        ahora = time.monotonic()
+        with self._lock:
+            self._quitar(user_identity)
+            self._datos[user_identity] = [ahora, tamano, mensajes]
+            self._bytes += tamano
+            self._expulsar(ahora, user_identity)
+
+    def _vigente(self, user_identity):
+        with self._lock:
+            entrada = self._datos.get(user_identity)
+            return entrada is not None and time.monotonic() - entrada[0] <= self.ttl
+
+    def agregar(self, user_identity, mensaje):
+        # Sin la sesión se recarga como tras un obtener() fallido; si no, quedaría solo este mensaje
+        # y obtener() ya no la daría por perdida
+        if self.cargador is not None and not self._vigente(user_identity):
+            self.guardar(user_identity, self.cargador(user_identity))
+        ahora = time.monotonic()
+        with self._lock:
+            entrada = self._datos.get(user_identity)
+            if entrada is None:
+                entrada = [ahora, 0, []]
+                self._datos[user_identity] = entrada
+            entrada[0] = ahora
+            entrada[2].append(mensaje)
+            self._recortar(entrada[2])
+            tamano = sum(_bytes_mensaje(m) for m in entrada[2])
+            self._bytes += tamano - entrada[1]
+            entrada[1] = tamano
+            self._datos.move_to_end(user_identity)
+            self._expulsar(ahora, user_identity)
+
+    def eliminar(self, user_identity):
+        with self._lock:
+            self._quitar(user_identity)
+
+    def estadisticas(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update({"backend": "memoria", "usuarios": len(self._datos), "bytes": self._bytes})
+        return stats
+
+
+class AlmacenSQLite:
+    # Archivo compartido por todos los workers de la máquina (modo WAL)
+    def __init__(self, ruta=SESSION_SQLITE_PATH, ttl=SESSION_TTL_SECONDS, max_usuarios=SESSION_MAX_USERS,
+                 max_bytes=SESSION_MAX_BYTES, max_mensajes=SESSION_MAX_MESSAGES, cargador=None):
+        self.ruta = ruta
+        self.ttl = ttl
+        self.max_usuarios = max_usuarios
+        self.max_bytes = max_bytes
+        self.max_mensajes = max_mensajes
+        self.cargador = cargador
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        self._stats = {"aciertos": 0, "fallos": 0}
+        os.makedirs(os.path.dirname(ruta) or ".", exist_ok=True)
+        self._conexion().conn.executescript("""
+            CREATE TABLE IF NOT EXISTS sesiones (
+                user_identity TEXT PRIMARY KEY,
+                actualizado REAL NOT NULL,
+                bytes INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE TABLE IF NOT EXISTS sesion_mensajes (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_identity TEXT NOT NULL,
+                mensaje TEXT NOT NULL,
+                bytes INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_sesion_mensajes_usuario ON sesion_mensajes (user_identity, id);
+            CREATE INDEX IF NOT EXISTS idx_sesiones_actualizado ON sesiones (actualizado);
+        """)
+
+    def _conexion(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            conn = sqlite3.connect(self.ruta, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return _Transaccion(conn)
+
+    def _contar(self, clave):
+        with self._stats_lock:
+            self._stats[clave] += 1
+
+    def _recortar_y_expulsar(self, conn, user_identity, ahora):
+        conn.execute("""
+            DELETE FROM sesion_mensajes WHERE user_identity = ? AND id NOT IN (
+                SELECT id FROM sesion_mensajes WHERE user_identity = ? ORDER BY id DESC LIMIT ?
+            )
+        """, (user_identity, user_identity, self.max_mensajes))
+        conn.execute("""
+            UPDATE sesiones SET bytes = (SELECT COALESCE(SUM(bytes), 0) FROM sesion_mensajes WHERE user_identity = ?)
+            WHERE user_identity = ?
+        """, (user_identity, user_identity))
+        # 🧹 Expulsar ociosos por TTL y luego los menos usados hasta respetar los límites
+        vencidos = [r[0] for r in conn.execute(
+            "SELECT user_identity FROM sesiones WHERE actualizado < ?", (ahora - self.ttl,))]
+        usuarios, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM sesiones").fetchone()
+        usuarios -= len(vencidos)
+        if usuarios > self.max_usuarios or total > self.max_bytes:
+            for uid, tamano in conn.execute(
+                    "SELECT user_identity, bytes FROM sesiones WHERE actualizado >= ? ORDER BY actualizado ASC",
+                    (ahora - self.ttl,)).fetchall():
+                if uid == user_identity or (usuarios <= self.max_usuarios and total <= self.max_bytes):
+                    break
+                vencidos.append(uid)
+                usuarios -= 1
+                total -= tamano
+        for uid in vencidos:
+            conn.execute("DELETE FROM sesion_mensajes WHERE user_identity = ?", (uid,))
+            conn.execute("DELETE FROM sesiones WHERE user_identity = ?", (uid,))
+
+    def obtener(self, user_identity):
+        ahora = time.time()
+        with self._conexion() as conn:
+            fila = conn.execute("SELECT actualizado FROM sesiones WHERE user_identity = ?", (user_identity,)).fetchone()
+            if fila is None or ahora - fila[0] > self.ttl:
+                self._contar("fallos")
+                return None
+            conn.execute("UPDATE sesiones SET actualizado = ? WHERE user_identity = ?", (ahora, user_identity))
+            mensajes = [json.loads(r[0]) for r in conn.execute(
+                "SELECT mensaje FROM sesion_mensajes WHERE user_identity = ? ORDER BY id ASC", (user_identity,))]
+        self._contar("aciertos")
+        return mensajes
+
+    def guardar(self, user_identity, mensajes):
+        ahora = time.time()
+        filas = [(user_identity, json.dumps(m, ensure_ascii=False), _bytes_mensaje(m))
+                 for m in list(mensajes)[-self.max_mensajes:]]
+        with self._conexion() as conn:
+            conn.execute("DELETE FROM sesion_mensajes WHERE user_identity = ?", (user_identity,))
+            conn.execute("INSERT OR REPLACE INTO sesiones (user_identity, actualizado, bytes) VALUES (?, ?, 0)",
+                         (user_identity, ahora))
+            conn.executemany("INSERT INTO sesion_mensajes (user_identity, mensaje, bytes) VALUES (?, ?, ?)", filas)
+            self._recortar_y_expulsar(conn, user_identity, ahora)
+
+    def _vigente(self, user_identity):
+        with self._conexion() as conn:
+            fila = conn.execute("SELECT actualizado FROM sesiones WHERE user_identity = ?", (user_identity,)).fetchone()
+        return fila is not None and time.time() - fila[0] <= self.ttl
+
+    def agregar(self, user_identity, mensaje):
+        # Igual que en memoria: una sesión expulsada o vencida se recarga antes de agregar
+        if self.cargador is not None and not self._vigente(user_identity):
+            self.guardar(user_identity, self.cargador(user_identity))
+        ahora = time.time()
+        with self._conexion() as conn:
+            conn.execute("""
+                INSERT INTO sesiones (user_identity, actualizado, bytes) VALUES (?, ?, 0)
+                ON CONFLICT (user_identity) DO UPDATE SET actualizado = excluded.actualizado
+            """, (user_identity, ahora))
+            conn.execute("INSERT INTO sesion_mensajes (user_identity, mensaje, bytes) VALUES (?, ?, ?)",
+                         (user_identity, json.dumps(mensaje, ensure_ascii=False), _bytes_mensaje(mensaje)))
+            self._recortar_y_expulsar(conn, user_identity, ahora)
+
+    def eliminar(self, user_identity):
+        with self._conexion() as conn:
+            conn.execute("DELETE FROM sesion_mensajes WHERE user_identity = ?", (user_identity,))
+            conn.execute("DELETE FROM sesiones WHERE user_identity = ?", (user_identity,))
+
+    def estadisticas(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        try:
+            with self._conexion() as conn:
+                usuarios, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM sesiones").fetchone()
+            stats.update({"usuarios": usuarios, "bytes": total})
+        except Exception as e:
+            logging.error(f"❌ Error leyendo estadísticas de sesiones: {e}")
+        stats["backend"] = "sqlite"
+        return stats
+
+
+class _Transaccion:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, tipo, valor, traza):
+        self.conn.execute("ROLLBACK" if tipo else "COMMIT")
+
+
+def crear_almacen_sesiones(backend=SESSION_BACKEND, cargador=None):
+    if backend == "sqlite":
+        try:
+            return AlmacenSQLite(cargador=cargador)
+        except Exception as e:
+            logging.error(f"❌ No se pudo abrir el almacén SQLite de sesiones, se usa memoria: {e}")
+    return AlmacenMemoria(cargador=cargador)
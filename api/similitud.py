@@ -0,0 +1,30 @@
+import re
+
+# Tamaño de los shingles (secuencias de palabras consecutivas)
+SHINGLE_K = 3
+
+_PALABRA = re.compile(r"\w+")
+
+
+def shingles(texto, k=SHINGLE_K):
+    palabras = _PALABRA.findall(texto.lower())
+    if len(palabras) < k:
+        return {tuple(palabras)} if palabras else set()
+    # zip arma las tuplas de k palabras en C; el set deduplica sin hashing manual
+    return set(zip(*(palabras[i:] for i in range(k))))
+
+
+class HuellaPlantilla:
+    # Huella precalculada de la plantilla de referencia; se construye una sola vez
+    def __init__(self, texto, k=SHINGLE_K):
+        self.k = k
+        self.shingles = frozenset(shingles(texto, k))
+
+    def similitud(self, texto):
+        # Coeficiente de Dice sobre shingles (0-100): misma forma 2*M/(a+b) que SequenceMatcher.ratio(),
+        # pero en tiempo lineal respecto al texto subido
+        otros = shingles(texto, self.k)
+        total = len(self.shingles) + len(otros)
+        if not total:
+            return 0.0
+        return 200.0 * len(self.shingles & otros) / total
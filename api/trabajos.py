@@ -0,0 +1,229 @@
+import os
+import json
+import time
+import uuid
+import socket
+import sqlite3
+import logging
+import threading
+
+from dotenv import load_dotenv
+
+from api.metricas import request_id_actual
+
+load_dotenv()
+
+# Modo trabajo para todos los PDF; los clientes también pueden pedirlo con modo=trabajo
+PDF_JOB_MODE = os.getenv("PDF_JOB_MODE", "0").lower() in ("1", "true", "si", "yes")
+TRABAJOS_DIR = os.getenv("TRABAJOS_DIR", os.path.join(os.path.dirname(__file__), "..", "uploads", "trabajos"))
+TRABAJOS_DB_PATH = os.getenv("TRABAJOS_DB_PATH", os.path.join(TRABAJOS_DIR, "trabajos.sqlite3"))
+TRABAJOS_WORKERS = int(os.getenv("TRABAJOS_WORKERS", "2"))
+TRABAJOS_MAX_INTENTOS = int(os.getenv("TRABAJOS_MAX_INTENTOS", "3"))
+# Un trabajo en proceso sin latido durante este tiempo se considera huérfano y se reencola
+TRABAJOS_LEASE_SECONDS = float(os.getenv("TRABAJOS_LEASE_SECONDS", "60"))
+TRABAJOS_POLL_SECONDS = float(os.getenv("TRABAJOS_POLL_SECONDS", "2"))
+
+
+class ColaTrabajos:
+    def __init__(self, procesador, ruta_db=TRABAJOS_DB_PATH, directorio=TRABAJOS_DIR, workers=TRABAJOS_WORKERS,
+                 max_intentos=TRABAJOS_MAX_INTENTOS, lease=TRABAJOS_LEASE_SECONDS, poll=TRABAJOS_POLL_SECONDS):
+        # procesador(user_identity, ruta_pdf, etapas) -> texto de respuesta
+        self.procesador = procesador
+        self.ruta_db = ruta_db
+        self.directorio = directorio
+        self.workers = workers
+        self.max_intentos = max_intentos
+        self.lease = lease
+        self.poll = poll
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._hilos = []
+        self._pid = None
+        self._hay_trabajo = threading.Event()
+        self._en_curso = set()
+        self._esquema_listo = False
+
+    def _conexion(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            os.makedirs(os.path.dirname(self.ruta_db) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.ruta_db, timeout=10, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        if not self._esquema_listo:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS trabajos (
+                    id TEXT PRIMARY KEY,
+                    user_identity TEXT NOT NULL,
+                    ruta_pdf TEXT NOT NULL,
+                    nombre_archivo TEXT,
+                    estado TEXT NOT NULL,
+                    respuesta TEXT,
+                    error TEXT,
+                    etapas TEXT,
+                    intentos INTEGER NOT NULL DEFAULT 0,
+                    proceso TEXT,
+                    creado REAL NOT NULL,
+                    iniciado REAL,
+                    terminado REAL,
+                    latido REAL
+                );
+                CREATE INDEX IF NOT EXISTS idx_trabajos_estado ON trabajos (estado, creado);
+            """)
+            self._esquema_listo = True
+        return conn
+
+    def iniciar(self):
+        # 🔁 Tras un fork los hilos del padre no existen: cada proceso arranca los suyos
+        with self._lock:
+            if self._pid == os.getpid() and any(h.is_alive() for h in self._hilos):
+                return
+            self._pid = os.getpid()
+            self._en_curso = set()
+            self._hay_trabajo = threading.Event()
+            self._hilos = [
+                threading.Thread(target=self._bucle, name=f"trabajos-pdf-{i}", daemon=True)
+                for i in range(self.workers)
+            ]
+            self._hilos.append(threading.Thread(target=self._bucle_latido, name="trabajos-pdf-latido", daemon=True))
+            for hilo in self._hilos:
+                hilo.start()
+
+    def reanudar_si_hay_pendientes(self):
+        # Al arrancar, retomar lo que quedó en cola o a medias antes de un reinicio
+        try:
+            fila = self._conexion().execute(
+                "SELECT COUNT(*) FROM trabajos WHERE estado IN ('pendiente', 'en_proceso')"
+            ).fetchone()
+            if fila[0]:
+                logging.info(f"🔄 Reanudando {fila[0]} trabajos de evaluación pendientes")
+                self.iniciar()
+        except Exception as e:
+            logging.error(f"❌ Error revisando trabajos pendientes: {e}")
+
+    def encolar(self, user_identity, datos_pdf, nombre_archivo=None):
+        job_id = uuid.uuid4().hex
+        os.makedirs(self.directorio, exist_ok=True)
+        ruta_pdf = os.path.join(self.directorio, f"{job_id}.pdf")
+        with open(ruta_pdf, "wb") as f:
+            f.write(datos_pdf)
+        self._conexion().execute("""
+            INSERT INTO trabajos (id, user_identity, ruta_pdf, nombre_archivo, estado, creado)
+            VALUES (?, ?, ?, ?, 'pendiente', ?)
+        """, (job_id, user_identity, ruta_pdf, nombre_archivo, time.time()))
+        self.iniciar()
+        self._hay_trabajo.set()
+        return job_id
+
+    def obtener(self, job_id):
+        fila = self._conexion().execute("SELECT * FROM trabajos WHERE id = ?", (job_id,)).fetchone()
+        if fila is None:
+            return None
+        trabajo = {
+            "job_id": fila["id"],
+            "status": fila["estado"],
+            "etapas": json.loads(fila["etapas"]) if fila["etapas"] else {},
+            "intentos": fila["intentos"],
+            "creado": fila["creado"],
+        }
+        if fila["iniciado"]:
+            trabajo["espera_ms"] = round((fila["iniciado"] - fila["creado"]) * 1000, 1)
+        if fila["terminado"]:
+            trabajo["duracion_ms"] = round((fila["terminado"] - (fila["iniciado"] or fila["creado"])) * 1000, 1)
+        if fila["estado"] == "terminado":
+            trabajo["response"] = fila["respuesta"]
+        if fila["estado"] == "error":
+            trabajo["error"] = fila["error"]
+        return trabajo
+
+    def _reclamar(self):
+        conn = self._conexion()
+        conn.execute("BEGIN IMMEDIATE")
+        ahora = time.time()
+        try:
+            # Huérfanos de un worker caído vuelven a la cola (o fallan si agotaron intentos)
+            conn.execute("""
+                UPDATE trabajos SET estado = CASE WHEN intentos >= ? THEN 'error' ELSE 'pendiente' END,
+                       error = CASE WHEN intentos >= ? THEN 'Se agotaron los reintentos' ELSE error END,
+                       terminado = CASE WHEN intentos >= ? THEN ? ELSE terminado END
+                WHERE estado = 'en_proceso' AND latido < ?
+            """, (self.max_intentos, self.max_intentos, self.max_intentos, ahora, ahora - self.lease))
+            fila = conn.execute(
+                "SELECT id, user_identity, ruta_pdf FROM trabajos WHERE estado = 'pendiente' ORDER BY creado LIMIT 1"
+            ).fetchone()
+            if fila is not None:
+                conn.execute("""
+                    UPDATE trabajos SET estado = 'en_proceso', intentos = intentos + 1, proceso = ?,
+                           iniciado = ?, latido = ?
+                    WHERE id = ?
+                """, (f"{socket.gethostname()}:{os.getpid()}", ahora, ahora, fila["id"]))
+            conn.execute("COMMIT")
+            return fila
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _finalizar(self, job_id, estado, respuesta=None, error=None, etapas=None):
+        self._conexion().execute("""
+            UPDATE trabajos SET estado = ?, respuesta = ?, error = ?, etapas = ?, terminado = ?
+            WHERE id = ?
+        """, (estado, respuesta, error, json.dumps(etapas or {}), time.time(), job_id))
+
+    def _bucle(self):
+        while True:
+            try:
+                fila = self._reclamar()
+            except Exception as e:
+                logging.error(f"❌ Error reclamando trabajo de evaluación: {e}")
+                fila = None
+            if fila is None:
+                self._hay_trabajo.wait(self.poll)
+                self._hay_trabajo.clear()
+                continue
+
+            job_id = fila["id"]
+            # Los logs del trabajo llevan su id como request-id
+            request_id_actual.set(job_id)
+            with self._lock:
+                self._en_curso.add(job_id)
+            etapas = {}
+            try:
+                respuesta = self.procesador(fila["user_identity"], fila["ruta_pdf"], etapas)
+                self._finalizar(job_id, "terminado", respuesta=respuesta, etapas=etapas)
+                logging.info(f"✅ Trabajo de evaluación {job_id} terminado")
+            except Exception as e:
+                logging.error(f"❌ Error en trabajo de evaluación {job_id}: {e}")
+                self._finalizar(job_id, "error", error=f"Error procesando PDF: {str(e)}", etapas=etapas)
+            finally:
+                try:
+                    os.remove(fila["ruta_pdf"])
+                except OSError:
+                    pass
+                with self._lock:
+                    self._en_curso.discard(job_id)
+
+    def _bucle_latido(self):
+        # 💓 Mantiene vivos los trabajos en curso de este proceso
+        while True:
+            time.sleep(max(1.0, self.lease / 4))
+            with self._lock:
+                en_curso = list(self._en_curso)
+            if not en_curso:
+                continue
+            try:
+                self._conexion().executemany(
+                    "UPDATE trabajos SET latido = ? WHERE id = ?",
+                    [(time.time(), job_id) for job_id in en_curso]
+                )
+            except Exception as e:
+                logging.error(f"❌ Error actualizando latido de trabajos: {e}")
+
+    def estadisticas(self):
+        try:
+            filas = self._conexion().execute("SELECT estado, COUNT(*) FROM trabajos GROUP BY estado").fetchall()
+            return {estado: total for estado, total in filas}
+        except Exception as e:
+            logging.error(f"❌ Error leyendo estadísticas de trabajos: {e}")
+            return {}
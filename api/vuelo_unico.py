@@ -0,0 +1,155 @@
+import os
+import time
+import logging
+import threading
+from datetime import datetime, timedelta
+
+from dotenv import load_dotenv
+
+from api.db import db_connection
+from api.esquema import asegurar_esquema
+
+load_dotenv()
+
+# Segundos que un PDF idéntico espera a la evaluación en curso antes de evaluarlo por su cuenta
+VUELO_PDF_ESPERA = float(os.getenv("VUELO_PDF_ESPERA", "180"))
+# Vigencia de la reserva entre workers: si el worker que la tomó muere, otro la retoma al vencer
+VUELO_PDF_RESERVA = float(os.getenv("VUELO_PDF_RESERVA", "300"))
+# Cada cuánto se consulta la caché mientras otro worker evalúa el mismo PDF
+VUELO_PDF_SONDEO = float(os.getenv("VUELO_PDF_SONDEO", "0.5"))
+
+
+class _Vuelo:
+    def __init__(self):
+        self.evento = threading.Event()
+        self.resultado = None
+        self.error = None
+
+
+class VueloUnico:
+    # Dentro del proceso: la primera petición con una clave ejecuta la función y las que llegan
+    # mientras tanto esperan y reciben el mismo resultado (o la misma excepción)
+    def __init__(self, espera=VUELO_PDF_ESPERA):
+        self.espera = espera
+        self._lock = threading.Lock()
+        self._vuelos = {}
+        self._stats = {"ejecutados": 0, "compartidos": 0, "esperas_vencidas": 0}
+
+    def ejecutar(self, clave, funcion):
+        # Devuelve (resultado, propio): propio es False si el resultado viene de otra petición
+        with self._lock:
+            vuelo = self._vuelos.get(clave)
+            propio = vuelo is None
+            if propio:
+                vuelo = self._vuelos[clave] = _Vuelo()
+                self._stats["ejecutados"] += 1
+
+        if not propio:
+            if vuelo.evento.wait(self.espera):
+                with self._lock:
+                    self._stats["compartidos"] += 1
+                if vuelo.error is not None:
+                    raise vuelo.error
+                return vuelo.resultado, False
+            with self._lock:
+                self._stats["esperas_vencidas"] += 1
+            logging.warning(f"⏳ La evaluación en curso de {clave[:12]} tarda más de {self.espera:g} s; se evalúa aparte")
+            return funcion(), True
+
+        try:
+            vuelo.resultado = funcion()
+        except BaseException as e:
+            vuelo.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._vuelos[clave]
+            vuelo.evento.set()
+        return vuelo.resultado, True
+
+    def estadisticas(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["en_curso"] = len(self._vuelos)
+        return stats
+
+
+class ReservasPDF:
+    # Entre workers: una fila por PDF en evaluación (clave primaria = hash de los bytes). Quien no
+    # logra insertarla espera a que el resultado aparezca en la caché global
+    def __init__(self, vigencia=VUELO_PDF_RESERVA, sondeo=VUELO_PDF_SONDEO):
+        self.vigencia = vigencia
+        self.sondeo = sondeo
+        self._lock = threading.Lock()
+        self._stats = {"reservadas": 0, "retomadas": 0, "esperas": 0, "resueltas_por_otro": 0}
+
+    def reservar(self, clave):
+        # True si este worker debe evaluar; ante un error de BD no se bloquea a nadie
+        if not asegurar_esquema():
+            return True
+        ahora = datetime.now()
+        try:
+            with db_connection() as conn:
+                cur = conn.cursor()
+                cur.execute("SELECT expira FROM pdf_en_evaluacion WHERE hash_bytes = %s", (clave,))
+                previa = cur.fetchone()
+                cur.execute("""
+                    INSERT INTO pdf_en_evaluacion (hash_bytes, expira)
+                    VALUES (%s, %s)
+                    ON CONFLICT (hash_bytes) DO UPDATE SET expira = EXCLUDED.expira
+                    WHERE pdf_en_evaluacion.expira < %s
+                """, (clave, ahora + timedelta(seconds=self.vigencia), ahora))
+                reservada = cur.rowcount == 1
+                conn.commit()
+                cur.close()
+        except Exception as e:
+            logging.error(f"❌ Error reservando la evaluación del PDF: {e}")
+            return True
+        if reservada:
+            with self._lock:
+                self._stats["retomadas" if previa else "reservadas"] += 1
+            if previa:
+                logging.warning(f"⏳ Reserva vencida del PDF {clave[:12]}: se retoma la evaluación")
+        return reservada
+
+    def liberar(self, clave):
+        try:
+            with db_connection() as conn:
+                cur = conn.cursor()
+                cur.execute("DELETE FROM pdf_en_evaluacion WHERE hash_bytes = %s", (clave,))
+                conn.commit()
+                cur.close()
+        except Exception as e:
+            # La reserva vence sola a los VUELO_PDF_RESERVA segundos
+            logging.error(f"❌ Error liberando la reserva del PDF: {e}")
+
+    def _reservada(self, clave):
+        try:
+            with db_connection() as conn:
+                cur = conn.cursor()
+                cur.execute("SELECT expira FROM pdf_en_evaluacion WHERE hash_bytes = %s", (clave,))
+                fila = cur.fetchone()
+                cur.close()
+        except Exception as e:
+            logging.error(f"❌ Error consultando la reserva del PDF: {e}")
+            return False
+        return bool(fila) and fila[0] >= datetime.now()
+
+    def esperar(self, clave, buscar):
+        # Resultado de buscar() en cuanto exista, o None si la reserva se liberó o venció sin él
+        # (formato inválido, propuesta incompleta, error): entonces quien espera vuelve a reservar
+        with self._lock:
+            self._stats["esperas"] += 1
+        while True:
+            resultado = buscar()
+            if resultado is not None:
+                with self._lock:
+                    self._stats["resueltas_por_otro"] += 1
+                return resultado
+            if not self._reservada(clave):
+                return None
+            time.sleep(self.sondeo)
+
+    def estadisticas(self):
+        with self._lock:
+            return dict(self._stats)
@@ -1,36 +1,91 @@
 import os
-from flask import Flask, request, jsonify, send_from_directory
+import time
+from flask import Flask, Response, request, jsonify, send_from_directory, g
+from werkzeug.exceptions import RequestEntityTooLarge
 from flask_cors import CORS
-from api.chat import chat_blueprint
+from api.chat import chat_blueprint, extraer_texto_subida, iniciar_servicios
+from api.recuperacion import indice_documentos
+from api.almacen import almacen_documentos, PeticionConHash, SUBIDA_MAX_BYTES
+from api.extraccion_pdf import PDF_MAX_BYTES
+from api.metricas import metricas, configurar_logging, nuevo_request_id, request_id_actual
 from dotenv import load_dotenv
 
 # Cargar variables del entorno
 load_dotenv()
+configurar_logging()
 
 # Crear la app Flask
 app = Flask(__name__, static_folder='static')
+# 📥 Los archivos se escriben por bloques a un temporal mientras se calcula su SHA-256
+app.request_class = PeticionConHash
+# Un Content-Length mayor se rechaza antes de leer el cuerpo (margen para los demás campos del formulario)
+app.config["MAX_CONTENT_LENGTH"] = max(SUBIDA_MAX_BYTES, PDF_MAX_BYTES) + 1024 * 1024
 
-# Configurar CORS para dominios específicos
-CORS(app, resources={r"/api/*": {
-    "origins": [
-        "https://innovug.ug.edu.ec",  # WordPress oficial
-        "http://127.0.0.1:5500",      # localhost pruebas
-        "http://localhost:5500"     
-    ]
-}})
+# Configurar CORS para dominios específicos (asgi.py aplica los mismos a las rutas asíncronas)
+ORIGENES_CORS = [
+    "https://innovug.ug.edu.ec",  # WordPress oficial
+    "http://127.0.0.1:5500",      # localhost pruebas
+    "http://localhost:5500"
+]
+CORS(app, resources={r"/api/*": {"origins": ORIGENES_CORS}})
 
 # Registrar el blueprint para rutas de /api/chat
 app.register_blueprint(chat_blueprint, url_prefix='/api')
 
+# 🏷️ Request-id por petición (se respeta X-Request-ID si viene del proxy) y duración por endpoint
+@app.before_request
+def iniciar_peticion():
+    # Servidores que solo importan app:app (gunicorn...): los servicios arrancan con la primera petición
+    iniciar_servicios()
+    g.request_id = request.headers.get("X-Request-ID") or nuevo_request_id()
+    g.request_token = request_id_actual.set(g.request_id)
+    g.inicio_peticion = time.perf_counter()
+
+@app.after_request
+def terminar_peticion(response):
+    response.headers["X-Request-ID"] = g.get("request_id", "-")
+    if "inicio_peticion" in g:
+        metricas.observar(
+            "chatbot_http_segundos",
+            time.perf_counter() - g.inicio_peticion,
+            endpoint=request.endpoint or "desconocido",
+            metodo=request.method,
+            status=response.status_code
+        )
+    return response
+
+@app.teardown_request
+def limpiar_peticion(error=None):
+    if "request_token" in g:
+        request_id_actual.reset(g.request_token)
+
+# 📈 Métricas en formato Prometheus (METRICAS_ACTIVAS=1)
+@app.route('/metrics')
+def metrics():
+    if not metricas.activas:
+        return jsonify({"error": "Métricas desactivadas"}), 404
+    return Response(metricas.exportar(), mimetype="text/plain; version=0.0.4")
+
+@app.errorhandler(RequestEntityTooLarge)
+def archivo_demasiado_grande(error):
+    # Rechazado por Content-Length antes de leer, o al pasarse del límite mientras llegaba
+    return jsonify({"error": request.limite_archivo()[1]}), 413
+
 # Ruta para subir archivos PDF, CSV, XLSX desde frontend
 @app.route('/api/upload', methods=['POST'])
 def upload_file():
     archivo = request.files.get("file")
     if archivo:
-        ruta = os.path.join("documents", archivo.filename)
-        os.makedirs("documents", exist_ok=True)
-        archivo.save(ruta)
-        return jsonify({"response": f"Archivo {archivo.filename} recibido correctamente"}), 200
+        # 🗃️ Se guarda como documents/<sha256><ext>; el mismo contenido no se guarda ni se indexa dos veces
+        sha256, entrada, ruta, nuevo = almacen_documentos.guardar(archivo)
+        if nuevo:
+            # 📚 Se indexa solo este archivo; el resto del índice se conserva. El texto de un PDF
+            # queda guardado por su SHA-256 para que evaluarlo después no lo extraiga otra vez
+            indice_documentos.agregar_documento(ruta, extraer_texto_subida(sha256, ruta))
+            mensaje = f"Archivo {archivo.filename} recibido correctamente"
+        else:
+            mensaje = f"Archivo {archivo.filename} recibido correctamente (ya estaba guardado como {entrada['archivo']})"
+        return jsonify({"response": mensaje, "sha256": sha256, "archivo": entrada["archivo"]}), 200
     return jsonify({"error": "No se recibió ningún archivo"}), 400
 
 # Ruta principal: sirve el index.html
@@ -38,12 +93,16 @@ def upload_file():
 def index():
     return send_from_directory('static', 'index.html')
 
-# Mostrar rutas activas para depuración
-print("🔍 Rutas registradas:")
-for rule in app.url_map.iter_rules():
-    print(f"📍 {rule.endpoint} --> {rule}")
-
 # Iniciar servidor Flask (Render detecta el puerto desde la variable de entorno PORT)
 if __name__ == '__main__':
+    # Mostrar rutas activas para depuración (solo en el servidor de desarrollo, no en cada worker)
+    print("🔍 Rutas registradas:")
+    for rule in app.url_map.iter_rules():
+        print(f"📍 {rule.endpoint} --> {rule}")
+
+    # Con debug, el proceso que vigila los archivos no atiende peticiones: los servicios van en el recargado
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        iniciar_servicios()
+
     port = int(os.environ.get("PORT", 5000))
     app.run(host='0.0.0.0', port=port, debug=True)
@@ -0,0 +1,19 @@
+import os
+from a2wsgi import WSGIMiddleware
+from dotenv import load_dotenv
+
+from app import app as flask_app, ORIGENES_CORS
+from api.chat_async import ChatAsincrono
+
+load_dotenv()
+
+# Hilos para las rutas que siguen en Flask (ping, historial, PDF, upload, métricas...)
+ASGI_WSGI_WORKERS = int(os.getenv("ASGI_WSGI_WORKERS", "10"))
+
+# Modo ASGI: los turnos de texto esperan a OpenAI en el event loop; el resto de la app es la misma de Flask
+app = ChatAsincrono(WSGIMiddleware(flask_app, workers=ASGI_WSGI_WORKERS), origenes_cors=ORIGENES_CORS)
+
+# Producción: uvicorn asgi:app --host 0.0.0.0 --port $PORT --workers N
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run("asgi:app", host="0.0.0.0", port=int(os.environ.get("PORT", 5000)))
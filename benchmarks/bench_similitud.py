@@ -0,0 +1,67 @@
+"""Compara SequenceMatcher con la huella por shingles sobre PDFs grandes.
+
+Uso: python benchmarks/bench_similitud.py
+"""
+import os
+import re
+import sys
+import time
+import random
+from difflib import SequenceMatcher
+
+import pdfplumber
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from api.similitud import HuellaPlantilla  # noqa: E402
+
+REFERENCE_PDF_PATH = os.path.join(os.path.dirname(__file__), "../documents/doc_003.pdf")
+MARCADOR = re.compile(r"\[reemplaza este texto[^\]]*\]", re.IGNORECASE)
+VOCABULARIO = (
+    "el proyecto busca resolver la falta de acceso a servicios de salud en zonas rurales mediante "
+    "una plataforma movil que conecta pacientes con medicos voluntarios y farmacias locales nuestro "
+    "mercado objetivo son familias de bajos ingresos con ingresos por suscripcion y comisiones"
+).split()
+
+
+def propuesta_sintetica(referencia, palabras_por_respuesta, semilla=1):
+    # Plantilla oficial con cada "[Reemplaza este texto...]" sustituido por texto aleatorio
+    rnd = random.Random(semilla)
+    return MARCADOR.sub(
+        lambda _: " ".join(rnd.choice(VOCABULARIO) for _ in range(palabras_por_respuesta)),
+        referencia
+    )
+
+
+def medir(funcion, repeticiones):
+    inicio = time.perf_counter()
+    for _ in range(repeticiones):
+        resultado = funcion()
+    return (time.perf_counter() - inicio) / repeticiones, resultado
+
+
+def main():
+    with pdfplumber.open(REFERENCE_PDF_PATH) as pdf:
+        referencia = "\n".join(page.extract_text() or "" for page in pdf.pages).strip().lower()
+
+    inicio = time.perf_counter()
+    huella = HuellaPlantilla(referencia)
+    print(f"Huella de la plantilla construida en {(time.perf_counter() - inicio) * 1000:.2f} ms (una sola vez)\n")
+
+    print(f"{'palabras/resp':>13} {'caracteres':>10} {'SM %':>7} {'SM ms':>9} {'huella %':>9} {'huella ms':>10} {'speedup':>8}")
+    for palabras in (50, 200, 800, 2000, 5000):
+        subido = propuesta_sintetica(referencia, palabras)
+        repeticiones = 3 if palabras <= 800 else 1
+        t_sm, sm = medir(lambda: SequenceMatcher(None, referencia, subido).ratio() * 100, repeticiones)
+        t_h, h = medir(lambda: huella.similitud(subido), repeticiones)
+        print(f"{palabras:>13} {len(subido):>10} {sm:>7.2f} {t_sm * 1000:>9.1f} {h:>9.2f} {t_h * 1000:>10.2f} {t_sm / t_h:>7.1f}x")
+
+    # Peor caso de SequenceMatcher: texto sin caracteres "populares" que active autojunk
+    subido = (referencia + " ") * 40
+    t_sm, sm = medir(lambda: SequenceMatcher(None, referencia, subido).ratio() * 100, 1)
+    t_h, h = medir(lambda: huella.similitud(subido), 1)
+    print(f"\nPlantilla repetida x40 ({len(subido)} caracteres): SM {t_sm * 1000:.1f} ms, "
+          f"huella {t_h * 1000:.2f} ms ({t_sm / t_h:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,267 @@
+"""Prueba de carga del backend completo sin red: OpenAI y Postgres son dobles locales.
+
+Cada escenario se lanza contra la app Flask en proceso (test client, un cliente por hilo)
+con la concurrencia indicada y reporta p50/p95/p99, throughput y conexiones a la base.
+
+Uso:
+    python benchmarks/carga.py
+    python benchmarks/carga.py --escenarios texto,stream --concurrencia 32 --peticiones 400
+    python benchmarks/carga.py --latencia-openai 1500 --latencia-db 2 --json resultados.json
+
+Las variables de entorno habituales (DB_POOL_MAX, CHAT_HISTORY_WRITE_BEHIND, SESSION_BACKEND,
+OPENAI_MAX_CONCURRENT, ...) se respetan, así que se pueden comparar configuraciones.
+"""
+import argparse
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+RAIZ = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, RAIZ)
+sys.path.insert(0, os.path.dirname(__file__))
+
+ESCENARIOS = ("ping", "texto", "stream", "historial", "pdf", "upload")
+PREGUNTAS = (
+    "¿Qué es INNOVUG?",
+    "¿Cómo presento una propuesta?",
+    "¿Cuáles son los criterios de evaluación?",
+    "Quiero saber cómo mejorar mi modelo de negocio",
+    "¿Qué pasa si mi propuesta no llega a 8?",
+    "Explícame la escalabilidad de mi proyecto",
+)
+
+
+def percentil(valores, p):
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    indice = max(0, min(len(ordenados) - 1, round(p / 100 * len(ordenados) + 0.5) - 1))
+    return ordenados[indice]
+
+
+def preparar_entorno(directorio):
+    # Antes de importar la app: sus módulos leen la configuración al importarse
+    documentos = os.path.join(directorio, "documents")
+    shutil.copytree(os.path.join(RAIZ, "documents"), documentos)
+    valores = {
+        "OPENAI_API_KEY": "sk-falsa",
+        "MODEL": "modelo-falso",
+        # Sin límites de OpenAI salvo que se pidan: se mide el backend, no el cubo de tokens
+        "OPENAI_RPM": "1000000",
+        "OPENAI_TPM": "1000000000",
+        "OPENAI_MAX_CONCURRENT": "1000",
+        "OPENAI_MAX_CONCURRENT_POR_USUARIO": "1000",
+        "DOCUMENTS_DIR": documentos,
+        "INDICE_DOCUMENTOS_PATH": os.path.join(directorio, "indice_documentos.json"),
+        "ALMACEN_INDICE_PATH": os.path.join(directorio, "almacen_documentos.json"),
+        "REFERENCIA_CACHE_PATH": os.path.join(directorio, "referencia_cache.json"),
+        "TRABAJOS_DIR": os.path.join(directorio, "trabajos"),
+        "SESSION_SQLITE_PATH": os.path.join(directorio, "sesiones.sqlite3"),
+    }
+    for clave, valor in valores.items():
+        os.environ.setdefault(clave, valor)
+
+
+def cargar_app(postgres):
+    # El pool real, con el Postgres falso como fábrica de conexiones
+    import api.db
+    api.db.db_pool = api.db.PoolConexiones(factory=postgres.conectar)
+    import falsos
+    import api.escritura_diferida
+    api.escritura_diferida.execute_values = falsos.execute_values
+    from app import app
+    return app
+
+
+class Carga:
+    def __init__(self, app, usuarios, pdfs):
+        self.app = app
+        self.usuarios = usuarios
+        self.pdfs = pdfs
+        self._local = threading.local()
+        self._contador = 0
+        self._lock = threading.Lock()
+
+    def _cliente(self):
+        if not hasattr(self._local, "cliente"):
+            self._local.cliente = self.app.test_client()
+        return self._local.cliente
+
+    def _siguiente(self):
+        with self._lock:
+            self._contador += 1
+            return self._contador
+
+    def ping(self, usuario, i):
+        r = self._cliente().post("/api/chat", data={"user_id": usuario, "message": "__ping__"})
+        return r.status_code, None
+
+    def texto(self, usuario, i):
+        r = self._cliente().post("/api/chat", data={"user_id": usuario, "message": PREGUNTAS[i % len(PREGUNTAS)]})
+        return r.status_code, None
+
+    def stream(self, usuario, i):
+        inicio = time.perf_counter()
+        r = self._cliente().post("/api/chat/stream", data={"user_id": usuario, "message": PREGUNTAS[i % len(PREGUNTAS)]},
+                                 buffered=False)
+        primer_byte = None
+        for fragmento in r.response:
+            if primer_byte is None and fragmento:
+                primer_byte = time.perf_counter() - inicio
+        r.close()
+        return r.status_code, primer_byte
+
+    def historial(self, usuario, i):
+        r = self._cliente().get(f"/api/historial/{usuario}?limite=20")
+        return r.status_code, None
+
+    def pdf(self, usuario, i):
+        # Propuestas generadas desde la plantilla; con menos variantes que peticiones se repiten (caché)
+        datos = self.pdfs[i % len(self.pdfs)]
+        r = self._cliente().post(
+            "/api/chat",
+            data={"user_id": usuario, "pdf": (io.BytesIO(datos), "propuesta.pdf")},
+            content_type="multipart/form-data",
+        )
+        return r.status_code, None
+
+    def upload(self, usuario, i):
+        n = self._siguiente()
+        contenido = f"Documento de prueba {n}. Convocatoria INNOVUG, requisitos y fechas de entrega.\n".encode() * 50
+        r = self._cliente().post(
+            "/api/upload",
+            data={"file": (io.BytesIO(contenido), f"bench_{n}.txt")},
+            content_type="multipart/form-data",
+        )
+        return r.status_code, None
+
+    def ejecutar(self, escenario, peticiones, concurrencia):
+        funcion = getattr(self, escenario)
+        latencias, primeros, errores = [], [], 0
+
+        def una(i):
+            inicio = time.perf_counter()
+            try:
+                status, primer_byte = funcion(self.usuarios[i % len(self.usuarios)], i)
+            except Exception:
+                status, primer_byte = 599, None
+            return time.perf_counter() - inicio, status, primer_byte
+
+        inicio = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrencia) as ejecutor:
+            for duracion, status, primer_byte in ejecutor.map(una, range(peticiones)):
+                latencias.append(duracion)
+                if primer_byte is not None:
+                    primeros.append(primer_byte)
+                if status >= 400 and status != 404:
+                    errores += 1
+        total = time.perf_counter() - inicio
+        resultado = {
+            "escenario": escenario,
+            "peticiones": peticiones,
+            "concurrencia": concurrencia,
+            "errores": errores,
+            "segundos": round(total, 3),
+            "rps": round(peticiones / total, 2) if total else 0.0,
+            "p50_ms": round(percentil(latencias, 50) * 1000, 1),
+            "p95_ms": round(percentil(latencias, 95) * 1000, 1),
+            "p99_ms": round(percentil(latencias, 99) * 1000, 1),
+        }
+        if primeros:
+            resultado["primer_byte_p50_ms"] = round(percentil(primeros, 50) * 1000, 1)
+            resultado["primer_byte_p95_ms"] = round(percentil(primeros, 95) * 1000, 1)
+        return resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prueba de carga con OpenAI y Postgres falsos")
+    parser.add_argument("--escenarios", default=",".join(ESCENARIOS), help=f"lista separada por comas de {ESCENARIOS}")
+    parser.add_argument("--concurrencia", type=int, default=16)
+    parser.add_argument("--peticiones", type=int, default=200, help="peticiones por escenario")
+    parser.add_argument("--usuarios", type=int, default=50)
+    parser.add_argument("--historial-previo", type=int, default=60, help="mensajes sembrados por usuario")
+    parser.add_argument("--latencia-openai", type=float, default=800, help="ms por llamada (±20%%)")
+    parser.add_argument("--latencia-token", type=float, default=20, help="ms entre fragmentos en streaming")
+    parser.add_argument("--palabras", type=int, default=120, help="palabras de cada respuesta de texto")
+    parser.add_argument("--errores-openai", type=float, default=0.0, help="fracción de llamadas con 429 simulado")
+    parser.add_argument("--pdf-variantes", type=int, default=0,
+                        help="propuestas distintas en el escenario pdf (0 = una por petición, sin aciertos de caché)")
+    parser.add_argument("--latencia-db", type=float, default=0.0, help="ms añadidos a cada consulta (red simulada)")
+    parser.add_argument("--json", help="guardar los resultados en este archivo")
+    args = parser.parse_args()
+
+    escenarios = [e.strip() for e in args.escenarios.split(",") if e.strip()]
+    desconocidos = set(escenarios) - set(ESCENARIOS)
+    if desconocidos:
+        parser.error(f"escenarios desconocidos: {', '.join(sorted(desconocidos))}")
+
+    directorio = tempfile.mkdtemp(prefix="carga_chatbot_")
+    preparar_entorno(directorio)
+    from falsos import OpenAIFalso, PostgresFalso, pdf_propuesta
+
+    postgres = PostgresFalso(os.path.join(directorio, "postgres.sqlite3"), latencia_ms=args.latencia_db)
+    usuarios = [f"bench_{i}" for i in range(args.usuarios)]
+    postgres.sembrar(usuarios, args.historial_previo)
+    openai_falso = OpenAIFalso(args.latencia_openai, args.latencia_token, args.palabras, args.errores_openai)
+    openai_falso.instalar()
+
+    app = cargar_app(postgres)
+    import api.db
+    from api.recuperacion import indice_documentos
+    indice_documentos.sincronizar()
+    from api.extraccion_pdf import extractor_pdf
+    plantilla = extractor_pdf.extraer_paginas(os.path.join(RAIZ, "documents", "doc_003.pdf"))
+    pdfs = [pdf_propuesta(plantilla, semilla) for semilla in range(args.pdf_variantes or args.peticiones)] \
+        if "pdf" in escenarios else []
+
+    # /api/upload guarda en documents/ relativo al directorio actual
+    origen = os.getcwd()
+    ruta_json = os.path.abspath(args.json) if args.json else None
+    os.chdir(directorio)
+    carga = Carga(app, usuarios, pdfs)
+    resultados = []
+    try:
+        print(f"{'escenario':>10} {'n':>6} {'conc':>5} {'err':>5} {'rps':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} "
+              f"{'conexiones':>10} {'consultas':>10}")
+        for escenario in escenarios:
+            antes = postgres.estadisticas()
+            resultado = carga.ejecutar(escenario, args.peticiones, args.concurrencia)
+            despues = postgres.estadisticas()
+            resultado["conexiones_creadas"] = despues["creadas"] - antes["creadas"]
+            resultado["consultas_db"] = despues["consultas"] - antes["consultas"]
+            resultados.append(resultado)
+            print(f"{escenario:>10} {resultado['peticiones']:>6} {resultado['concurrencia']:>5} {resultado['errores']:>5} "
+                  f"{resultado['rps']:>8.1f} {resultado['p50_ms']:>9.1f} {resultado['p95_ms']:>9.1f} {resultado['p99_ms']:>9.1f} "
+                  f"{resultado['conexiones_creadas']:>10} {resultado['consultas_db']:>10}")
+            if "primer_byte_p50_ms" in resultado:
+                print(f"{'':>10} primer byte p50 {resultado['primer_byte_p50_ms']:.1f} ms, p95 {resultado['primer_byte_p95_ms']:.1f} ms")
+    finally:
+        openai_falso.desinstalar()
+        os.chdir(origen)
+
+    resumen = {
+        "escenarios": resultados,
+        "pool": api.db.db_pool.estadisticas(),
+        "postgres_falso": postgres.estadisticas(),
+        "openai_falso": openai_falso.estadisticas(),
+    }
+    print(f"\nPool: {json.dumps(resumen['pool'])}")
+    print(f"Postgres falso: {json.dumps(resumen['postgres_falso'])}")
+    print(f"OpenAI falso: {json.dumps(resumen['openai_falso'])}")
+    if ruta_json:
+        with open(ruta_json, "w", encoding="utf-8") as f:
+            json.dump(resumen, f, indent=2, ensure_ascii=False)
+    shutil.rmtree(directorio, ignore_errors=True)
+    # Hilos de fondo (historial diferido, resúmenes, trabajos) no deben retener el proceso
+    sys.stdout.flush()
+    os._exit(0)
+
+
+if __name__ == "__main__":
+    main()
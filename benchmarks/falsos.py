@@ -0,0 +1,385 @@
+"""Dobles locales de OpenAI y Postgres para medir el backend sin red ni credenciales.
+
+OpenAIFalso reemplaza openai.ChatCompletion.create y acreate con latencia configurable (y streaming
+por fragmentos); PostgresFalso es un Postgres mínimo sobre un archivo SQLite que entiende
+las consultas del backend y cuenta las conexiones abiertas.
+"""
+import asyncio
+import json
+import random
+import re
+import sqlite3
+import textwrap
+import threading
+import time
+from datetime import datetime
+
+import openai
+from openai.openai_object import OpenAIObject
+from psycopg2.extras import Json
+
+# Las mismas respuestas sintéticas que bench_similitud, para que ambos generadores no se separen
+from bench_similitud import MARCADOR, VOCABULARIO
+
+ESQUEMA_SQLITE = """
+CREATE TABLE IF NOT EXISTS users (
+    identity TEXT PRIMARY KEY,
+    full_name TEXT
+);
+CREATE TABLE IF NOT EXISTS chat_history (
+    id INTEGER PRIMARY KEY,
+    user_identity TEXT REFERENCES users (identity) ON DELETE CASCADE,
+    role TEXT,
+    content TEXT,
+    timestamp TIMESTAMP
+);
+CREATE TABLE IF NOT EXISTS projects (
+    id_version INTEGER PRIMARY KEY,
+    user_identity TEXT REFERENCES users (identity) ON DELETE CASCADE,
+    nombre_del_negocio TEXT,
+    problema_y_solucion TEXT,
+    mercado TEXT,
+    competencia TEXT,
+    modelo_de_negocio TEXT,
+    escalabilidad TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE IF NOT EXISTS lider_proyecto (
+    id INTEGER PRIMARY KEY,
+    project_id_version INTEGER REFERENCES projects (id_version) ON DELETE CASCADE,
+    nombres TEXT,
+    apellidos TEXT,
+    cedula TEXT,
+    facultad TEXT,
+    carrera TEXT,
+    numero_telefono TEXT,
+    correo_electronico TEXT,
+    semestre_que_cursa TEXT
+);
+CREATE TABLE IF NOT EXISTS integrantes_equipo (
+    id INTEGER PRIMARY KEY,
+    project_id_version INTEGER REFERENCES projects (id_version) ON DELETE CASCADE,
+    nombres TEXT,
+    apellidos TEXT,
+    cedula TEXT,
+    rol TEXT,
+    funcion TEXT
+);
+CREATE TABLE IF NOT EXISTS evaluaciones (
+    id INTEGER PRIMARY KEY,
+    project_id_version INTEGER REFERENCES projects (id_version) ON DELETE CASCADE,
+    detalle TEXT,
+    promedio_evaluacion REAL,
+    hash_pdf TEXT,
+    proposal_status TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+"""
+
+# Postgres -> SQLite: placeholders, casts y funciones que usa el backend
+TRADUCCIONES = (
+    (re.compile(r"%s"), "?"),
+    (re.compile(r"::\w+"), ""),
+    (re.compile(r"\bNOW\(\)", re.IGNORECASE), "CURRENT_TIMESTAMP"),
+    # SQLite bloquea la base entera al escribir: LOCK TABLE no hace falta
+    (re.compile(r"^\s*LOCK TABLE .*$", re.IGNORECASE | re.DOTALL), "SELECT 1"),
+)
+
+sqlite3.register_adapter(datetime, lambda valor: valor.isoformat(" "))
+sqlite3.register_adapter(Json, lambda valor: json.dumps(valor.adapted))
+sqlite3.register_adapter(dict, json.dumps)
+sqlite3.register_converter("TIMESTAMP", lambda valor: datetime.fromisoformat(valor.decode()))
+
+
+def traducir(sql):
+    for patron, reemplazo in TRADUCCIONES:
+        sql = patron.sub(reemplazo, sql)
+    return sql
+
+
+class CursorFalso:
+    def __init__(self, conexion):
+        self._conexion = conexion
+        self._cursor = conexion.sqlite.cursor()
+
+    def _esperar(self):
+        if self._conexion.postgres.latencia:
+            time.sleep(self._conexion.postgres.latencia)
+        self._conexion.postgres.contar("consultas")
+
+    def execute(self, sql, parametros=()):
+        self._esperar()
+        self._cursor.execute(traducir(sql), tuple(parametros or ()))
+
+    def executemany(self, sql, filas):
+        self._esperar()
+        self._cursor.executemany(traducir(sql), [tuple(f) for f in filas])
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    def fetchmany(self, tamano=None):
+        return self._cursor.fetchmany(tamano or self._cursor.arraysize)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    def close(self):
+        self._cursor.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ConexionFalsa:
+    def __init__(self, postgres):
+        self.postgres = postgres
+        self.sqlite = sqlite3.connect(
+            postgres.ruta, timeout=30, check_same_thread=False, detect_types=sqlite3.PARSE_DECLTYPES
+        )
+        self.sqlite.execute("PRAGMA foreign_keys=ON")
+        self.closed = 0
+
+    def cursor(self):
+        return CursorFalso(self)
+
+    def commit(self):
+        self.sqlite.commit()
+
+    def rollback(self):
+        self.sqlite.rollback()
+
+    def close(self):
+        if not self.closed:
+            self.sqlite.close()
+            self.closed = 1
+            self.postgres.contar("cerradas", abiertas=-1)
+
+
+def execute_values(cur, sql, filas, template=None, page_size=100, fetch=False):
+    # Sustituto de psycopg2.extras.execute_values: un INSERT por fila dentro de la misma transacción
+    filas = [tuple(f) for f in filas]
+    if not filas:
+        return
+    marcadores = "(" + ", ".join("%s" for _ in filas[0]) + ")"
+    cur.executemany(sql.replace("VALUES %s", f"VALUES {marcadores}"), filas)
+
+
+class PostgresFalso:
+    def __init__(self, ruta, latencia_ms=0.0):
+        self.ruta = ruta
+        self.latencia = latencia_ms / 1000
+        self._lock = threading.Lock()
+        self._stats = {"abiertas": 0, "max_abiertas": 0, "creadas": 0, "cerradas": 0, "consultas": 0}
+        conn = sqlite3.connect(ruta)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(ESQUEMA_SQLITE)
+        conn.close()
+
+    def contar(self, clave, abiertas=0):
+        with self._lock:
+            self._stats[clave] += 1
+            self._stats["abiertas"] += abiertas
+            self._stats["max_abiertas"] = max(self._stats["max_abiertas"], self._stats["abiertas"])
+
+    def conectar(self):
+        conn = ConexionFalsa(self)
+        self.contar("creadas", abiertas=1)
+        return conn
+
+    def sembrar(self, usuarios, mensajes_por_usuario):
+        # Historial previo para los escenarios de lectura
+        conn = sqlite3.connect(self.ruta)
+        ahora = time.time()
+        conn.executemany("INSERT OR IGNORE INTO users (identity, full_name) VALUES (?, ?)",
+                         [(u, f"Usuario {i}") for i, u in enumerate(usuarios)])
+        conn.executemany(
+            "INSERT INTO chat_history (user_identity, role, content, timestamp) VALUES (?, ?, ?, ?)",
+            [
+                (u, "user" if j % 2 == 0 else "assistant", f"Mensaje {j} de {u}",
+                 datetime.fromtimestamp(ahora - (mensajes_por_usuario - j) * 60))
+                for u in usuarios
+                for j in range(mensajes_por_usuario)
+            ]
+        )
+        conn.commit()
+        conn.close()
+
+    def estadisticas(self):
+        with self._lock:
+            return dict(self._stats)
+
+
+class OpenAIFalso:
+    def __init__(self, latencia_ms=800, latencia_token_ms=20, palabras=120, tasa_errores=0.0, semilla=7):
+        self.latencia = latencia_ms / 1000
+        self.latencia_token = latencia_token_ms / 1000
+        self.palabras = palabras
+        self.tasa_errores = tasa_errores
+        self._random = random.Random(semilla)
+        self._lock = threading.Lock()
+        self._stats = {"llamadas": 0, "streams": 0, "errores": 0}
+        self._original = None
+
+    def instalar(self):
+        self._original = (openai.ChatCompletion.create, openai.ChatCompletion.acreate)
+        openai.ChatCompletion.create = self.create
+        openai.ChatCompletion.acreate = self.acreate
+
+    def desinstalar(self):
+        if self._original is not None:
+            openai.ChatCompletion.create, openai.ChatCompletion.acreate = self._original
+            self._original = None
+
+    def _sorteo(self, stream):
+        # (falla con 429, factor de latencia)
+        with self._lock:
+            self._stats["streams" if stream else "llamadas"] += 1
+            falla = self._random.random() < self.tasa_errores
+            if falla:
+                self._stats["errores"] += 1
+            return falla, self._random.uniform(0.8, 1.2)
+
+    def _contenido(self, messages):
+        sistema = messages[0]["content"] if messages else ""
+        usuario = messages[-1]["content"] if messages else ""
+        if "Devuelve un JSON" in sistema:
+            cedula = str(abs(hash(usuario)) % 10 ** 10).zfill(10)
+            return json.dumps({
+                "nombre_del_negocio": "Negocio de prueba", "problema_y_solucion": "Problema y solución",
+                "mercado": "Mercado", "competencia": "Competencia", "modelo_de_negocio": "Suscripción",
+                "escalabilidad": "Regional", "nombres": "Ana", "apellidos": "Pérez", "cedula": cedula,
+                "facultad": "Ingeniería", "carrera": "Software", "numero_de_telefono": "0999999999",
+                "correo_electronico": "ana@ug.edu.ec", "semestre_que_cursa": "5",
+                "equipo_integrantes": [
+                    {"nombres": "Luis", "apellidos": "Mora", "cedula": "0912345678", "rol": "CTO", "funcion": "Desarrollo"}
+                ],
+            })
+        if usuario.startswith("Texto extraído del PDF"):
+            return "Evaluación de la propuesta.\n\n**Promedio final = 8.5**"
+        if "Resumen actual" in usuario:
+            return "- El usuario hizo preguntas sobre INNOVUG."
+        return " ".join(f"palabra{i}" for i in range(self.palabras))
+
+    def _respuesta(self, model, messages, contenido):
+        prompt = sum(len(m.get("content") or "") // 4 for m in messages)
+        return OpenAIObject.construct_from({
+            "object": "chat.completion",
+            "model": model or "falso",
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": contenido}}],
+            "usage": {"prompt_tokens": prompt, "completion_tokens": len(contenido) // 4,
+                      "total_tokens": prompt + len(contenido) // 4},
+        })
+
+    def _fragmento(self, palabra):
+        return OpenAIObject.construct_from({
+            "object": "chat.completion.chunk",
+            "choices": [{"index": 0, "delta": {"content": palabra}, "finish_reason": None}],
+        })
+
+    def create(self, model=None, messages=None, stream=False, **parametros):
+        falla, jitter = self._sorteo(stream)
+        if falla:
+            time.sleep(self.latencia * jitter / 4)
+            raise openai.error.RateLimitError("Límite simulado", headers={"retry-after": "0.2"})
+        contenido = self._contenido(messages or [])
+        if stream:
+            return self._flujo(contenido, self.latencia * jitter)
+        time.sleep(self.latencia * jitter)
+        return self._respuesta(model, messages or [], contenido)
+
+    def _flujo(self, contenido, primer_fragmento):
+        time.sleep(primer_fragmento)
+        for palabra in re.findall(r"\S+\s*", contenido):
+            if self.latencia_token:
+                time.sleep(self.latencia_token)
+            yield self._fragmento(palabra)
+
+    async def acreate(self, model=None, messages=None, stream=False, **parametros):
+        # Igual que create sin bloquear el event loop (modo ASGI)
+        falla, jitter = self._sorteo(stream)
+        if falla:
+            await asyncio.sleep(self.latencia * jitter / 4)
+            raise openai.error.RateLimitError("Límite simulado", headers={"retry-after": "0.2"})
+        contenido = self._contenido(messages or [])
+        if stream:
+            return self._aflujo(contenido, self.latencia * jitter)
+        await asyncio.sleep(self.latencia * jitter)
+        return self._respuesta(model, messages or [], contenido)
+
+    async def _aflujo(self, contenido, primer_fragmento):
+        await asyncio.sleep(primer_fragmento)
+        for palabra in re.findall(r"\S+\s*", contenido):
+            if self.latencia_token:
+                await asyncio.sleep(self.latencia_token)
+            yield self._fragmento(palabra)
+
+    def estadisticas(self):
+        with self._lock:
+            return dict(self._stats)
+
+
+def _escapar_pdf(texto):
+    return texto.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def pdf_de_texto(paginas, lineas_por_pagina=48, ancho=95):
+    # PDF mínimo de texto (Helvetica, WinAnsi) que pdfplumber puede leer; sin dependencias
+    lineas = [
+        fragmento
+        for pagina in paginas
+        for linea in pagina.splitlines()
+        for fragmento in (textwrap.wrap(linea, ancho) or [""])
+    ]
+    bloques = [lineas[i:i + lineas_por_pagina] for i in range(0, len(lineas), lineas_por_pagina)] or [[]]
+    objetos = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+    ]
+    hojas = []
+    for bloque in bloques:
+        contenido = "BT /F1 10 Tf 14 TL 50 800 Td\n" + "".join(f"({_escapar_pdf(l)}) Tj T*\n" for l in bloque) + "ET"
+        contenido = contenido.encode("cp1252", errors="replace")
+        objetos.append(b"<< /Length %d >>\nstream\n" % len(contenido) + contenido + b"\nendstream")
+        objetos.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                       b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % len(objetos))
+        hojas.append(len(objetos))
+    objetos[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (
+        b" ".join(b"%d 0 R" % h for h in hojas), len(hojas))
+
+    salida = bytearray(b"%PDF-1.4\n")
+    posiciones = []
+    for numero, objeto in enumerate(objetos, start=1):
+        posiciones.append(len(salida))
+        salida += b"%d 0 obj\n" % numero + objeto + b"\nendobj\n"
+    xref = len(salida)
+    salida += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objetos) + 1)
+    salida += b"".join(b"%010d 00000 n \n" % p for p in posiciones)
+    salida += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objetos) + 1, xref)
+    return bytes(salida)
+
+
+def pdf_propuesta(paginas_plantilla, semilla, palabras_por_respuesta=60):
+    # Plantilla oficial con cada "[Reemplaza este texto...]" respondido con texto aleatorio
+    rnd = random.Random(semilla)
+    paginas = [
+        MARCADOR.sub(lambda _: " ".join(rnd.choice(VOCABULARIO) for _ in range(palabras_por_respuesta)), pagina)
+        for pagina in paginas_plantilla
+    ]
+    return pdf_de_texto(paginas)
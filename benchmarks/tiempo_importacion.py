@@ -0,0 +1,71 @@
+"""Mide cuánto tarda en importarse la app (arranque en frío de cada worker) contra un presupuesto.
+
+Uso:
+    python benchmarks/tiempo_importacion.py
+    python benchmarks/tiempo_importacion.py --presupuesto-ms 900 --repeticiones 5 --top 20
+
+Sale con código 1 si la mediana supera el presupuesto, para poder usarlo en CI.
+"""
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+RAIZ = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+LINEA = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+# Módulos que no deberían cargarse al importar la app (se importan al primer uso)
+PEREZOSOS = ("pandas", "pdfplumber", "docx", "openpyxl")
+
+
+def medir(modulo):
+    # Proceso nuevo en cada medición: sin módulos ya cargados ni .pyc en memoria
+    salida = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {modulo}"],
+        cwd=RAIZ, capture_output=True, text=True, env=dict(os.environ, PYTHONDONTWRITEBYTECODE="1")
+    )
+    if salida.returncode != 0:
+        raise RuntimeError(f"No se pudo importar {modulo}:\n{salida.stderr[-2000:]}")
+    modulos = []
+    for linea in salida.stderr.splitlines():
+        coincidencia = LINEA.match(linea)
+        if coincidencia:
+            propio, acumulado, sangria, nombre = coincidencia.groups()
+            modulos.append((nombre, int(propio) / 1000, int(acumulado) / 1000, len(sangria) // 2))
+    return modulos
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tiempo de importación de la app frente a un presupuesto")
+    parser.add_argument("--modulo", default="app")
+    parser.add_argument("--presupuesto-ms", type=float, default=float(os.getenv("IMPORT_BUDGET_MS", "1000")))
+    parser.add_argument("--repeticiones", type=int, default=3)
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    mediciones = [medir(args.modulo) for _ in range(args.repeticiones)]
+    totales = [next(acumulado for nombre, _, acumulado, nivel in m if nombre == args.modulo and nivel == 0)
+               for m in mediciones]
+    total = statistics.median(totales)
+    # Detalle de la medición más cercana a la mediana
+    detalle = min(mediciones, key=lambda m: abs(totales[mediciones.index(m)] - total))
+
+    print(f"{'módulo':<45} {'propio ms':>10} {'acumulado ms':>13}")
+    for nombre, propio, acumulado, nivel in sorted(detalle, key=lambda m: -m[2])[:args.top]:
+        print(f"{'  ' * min(nivel, 6) + nombre:<45} {propio:>10.1f} {acumulado:>13.1f}")
+
+    cargados = sorted({nombre.split(".")[0] for nombre, *_ in detalle} & set(PEREZOSOS))
+    if cargados:
+        print(f"\n⚠️ Se importan al arrancar módulos que deberían ser perezosos: {', '.join(cargados)}")
+
+    print(f"\nImportar {args.modulo}: mediana {total:.0f} ms en {args.repeticiones} procesos "
+          f"({', '.join(f'{t:.0f}' for t in totales)} ms); presupuesto {args.presupuesto_ms:.0f} ms")
+    if total > args.presupuesto_ms or cargados:
+        print("❌ Fuera de presupuesto")
+        sys.exit(1)
+    print("✅ Dentro del presupuesto")
+
+
+if __name__ == "__main__":
+    main()
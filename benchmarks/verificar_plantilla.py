@@ -0,0 +1,116 @@
+"""Comprueba el parser de la plantilla oficial con una ficha rellenada a partir de documents/doc_003.pdf.
+
+Uso: python benchmarks/verificar_plantilla.py
+
+Sale con código 1 si algún campo no coincide, para poder usarlo en CI.
+"""
+import os
+import sys
+import copy
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from api.extraccion_pdf import ExtractorPDF  # noqa: E402
+from api.plantilla import ParserPlantilla, normalizar_celda  # noqa: E402
+
+REFERENCE_PDF_PATH = os.path.join(os.path.dirname(__file__), "../documents/doc_003.pdf")
+
+LIDER = {
+    "Nombres:": "Ana Lucía",
+    "Apellidos:": "Mora Vera",
+    "Cédula:": "0912345678",
+    "Facultad:": "Ingeniería Industrial",
+    "Carrera:": "Software",
+    "Número de Teléfono:": "0991234567",
+    "Correo Electrónico:": "ana.mora@ug.edu.ec",
+    "Semestre que Cursa:": "Sexto",
+}
+
+ESPERADO = {
+    "nombres": "Ana Lucía",
+    "apellidos": "Mora Vera",
+    "cedula": "0912345678",
+    "facultad": "Ingeniería Industrial",
+    "carrera": "Software",
+    "numero_de_telefono": "0991234567",
+    "correo_electronico": "ana.mora@ug.edu.ec",
+    "semestre_que_cursa": "Sexto",
+    "nombre_del_negocio": "EcoRuta",
+    "problema_y_solucion": "respuesta 1\nrespuesta 2\nrespuesta 3\nrespuesta 4",
+    "mercado": "respuesta 5\nrespuesta 6\nrespuesta 7\nrespuesta 8",
+    "competencia": "respuesta 9\nrespuesta 10\nrespuesta 11\nrespuesta 12",
+    "modelo_de_negocio": "respuesta 13\nrespuesta 14\nrespuesta 15\nrespuesta 16",
+    "escalabilidad": "respuesta 17\nrespuesta 18\nrespuesta 19\nrespuesta 20",
+    "equipo_integrantes": [
+        {"nombres": "Ana Lucía", "apellidos": "Mora Vera", "cedula": "0912345678",
+         "rol": "Líder", "funcion": "Gestión del proyecto"},
+        # Fila que el salto de página partió entre dos tablas
+        {"nombres": "María José", "apellidos": "Pérez Gómez", "cedula": "0923456789",
+         "rol": "Diseñadora", "funcion": "Diseño de la marca"},
+    ],
+}
+
+
+def rellenar(tablas):
+    # La ficha como la entregaría un estudiante: líder, dos integrantes y cada "[Reemplaza...]" respondido
+    tablas = copy.deepcopy(tablas)
+    respuestas = iter(f"respuesta {i}" for i in range(1, 100))
+    integrantes = {
+        "nombres del lider": ["Ana Lucía", "Mora Vera", "0912345678", "Líder", "Gestión del proyecto"],
+        "nombres de": ["María", "Pérez", "0923456789", "Diseñadora", "Diseño de la marca"],
+        # Como en la plantilla, la continuación solo trae partes de nombres y apellidos
+        "integrante 1": ["José", "Gómez", "", "", ""],
+    }
+    for tabla in tablas:
+        for fila in tabla:
+            if fila[0] in LIDER:
+                fila[1] = LIDER[fila[0]]
+                continue
+            valores = integrantes.get(normalizar_celda(fila[1]))
+            if valores and len(fila) == 6:
+                fila[1:] = valores
+                continue
+            for i, celda in enumerate(fila):
+                if celda and celda.startswith("[Reemplaza este texto por el título"):
+                    fila[i] = "EcoRuta"
+                elif celda and celda.startswith("[Reemplaza"):
+                    fila[i] = next(respuestas)
+    return tablas
+
+
+def main():
+    extractor = ExtractorPDF(workers=0)
+    textos, tablas = extractor.extraer_texto_y_tablas(REFERENCE_PDF_PATH)
+    errores = []
+    if tablas != extractor.extraer_tablas(REFERENCE_PDF_PATH):
+        errores.append("extraer_texto_y_tablas no devuelve las mismas tablas que extraer_tablas")
+    if textos != extractor.extraer_paginas(REFERENCE_PDF_PATH):
+        errores.append("extraer_texto_y_tablas no devuelve el mismo texto que extraer_paginas")
+    # En el pool, repartido en rangos de una página, el resultado debe ser el mismo
+    por_rangos = ExtractorPDF(workers=2, paginas_por_tarea=1)
+    if por_rangos.extraer_texto_y_tablas(REFERENCE_PDF_PATH) != (textos, tablas):
+        errores.append("extraer_texto_y_tablas por rangos de páginas no coincide con la lectura completa")
+    por_rangos.cerrar()
+
+    parser = ParserPlantilla(tablas)
+    # La plantilla vacía se reconoce, pero sin datos del líder (el chat la manda al LLM)
+    vacia = parser.analizar(tablas)
+    if vacia and any(vacia[campo] for campo in ("nombres", "apellidos", "cedula")):
+        errores.append(f"la plantilla vacía no debería tener datos del líder: {vacia}")
+
+    datos = parser.analizar(rellenar(tablas))
+    if datos is None:
+        errores.append("la ficha rellenada no se reconoció como propuesta")
+    else:
+        for campo, esperado in ESPERADO.items():
+            if datos.get(campo) != esperado:
+                errores.append(f"{campo}: se esperaba {esperado!r} y se obtuvo {datos.get(campo)!r}")
+
+    for error in errores:
+        print(f"❌ {error}")
+    if errores:
+        sys.exit(1)
+    print(f"✅ Parser de la plantilla: {len(ESPERADO)} campos correctos")
+
+
+if __name__ == "__main__":
+    main()
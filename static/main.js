@@ -3,6 +3,19 @@ const API_BASE = window.location.hostname.includes("localhost") || window.locati
   ? "http://127.0.0.1:5000"
   : "https://chatbot-backend-nqls.onrender.com";
 
+// 🗂️ Cómo se evalúan los PDF: "trabajo" (segundo plano, se consulta por job_id) o "directo" (misma petición).
+// Se elige con ?modo_pdf=... y se recuerda; sin elección decide el servidor (PDF_JOB_MODE)
+const MODO_PDF = (() => {
+  const elegido = new URLSearchParams(window.location.search).get("modo_pdf");
+  if (elegido === "trabajo" || elegido === "directo") localStorage.setItem("modo_pdf", elegido);
+  return localStorage.getItem("modo_pdf");
+})();
+
+// ⏳ Consulta de trabajos: de 2 s hasta 15 s entre intentos, y como mucho 10 minutos en total
+const TRABAJO_INTERVALO_INICIAL = 2000;
+const TRABAJO_INTERVALO_MAX = 15000;
+const TRABAJO_ESPERA_MAX = 10 * 60 * 1000;
+
 
 let userId = null;
 let temporizadorSesionId = null;
@@ -393,7 +406,10 @@ async function enviarMensaje(message, file = null) {
   formData.append("message", message);
   formData.append("user_id", userId);
   formData.append("manual_input", (!!message).toString());
-  if (file) formData.append("pdf", file);
+  if (file) {
+    formData.append("pdf", file);
+    if (MODO_PDF) formData.append("modo", MODO_PDF);
+  }
 
   const escribiendo = document.createElement("div");
   escribiendo.className = "mensaje-bot fade-in";
@@ -438,6 +454,11 @@ async function enviarMensaje(message, file = null) {
 
     // 🧠 Procesamiento normal de otros mensajes
     addMessage(`INNOVUG: ${marked.parse(data.response)}`, "mensaje-bot", true);
+
+    if (data.job_id) {
+      esperarTrabajo(data.job_id);
+      return;
+    }
     botAudio.play();
 
     // Detectar nombre en respuesta si aplica
@@ -454,6 +475,107 @@ async function enviarMensaje(message, file = null) {
   }
 }
 
+// ⏳ Consulta periódicamente el estado de una evaluación en segundo plano
+async function esperarTrabajo(jobId) {
+  const escribiendo = document.createElement("div");
+  escribiendo.className = "mensaje-bot fade-in";
+  escribiendo.id = "escribiendo";
+  escribiendo.innerHTML = `
+    <div class="typing-indicator">
+      <span></span><span></span><span></span>
+    </div>
+  `;
+  chatOutput.appendChild(escribiendo);
+  requestAnimationFrame(() => {
+  scrollChatToBottom();
+  });
+
+  const limite = Date.now() + TRABAJO_ESPERA_MAX;
+  let intervalo = TRABAJO_INTERVALO_INICIAL;
+
+  while (Date.now() + intervalo < limite) {
+    await new Promise(resolve => setTimeout(resolve, intervalo));
+    intervalo = Math.min(intervalo * 1.5, TRABAJO_INTERVALO_MAX);
+
+    let response, data;
+    try {
+      response = await fetch(`${API_BASE}/api/trabajos/${jobId}`);
+      data = await response.json();
+    } catch (err) {
+      // Red caída, worker reiniciándose (5xx de la plataforma) o respuesta que no es JSON: se reintenta
+      continue;
+    }
+
+    if (data.status === "terminado") {
+      document.getElementById("escribiendo")?.remove();
+      addMessage(`INNOVUG: ${marked.parse(data.response)}`, "mensaje-bot", true);
+      botAudio.play();
+      return;
+    }
+    if (data.status === "error" || response.status === 404) {
+      document.getElementById("escribiendo")?.remove();
+      addMessage(`INNOVUG: ${marked.parse(data.error || data.response || "❌ No se encontró la evaluación.")}`, "mensaje-bot", true);
+      return;
+    }
+  }
+
+  document.getElementById("escribiendo")?.remove();
+  addMessage(
+    "INNOVUG: ⏳ La evaluación está tardando más de lo esperado. Vuelve a enviar el PDF en unos minutos; " +
+    "si ya terminó, la respuesta se entrega al instante.",
+    "mensaje-bot"
+  );
+}
+
+// 📜 Historial anterior por páginas: se carga al llegar al inicio del chat
+let historialCursor = null;
+let historialAgotado = false;
+let historialCargando = false;
+
+async function cargarHistorialAnterior(limite = 20) {
+  if (!userId || historialAgotado || historialCargando) return;
+  historialCargando = true;
+
+  try {
+    const params = new URLSearchParams({ limite: limite.toString() });
+    if (historialCursor) params.append("antes", historialCursor);
+    const response = await fetch(`${API_BASE}/api/historial/${encodeURIComponent(userId)}?${params}`);
+    if (!response.ok) return;
+    const data = await response.json();
+
+    // Las páginas llegan de la más reciente a la más antigua: se insertan arriba conservando la posición
+    const alturaPrevia = chatOutput.scrollHeight;
+    data.mensajes.forEach(mensaje => {
+      if (mensaje.role !== "user" && mensaje.role !== "assistant") return;
+      const div = document.createElement("div");
+      div.className = mensaje.role === "user" ? "mensaje-usuario" : "mensaje-bot";
+      const hora = new Date(mensaje.timestamp).toLocaleTimeString([], { hour: '2-digit', minute: '2-digit' });
+      if (mensaje.role === "user") {
+        div.textContent = `Tú: ${mensaje.content}`;
+      } else {
+        div.innerHTML = `INNOVUG: ${marked.parse(mensaje.content)}`;
+      }
+      const span = document.createElement("span");
+      span.className = "timestamp";
+      span.textContent = hora;
+      div.appendChild(span);
+      chatOutput.insertBefore(div, chatOutput.firstChild);
+    });
+    chatOutput.scrollTop = chatOutput.scrollHeight - alturaPrevia;
+
+    historialCursor = data.siguiente;
+    historialAgotado = !data.siguiente;
+  } catch (err) {
+    console.error("Error cargando historial:", err);
+  } finally {
+    historialCargando = false;
+  }
+}
+
+chatOutput.addEventListener("scroll", () => {
+  if (chatOutput.scrollTop === 0) cargarHistorialAnterior();
+});
+
 function addMessage(text, clase, isHtml = false) {
   const div = document.createElement("div");
   div.className = clase + " fade-in";